@@ -1,6 +1,9 @@
 import os
+import time
 import uvicorn
+from fastapi import Request, Response
 from google.adk.cli.fast_api import get_fast_api_app
+from queueflow_device_manager.metrics import REGISTRY, CONTENT_TYPE, Histogram, Counter
 
 app = get_fast_api_app(
     agents_dir=os.path.dirname(os.path.abspath(__file__)),
@@ -14,6 +17,29 @@ app = get_fast_api_app(
 async def log_message():
     return {"message": "Logging endpoint"}
 
+# Metrics of the agent API, served at /metrics
+http_request_duration = Histogram("agent_http_request_duration_seconds", "Latency of agent API requests.", ["method", "route"])
+http_requests = Counter("agent_http_requests_total", "Agent API requests by response status.", ["method", "route", "status"])
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # label by the route template, not the path, so session IDs do not make a label each
+        route = request.scope.get("route")
+        route = getattr(route, "path", "unmatched")
+        http_request_duration.observe(time.perf_counter() - started, method=request.method, route=route)
+        http_requests.inc(method=request.method, route=route, status=status)
+
+@app.get("/metrics")
+async def metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=9091)
 
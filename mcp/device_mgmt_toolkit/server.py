@@ -1,11 +1,20 @@
 import os
+import json
+import base64
+import re
+import time
 import asyncio
 import ast
 import sys
 from dotenv import load_dotenv
-from typing import Any, List, Dict, TypedDict, Optional
+from typing import Any, List, Dict, TypedDict, Optional, Iterable, AsyncIterator
 import httpx
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import FastMCP, Context
+# metrics are shared by the MCP servers and the agent, imported from the package at the repository root
+repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if repo_dir not in sys.path:
+    sys.path.append(repo_dir)
+from queueflow_device_manager.metrics import Histogram, Counter, instrument_mcp
 
 
 class DeviceInfo(TypedDict):
@@ -24,6 +33,8 @@ class OperationResult(TypedDict):
 
 # Initialize FastMCP server
 mcp = FastMCP("Device Management Toolkit", host="localhost", port=6970)
+# tool call latency and errors, served at /metrics with the DMT API metrics
+instrument_mcp(mcp)
 
 # Constants
 DMT_API_BASE = "http://localhost:8181/api/v1"
@@ -33,8 +44,85 @@ load_dotenv()
 DMT_username = os.getenv("DMT_username")
 DMT_password = os.getenv("DMT_password")
 
+# Connection pool of the shared DMT client
+DMT_max_connections = int(os.getenv("DMT_max_connections", 100))
+DMT_max_keepalive_connections = int(os.getenv("DMT_max_keepalive_connections", 20))
+DMT_keepalive_expiry = float(os.getenv("DMT_keepalive_expiry", 30)) # in seconds
+DMT_http2 = os.getenv("DMT_http2", "false").lower() == "true"
+DMT_token_refresh_margin = float(os.getenv("DMT_token_refresh_margin", 60)) # refresh JWT token this long before it expire, in seconds
+
+# Device discovery
+DMT_discovery_concurrency = int(os.getenv("DMT_discovery_concurrency", DMT_max_connections)) # max concurrent per-device lookups
+DMT_discovery_timeout = float(os.getenv("DMT_discovery_timeout", 10)) # per-device lookup deadline, in seconds
+
+# Power actions
+DMT_power_concurrency = int(os.getenv("DMT_power_concurrency", 10)) # max concurrent power actions
+DMT_power_timeout = float(os.getenv("DMT_power_timeout", 30)) # per-device power action deadline, in seconds
+
+# Device inventory cache
+DMT_pwr_status_ttl = float(os.getenv("DMT_pwr_status_ttl", 30)) # in seconds
+DMT_ip_addr_ttl = float(os.getenv("DMT_ip_addr_ttl", 600)) # in seconds
+DMT_refresh_interval = float(os.getenv("DMT_refresh_interval", 10)) # background refresh period, in seconds
+
+# Metrics of the DMT API requests, served at /metrics
+dmt_request_duration = Histogram("dmt_request_duration_seconds", "Latency of Intel DMT API requests.", ["method", "endpoint"])
+dmt_request_errors = Counter("dmt_request_errors_total", "Failed Intel DMT API requests.", ["method", "endpoint", "reason"])
+GUID_PATTERN = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+
 global token
 global all_device
+token = None
+token_expiry = None # expiry of the token in epoch seconds, None if unknown
+token_refresh = None # in-flight token refresh, shared by all callers
+global discovery_time
+global device_updated_at
+global dmt_client
+discovery_time = None
+device_updated_at = {} # time.monotonic() of the last update of each cached field, keyed by device ID and field name
+dmt_client = None
+dmt_client_loop = None
+
+async def get_client() -> httpx.AsyncClient:
+    """
+    Get the process-wide Intel® DMT client. The client is created once and keeps a pool of keep-alive
+    connections, so DMT calls after the first one skip the TCP/TLS handshake.
+    A new client is created if the client was created on another event loop, e.g. by a previous asyncio.run().
+
+    Returns:
+        httpx.AsyncClient: Shared DMT client.
+    """
+    global dmt_client, dmt_client_loop
+    loop = asyncio.get_running_loop()
+    if (dmt_client is None) or dmt_client.is_closed or (dmt_client_loop is not loop):
+        http2 = DMT_http2
+        if http2:
+            try:
+                import h2 # noqa: F401
+            except ImportError:
+                print("HTTP/2 requires the 'h2' package (pip install httpx[http2]). Fall back to HTTP/1.1.", flush=True)
+                http2 = False
+        dmt_client = httpx.AsyncClient(
+            headers={
+                "User-Agent": USER_AGENT,
+                "Accept": "application/json"
+            },
+            limits=httpx.Limits(
+                max_connections=DMT_max_connections,
+                max_keepalive_connections=DMT_max_keepalive_connections,
+                keepalive_expiry=DMT_keepalive_expiry
+            ),
+            http2=http2,
+            timeout=30.0
+        )
+        dmt_client_loop = loop
+    return dmt_client
+
+async def close_client():
+    global dmt_client, dmt_client_loop
+    if dmt_client is not None:
+        await dmt_client.aclose()
+    dmt_client = None
+    dmt_client_loop = None
 
 async def get_token(username: str, password: str) -> str | None:
     """
@@ -54,52 +142,105 @@ async def get_token(username: str, password: str) -> str | None:
         "User-Agent": USER_AGENT,
         "Accept": "application/json"
     }
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(url, json=payload, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            data = response.json()
-            return data["token"]
-        except Exception:
-            return None
+    client = await get_client()
+    started = time.perf_counter()
+    try:
+        response = await client.post(url, json=payload, headers=headers, timeout=30.0)
+        response.raise_for_status()
+        data = response.json()
+        return data["token"]
+    except Exception as e:
+        dmt_request_errors.inc(method="POST", endpoint="/authorize", reason=error_reason(e))
+        return None
+    finally:
+        dmt_request_duration.observe(time.perf_counter() - started, method="POST", endpoint="/authorize")
+
+def decode_token_expiry(jwt: str) -> float | None:
+    """Read the expiry ("exp" claim, in epoch seconds) of a JWT token without verifying it."""
+    try:
+        payload = jwt.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+async def refresh_token():
+    global token, token_expiry
+    new_token = await get_token(DMT_username, DMT_password) # type: ignore
+    if new_token:
+        token, token_expiry = new_token, decode_token_expiry(new_token)
+    # keep the current token if it has not expired yet, a failed refresh is retried on next request
+    elif (token_expiry is None) or (token_expiry <= time.time()):
+        token, token_expiry = None, None
 
 async def authorize():
-    global token
-    token = await get_token(DMT_username, DMT_password) # type: ignore
+    """Fetch a new JWT token. Concurrent callers share a single /authorize request."""
+    global token_refresh
+    loop = asyncio.get_running_loop()
+    if (token_refresh is None) or token_refresh.done() or (token_refresh.get_loop() is not loop):
+        token_refresh = loop.create_task(refresh_token())
+    await asyncio.shield(token_refresh)
+
+async def get_valid_token() -> str | None:
+    """Get the current JWT token, refresh it first if missing or expiring within DMT_token_refresh_margin seconds."""
+    if (token is None) or ((token_expiry is not None) and (token_expiry - time.time() <= DMT_token_refresh_margin)):
+        await authorize()
+    return token
+
+async def reauthorize(rejected_token: str | None):
+    """
+    Re-authorize after the DMT API rejected rejected_token (HTTP 401).
+    Requests rejected with the same token share one re-authorization, requests rejected with an already replaced token just retry.
+    """
+    if token == rejected_token:
+        await authorize()
 
 
-async def make_dmt_get_request(url: str) -> dict[str, Any] | None:
-    """Make a GET request to the Intel® DMT API with proper error handling."""
-    global token
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Accept": "application/json",
-        "Authorization": f"Bearer {token}"
-    }
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url, headers=headers, timeout=30.0)
+def endpoint_name(url: str) -> str:
+    """Path of a DMT API URL below DMT_API_BASE with device GUIDs replaced, so each endpoint is one metric label, e.g. "/amt/power/state/{guid}"."""
+    path = httpx.URL(url).path.removeprefix(httpx.URL(DMT_API_BASE).path)
+    return GUID_PATTERN.sub("{guid}", path)
+
+def error_reason(e: Exception) -> str:
+    """HTTP status code of a rejected request, else the exception type."""
+    return str(e.response.status_code) if isinstance(e, httpx.HTTPStatusError) else type(e).__name__
+
+async def make_dmt_request(method: str, url: str, json: dict[str, Any] | None = None) -> dict[str, Any] | None:
+    """Make a request to the Intel® DMT API with proper error handling. Retry once with a new token if the token is rejected."""
+    client = await get_client()
+    endpoint = endpoint_name(url)
+    started = time.perf_counter()
+    try:
+        for attempt in range(2):
+            request_token = await get_valid_token()
+            headers = {
+                "User-Agent": USER_AGENT,
+                "Accept": "application/json",
+                "Authorization": f"Bearer {request_token}"
+            }
+            response = await client.request(method, url, json=json, headers=headers, timeout=30.0)
+            if (response.status_code == 401) and (attempt == 0):
+                await reauthorize(request_token)
+                continue
             response.raise_for_status()
             return response.json()
-        except Exception as e:
-            return {"Exception": e}
+    except asyncio.CancelledError:
+        # cancelled by the caller deadline
+        dmt_request_errors.inc(method=method, endpoint=endpoint, reason="Cancelled")
+        raise
+    except Exception as e:
+        dmt_request_errors.inc(method=method, endpoint=endpoint, reason=error_reason(e))
+        return {"Exception": e}
+    finally:
+        dmt_request_duration.observe(time.perf_counter() - started, method=method, endpoint=endpoint)
+
+async def make_dmt_get_request(url: str) -> dict[str, Any] | None:
+    """Make a GET request to the Intel® DMT API with proper error handling."""
+    return await make_dmt_request("GET", url)
 
 async def make_dmt_post_request(url: str, json: dict[str, Any]) -> dict[str, Any] | None:
     """Make a POST request to the Intel® DMT API with proper error handling."""
-    global token
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Accept": "application/json",
-        "Authorization": f"Bearer {token}"
-    }
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(url, json=json, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            return {"Exception": e}
-
+    return await make_dmt_request("POST", url, json=json)
 
 async def get_power_state(guid: str) -> str:
     """ 
@@ -146,6 +287,16 @@ async def get_ip(guid: str) -> str:
     else:
         return data["wireless"]["ipAddress"] # type: ignore
 
+async def lookup_device_field(coro, what: str, semaphore: asyncio.Semaphore) -> str:
+    """Await a per-device lookup within DMT_discovery_timeout. Return an error message instead of raising if the lookup fails."""
+    async with semaphore:
+        try:
+            return await asyncio.wait_for(coro, timeout=DMT_discovery_timeout)
+        except asyncio.TimeoutError:
+            return f"Unable to get {what} of device. Exception: Timed out after {DMT_discovery_timeout} seconds."
+        except Exception as e:
+            return f"Unable to get {what} of device. Exception: {e}"
+
 async def discover_device() -> Dict[str, DeviceInfo] | str:
     """
     Discover all connected devices in the network.
@@ -178,14 +329,22 @@ async def discover_device() -> Dict[str, DeviceInfo] | str:
     if isinstance(data, list) and len(data) < 1:
         return "No device."
 
-    devices = {}
+    # look up IP address and power state of all devices concurrently. A slow or failed lookup only affects its own field.
+    semaphore = asyncio.Semaphore(DMT_discovery_concurrency)
+    lookups = []
     for item in data: # type: ignore
+        lookups.append(lookup_device_field(get_ip(item["guid"]), "IP address", semaphore)) # type: ignore
+        lookups.append(lookup_device_field(get_power_state(item["guid"]), "power state", semaphore)) # type: ignore
+    results = await asyncio.gather(*lookups)
+
+    devices = {}
+    for i, item in enumerate(data): # type: ignore
         device: DeviceInfo = {
             "guid": item["guid"], # type: ignore
             "dev_id": item["friendlyName"], # type: ignore
             "hostname": item["hostname"], # type: ignore
-            "ip_addr": await get_ip(item["guid"]), # type: ignore
-            "pwr_status": await get_power_state(item["guid"]) # type: ignore
+            "ip_addr": results[2 * i],
+            "pwr_status": results[2 * i + 1]
         }
         devices[item["friendlyName"]] = device # type: ignore
 
@@ -193,16 +352,176 @@ async def discover_device() -> Dict[str, DeviceInfo] | str:
 
 async def get_all_device():
     global all_device
+    global discovery_time
+    start = time.perf_counter()
     all_device = await discover_device()
+    discovery_time = time.perf_counter() - start
+    count = len(all_device) if isinstance(all_device, dict) else 0
+    print(f"Discovered {count} devices in {discovery_time:.3f} seconds.", flush=True)
+
+    global device_updated_at
+    now = time.monotonic()
+    device_updated_at = {dev_id: {"ip_addr": now, "pwr_status": now} for dev_id in all_device} if isinstance(all_device, dict) else {}
+
+POWER_ON = 2 # corresponding to ACPI state G0 or S0 or D0
+POWER_OFF = 8 # corresponding to ACPI state G2, S5, or D3
+power_action_name = {POWER_ON: "on", POWER_OFF: "off"}
+
+async def power_action(dev_id: str, action: int) -> OperationResult:
+    """
+    Perform power action on a device, and update its power status if succeed.
+
+    Args:
+        dev_id (str): Device ID.
+        action (int): Power action, 2 = power on, 8 = power off.
+
+    Returns:
+        OperationResult: Operation result of the device.
+    """
+    global all_device
+    name = power_action_name[action]
+    if dev_id not in all_device: # type: ignore
+        return OperationResult(guid="", dev_id=dev_id, success=False, message="Device not found.")
+
+    guid = all_device[dev_id]["guid"] # type: ignore
+    url = f"{DMT_API_BASE}/amt/power/action/{guid}"
+    payload = {
+        "action": action,
+        "useSOL": "false"
+    }
+    try:
+        data = await asyncio.wait_for(make_dmt_post_request(url, json=payload), timeout=DMT_power_timeout)
+    except asyncio.TimeoutError:
+        data = {"Exception": f"Timed out after {DMT_power_timeout} seconds."}
+
+    if data.get("Exception"): # type: ignore
+        message = f"Unable to power {name} the device. Exception: {data['Exception']}" # type: ignore
+    elif data.get("ReturnValue") is None: # type: ignore
+        message = f"Unable to power {name} the device."
+    elif data["ReturnValue"] != 0: # type: ignore
+        message = f"Power {name} failed."
+    else:
+        all_device[dev_id]["pwr_status"] = name # type: ignore
+        device_updated_at.setdefault(dev_id, {})["pwr_status"] = time.monotonic()
+        return OperationResult(guid=guid, dev_id=dev_id, success=True, message=f"Power {name} successfully.")
+
+    return OperationResult(guid=guid, dev_id=dev_id, success=False, message=message)
+
+async def batch_power_action(dev_ids: Iterable[str], action: int) -> AsyncIterator[OperationResult]:
+    """
+    Perform power action on multiple devices concurrently, with at most DMT_power_concurrency actions in flight.
+    Each device has its own deadline of DMT_power_timeout seconds, so a slow device does not hold back the others.
+
+    Args:
+        dev_ids (Iterable[str]): Device IDs.
+        action (int): Power action, 2 = power on, 8 = power off.
+
+    Yields:
+        OperationResult: Operation result of each device, as soon as its action finishes.
+    """
+    semaphore = asyncio.Semaphore(DMT_power_concurrency)
+
+    async def run(dev_id: str) -> OperationResult:
+        async with semaphore:
+            return await power_action(dev_id, action)
+
+    tasks = [asyncio.create_task(run(dev_id)) for dev_id in dev_ids]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        # cancel remaining actions if the caller stop consuming the results
+        for task in tasks:
+            task.cancel()
+
+async def refresh_devices(dev_ids: Optional[Iterable[str]] = None, max_age: Optional[float] = None) -> int:
+    """
+    Refresh the cached fields of devices that are older than their TTL (DMT_pwr_status_ttl, DMT_ip_addr_ttl),
+    or older than max_age if provided. Fresh fields are not looked up again.
+
+    Args:
+        dev_ids (Iterable[str] | None): Target device IDs. Will check all devices if dev_ids is None.
+        max_age (float | None): Maximum age of the cached fields, in seconds.
+
+    Returns:
+        int: Number of refreshed fields.
+    """
+    global all_device
+    if not isinstance(all_device, dict):
+        return 0
+
+    started = time.monotonic()
+    ttl = {
+        "ip_addr": DMT_ip_addr_ttl if max_age is None else max_age,
+        "pwr_status": DMT_pwr_status_ttl if max_age is None else max_age,
+    }
+    getters = {
+        "ip_addr": (get_ip, "IP address"),
+        "pwr_status": (get_power_state, "power state"),
+    }
+    targets = []
+    for dev_id in (all_device.keys() if dev_ids is None else dev_ids):
+        if dev_id not in all_device:
+            continue
+        updated_at = device_updated_at.setdefault(dev_id, {})
+        for field in getters:
+            if started - updated_at.get(field, float("-inf")) >= ttl[field]:
+                targets.append((dev_id, field))
+    if not targets:
+        return 0
+
+    semaphore = asyncio.Semaphore(DMT_discovery_concurrency)
+    results = await asyncio.gather(*[
+        lookup_device_field(getters[field][0](all_device[dev_id]["guid"]), getters[field][1], semaphore)
+        for dev_id, field in targets
+    ])
+
+    refreshed = 0
+    for (dev_id, field), value in zip(targets, results):
+        # keep the last known value of a failed lookup, it will be retried on next refresh
+        if value.startswith("Unable to"):
+            print(f"{dev_id}: {value}", flush=True)
+            continue
+        # skip if the field was updated while refreshing, e.g. by a power action
+        if device_updated_at[dev_id].get(field, float("-inf")) > started:
+            continue
+        all_device[dev_id][field] = value # type: ignore
+        device_updated_at[dev_id][field] = time.monotonic()
+        refreshed += 1
+
+    return refreshed
+
+async def refresh_inventory_periodically():
+    """Background task re-polling stale device information every DMT_refresh_interval seconds."""
+    while True:
+        await asyncio.sleep(DMT_refresh_interval)
+        try:
+            await refresh_devices()
+        except Exception as e:
+            print(f"Failed to refresh device inventory. {e}", flush=True)
+
+async def collect_power_results(dev_ids: Iterable[str], action: int, ctx: Context | None = None) -> List[OperationResult]:
+    """Run batch power action, and report each device result to the MCP client as progress once it finishes."""
+    dev_ids = list(dev_ids)
+    results = []
+    async for result in batch_power_action(dev_ids, action):
+        results.append(result)
+        try:
+            if ctx is not None:
+                await ctx.report_progress(len(results), len(dev_ids), f"{result['dev_id']}: {result['message']}")
+        except ValueError:
+            pass # called outside of a MCP request, nothing to report to
+    return results
 
 
 @mcp.tool()
-async def get_devices(dev_ids: Optional[List[str] | str] = None) -> Dict[str, DeviceInfo] | str:
+async def get_devices(dev_ids: Optional[List[str] | str] = None, max_age: Optional[float] = None) -> Dict[str, DeviceInfo] | str:
     """
     Get status information for target devices.
     
     Args:
         dev_ids (list | None): List of target device IDs, e.g. ['Device 01', 'Device 02']. Will returns all managed devices if dev_id is None.
+        max_age (float | None): Maximum age of the device information in seconds. Older information is refreshed from the devices before returning. Will returns the cached information if max_age is None.
 
     Returns:
         Dict[str, DeviceInfo]: Dictionary of device information keyed by device ID, e.g.:
@@ -225,13 +544,19 @@ async def get_devices(dev_ids: Optional[List[str] | str] = None) -> Dict[str, De
     """
     global all_device
     if (dev_ids is None) or (not dev_ids):
-        return all_device
-    if isinstance(dev_ids, str):
+        dev_ids = None
+    elif isinstance(dev_ids, str):
         if (dev_ids.lower() == "none") or (dev_ids.lower() == "null") or (dev_ids == "*"):
-            return all_device
+            dev_ids = None
         else:
             dev_ids = ast.literal_eval(dev_ids)
 
+    # only refresh the entries older than max_age, otherwise serve from memory
+    if max_age is not None:
+        await refresh_devices(dev_ids, max_age)
+    if dev_ids is None:
+        return all_device
+
     devices = {}
     for dev_id in dev_ids: # type: ignore
         devices[dev_id] = all_device[dev_id] # type: ignore
@@ -239,7 +564,7 @@ async def get_devices(dev_ids: Optional[List[str] | str] = None) -> Dict[str, De
     return devices
 
 @mcp.tool()
-async def power_on_devices(dev_ids: Optional[List[str] | str] = None) -> List[OperationResult] | str:
+async def power_on_devices(dev_ids: Optional[List[str] | str] = None, ctx: Context = None) -> List[OperationResult] | str: # type: ignore
     """
     Power on target devices.
     
@@ -272,52 +597,10 @@ async def power_on_devices(dev_ids: Optional[List[str] | str] = None) -> List[Op
         else: 
             dev_ids = ast.literal_eval(dev_ids)
 
-    results = []
-    payload = {
-        "action": 2,
-        "useSOL": "false"
-    }
-    for dev_id in dev_ids: # type: ignore
-        guid = all_device[dev_id]["guid"] # type: ignore
-        url = f"{DMT_API_BASE}/amt/power/action/{guid}"
-        data = await make_dmt_post_request(url, json=payload)
-
-        if data.get("ReturnValue") is None: # type: ignore
-            result: OperationResult = {
-                "guid": guid,
-                "dev_id": dev_id,
-                "success": False,
-                "message": "Unable to power on the device."
-            }
-        if data.get("Exception"): # type: ignore
-            result: OperationResult = {
-                "guid": guid,
-                "dev_id": dev_id,
-                "success": False,
-                "message": f"Unable to power on the device. Exception: {data['Exception']}" # type: ignore
-            }
-        if data["ReturnValue"] != 0: # type: ignore
-            result: OperationResult = {
-                "guid": guid,
-                "dev_id": dev_id,
-                "success": False,
-                "message": "Power on failed."
-            }
-        else:
-            result: OperationResult = {
-                "guid": guid,
-                "dev_id": dev_id,
-                "success": True,
-                "message": "Power on successfully."
-            }
-            all_device[dev_id]["pwr_status"] = "on" # type: ignore
-        
-        results.append(result)
-
-    return results
+    return await collect_power_results(dev_ids, POWER_ON, ctx) # type: ignore
 
 @mcp.tool()
-async def power_off_devices(dev_ids: Optional[List[str] | str] = None) -> List[OperationResult] | str:
+async def power_off_devices(dev_ids: Optional[List[str] | str] = None, ctx: Context = None) -> List[OperationResult] | str: # type: ignore
     """
     Power off target devices.
     
@@ -350,58 +633,28 @@ async def power_off_devices(dev_ids: Optional[List[str] | str] = None) -> List[O
         else: 
             dev_ids = ast.literal_eval(dev_ids)
 
-    results = []
-    payload = {
-        "action": 8,
-        "useSOL": "false"
-    }
-    for dev_id in dev_ids: # type: ignore
-        guid = all_device[dev_id]["guid"] # type: ignore
-        url = f"{DMT_API_BASE}/amt/power/action/{guid}"
-        data = await make_dmt_post_request(url, json=payload)
-
-        if data.get("ReturnValue") is None: # type: ignore
-            result: OperationResult = {
-                "guid": guid,
-                "dev_id": dev_id,
-                "success": False,
-                "message": "Unable to power off the device."
-            }
-        if data.get("Exception"): # type: ignore
-            result: OperationResult = {
-                "guid": guid,
-                "dev_id": dev_id,
-                "success": False,
-                "message": f"Unable to power off the device. Exception: {data['Exception']}" # type: ignore
-            }
-        if data["ReturnValue"] != 0: # type: ignore
-            result: OperationResult = {
-                "guid": guid,
-                "dev_id": dev_id,
-                "success": False,
-                "message": "Power off failed."
-            }
-        else:
-            result: OperationResult = {
-                "guid": guid,
-                "dev_id": dev_id,
-                "success": True,
-                "message": "Power off successfully."
-            }
-            all_device[dev_id]["pwr_status"] = "off" # type: ignore
-        
-        results.append(result)
-
-    return results
+    return await collect_power_results(dev_ids, POWER_OFF, ctx) # type: ignore
 
-if __name__ == "__main__":
+async def main():
+    # run startup and server in one event loop, so the server keep using the DMT client created at startup
+    refresher = None
     try:
         # authorize the session
-        asyncio.run(authorize())
+        await authorize()
         # get all device in the network
-        asyncio.run(get_all_device())
+        await get_all_device()
+        # keep the device information fresh in background
+        refresher = asyncio.create_task(refresh_inventory_periodically())
 
-        mcp.run(transport='streamable-http')
+        await mcp.run_streamable_http_async()
+    finally:
+        if refresher is not None:
+            refresher.cancel()
+        await close_client()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
 
     except KeyboardInterrupt:
         print("Server shutting down gracefully...")
@@ -0,0 +1,290 @@
+import os
+import sys
+import csv
+import json
+import math
+import argparse
+import numpy as np
+from typing import TypedDict, Optional, List, Dict, Callable
+
+
+class BacktestResult(TypedDict):
+    policy: str
+    config: dict # PolicyConfig replayed
+    ticks: int # number of decisions
+    duration: float # length of the trace, in seconds
+    device_hours: float # sum of active devices over time, in hours
+    mean_active: float
+    mean_wait: float # estimated wait of ticks with enough capacity, in seconds
+    p95_wait: float # in seconds
+    max_wait: float # in seconds
+    overloaded: float # fraction of ticks where the active devices cannot keep up with arrival rate (wait is unbounded)
+    power_on: int # number of devices powered on
+    power_off: int # number of devices powered off
+    transitions: int # power_on + power_off
+
+
+def policy_params(configs: List[dict]) -> Dict[str, np.ndarray]:
+    """Stack PolicyConfig variants into arrays of shape (configs, 1, 1), to broadcast over blocks and states."""
+    def column(key, default):
+        values = [default if config.get(key, default) is None else config.get(key, default) for config in configs]
+        return np.array(values, dtype=np.float64)[:, None, None]
+    return {
+        "arrival_rate": column("arrival_rate", 0.0),
+        "service_rate": column("service_rate", 1.0),
+        "min_devices": column("min_devices", 1),
+        "buffer": column("buffer", 0.2),
+        "target_wait": column("target_wait", np.nan),
+    }
+
+def energy_save(queue_length: np.ndarray, current_active: np.ndarray, max_devices: int, p: Dict[str, np.ndarray]) -> np.ndarray:
+    """Vectorized queue_management_utils.energy_save, deciding every (config, queue length, current active) at once."""
+    offered_load = p["arrival_rate"] / p["service_rate"]
+    buffer = np.maximum(1, p["buffer"] * offered_load)
+    up = (current_active < max_devices) & (queue_length > (offered_load + buffer))
+    down = (current_active > p["min_devices"]) & (queue_length < (offered_load - buffer))
+    required = current_active + up - (down & ~up)
+    return np.where(current_active < p["min_devices"], p["min_devices"], required)
+
+def min_wait(queue_length: np.ndarray, current_active: np.ndarray, max_devices: int, p: Dict[str, np.ndarray]) -> np.ndarray:
+    """Vectorized queue_management_utils.min_wait, deciding every (config, queue length, current active) at once."""
+    arrival_rate, service_rate, min_devices, buffer = p["arrival_rate"], p["service_rate"], p["min_devices"], p["buffer"]
+    target_min = p["target_wait"] / 60
+
+    def meets_target(devices):
+        test_capacity = devices * service_rate - arrival_rate
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (test_capacity > 0) & (queue_length / np.where(test_capacity > 0, test_capacity, 1) <= target_min)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        capacity = current_active * service_rate
+        utilization = np.where(capacity > 0, arrival_rate / np.where(capacity > 0, capacity, 1), np.inf)
+        net_capacity = capacity - arrival_rate
+        current_wait = np.where(net_capacity <= 0, np.inf, queue_length / np.where(net_capacity > 0, net_capacity, 1))
+
+        # 1. reduce devices if underutilized and safe
+        reduce = (current_active > min_devices) & (utilization < 0.7) & (current_wait < target_min * (1 - buffer)) & meets_target(current_active - 1)
+
+        # 2. add devices if wait exceeds target, minimum devices meeting the target is solved in closed form,
+        # then corrected by one device either way so rounding matches the scalar search
+        devices = np.ceil((queue_length / target_min + arrival_rate) / service_rate)
+    devices = np.where(np.isfinite(devices), devices, max_devices + 1)
+    devices = np.where(meets_target(devices - 1), devices - 1, np.where(meets_target(devices), devices, devices + 1))
+    devices = np.maximum(devices, current_active + 1)
+    devices = np.where(meets_target(devices) & (devices <= max_devices), devices, max_devices)
+    expand = (current_wait > target_min) | (utilization >= 1)
+
+    return np.where(reduce, current_active - 1, np.where(expand, devices, current_active))
+
+def erlang_c(queue_length: np.ndarray, current_active: np.ndarray, max_devices: int, p: Dict[str, np.ndarray]) -> np.ndarray:
+    """queue_management_utils.erlang_c_policy applied element-wise. It is only evaluated once per entry of the decision table."""
+    from queue_management_utils import erlang_c_policy
+    decide = np.vectorize(
+        lambda q, c, arrival_rate, service_rate, min_devices, buffer, target_wait:
+            erlang_c_policy(int(q), arrival_rate, service_rate, int(c), max_devices, int(min_devices), buffer, target_wait),
+        otypes=[np.int64],
+    )
+    return decide(queue_length, current_active, p["arrival_rate"], p["service_rate"], p["min_devices"], p["buffer"], p["target_wait"])
+
+# All vectorized policies available to backtest, keyed as the policies in queue_policy
+policies: Dict[str, Callable] = {
+    "energy_save": energy_save,
+    "min_wait": min_wait,
+    "erlang_c": erlang_c,
+}
+
+
+def simulate(
+        queue_length: np.ndarray,
+        policy: str,
+        configs: List[dict],
+        max_devices: int,
+        initial_active: Optional[int] = None,
+        block_size: int = 512,
+    ) -> np.ndarray:
+    """
+    Replay the queue length trace through the policy for each config, deciding once per sample.
+    Return the active devices after each decision, shape (configs, samples).
+
+    The policy decision only depends on the queue length and current active devices, so the decision of every distinct queue length
+    and active devices count (0 to max_devices) is evaluated once into a table, and replaying a sample is a table lookup.
+    The trace is split into blocks replayed in parallel from every possible active devices count. Chaining the blocks end states
+    then gives each block's real start state, and a second parallel pass records the active devices of every sample.
+    """
+    if policy not in policies:
+        raise ValueError(f"Unknown strategy: {policy}")
+    decide = policies[policy]
+    p = policy_params(configs)
+    queue_length = np.asarray(queue_length, dtype=np.float64)
+    n = len(queue_length)
+    k = len(configs)
+    states = max_devices + 1
+    if n == 0:
+        return np.zeros((k, 0), dtype=np.int64)
+
+    # decision table of shape (configs, distinct queue length, active devices), flattened per config
+    values, index = np.unique(queue_length, return_inverse=True)
+    table = decide(values[None, :, None], np.arange(states)[None, None, :], max_devices, p)
+    table = np.clip(np.broadcast_to(table, (k, len(values), states)), 0, max_devices).astype(np.int64)
+    # offset of each config in the flattened table
+    table = (table + (np.arange(k) * len(values) * states)[:, None, None]).ravel()
+
+    # pad the trace to whole blocks, samples past the end of the trace keep the current active devices
+    blocks = math.ceil(n / block_size)
+    trace = np.full(blocks * block_size, -1, dtype=np.int64)
+    trace[:n] = index.reshape(-1) * states
+    trace = trace.reshape(blocks, block_size)
+    base = np.arange(k)[:, None, None] * len(values) * states
+
+    def step(current, i):
+        # current holds flattened table positions minus the queue length offset, i.e. config offset + active devices
+        offset = trace[:, i][None, :, None]
+        return np.where(offset >= 0, table[current + np.maximum(offset, 0)], current)
+
+    # pass 1: end state of every block for every start state
+    current = np.broadcast_to(base + np.arange(states), (k, blocks, states))
+    for i in range(block_size):
+        current = step(current, i)
+    ends = current - base
+
+    # chain the blocks: start state of block b is the end state of block b - 1
+    start = np.empty((k, blocks), dtype=np.int64)
+    if initial_active is not None:
+        active = np.full(k, min(max_devices, initial_active), dtype=np.int64)
+    else:
+        active = np.minimum(p["min_devices"][:, 0, 0], max_devices).astype(np.int64)
+    rows = np.arange(k)
+    for b in range(blocks):
+        start[:, b] = active
+        active = ends[rows, b, active]
+
+    # pass 2: replay every block from its real start state
+    replay = np.empty((k, blocks, block_size), dtype=np.int64)
+    current = start[:, :, None] + base
+    for i in range(block_size):
+        current = step(current, i)
+        replay[:, :, i] = current[:, :, 0]
+    return (replay - base).reshape(k, -1)[:, :n]
+
+
+def summarize(
+        queue_length: np.ndarray,
+        active: np.ndarray,
+        initial_active: int,
+        policy: str,
+        config: dict,
+        interval: float | np.ndarray,
+    ) -> BacktestResult:
+    """Report device-hours, estimated waits and power transitions of one replayed config."""
+    queue_length = np.asarray(queue_length, dtype=np.float64)
+    dt = np.broadcast_to(np.asarray(interval, dtype=np.float64), queue_length.shape)
+    arrival_rate, service_rate = config["arrival_rate"], config["service_rate"]
+    # estimated wait of the queue with the active devices after the decision, rates are per minute
+    net_capacity = active * service_rate - arrival_rate
+    bounded = net_capacity > 0
+    wait = queue_length[bounded] / net_capacity[bounded] * 60
+    changes = np.diff(np.concatenate(([initial_active], active)))
+    return BacktestResult(
+        policy=policy,
+        config=config,
+        ticks=len(active),
+        duration=float(dt.sum()),
+        device_hours=float((active * dt).sum() / 3600),
+        mean_active=float(active.mean()) if len(active) else 0.0,
+        mean_wait=float(wait.mean()) if len(wait) else 0.0,
+        p95_wait=float(np.percentile(wait, 95)) if len(wait) else 0.0,
+        max_wait=float(wait.max()) if len(wait) else 0.0,
+        overloaded=float(1 - bounded.mean()) if len(active) else 0.0,
+        power_on=int(changes[changes > 0].sum()),
+        power_off=int(-changes[changes < 0].sum()),
+        transitions=int(np.abs(changes).sum()),
+    )
+
+def sweep(
+        queue_length,
+        policy: str,
+        configs: List[dict],
+        max_devices: int,
+        interval: float = 1.0,
+        timestamps=None,
+        initial_active: Optional[int] = None,
+    ) -> List[BacktestResult]:
+    """
+    Backtest many PolicyConfig variants of a policy over the same queue length trace in one run.
+
+    Args:
+        queue_length: Queue length trace, one decision per sample.
+        policy (str): Name of queue management policy, "energy_save", "min_wait" or "erlang_c".
+        configs (list): PolicyConfig variants.
+        max_devices (int): Number of devices available.
+        interval (float): Seconds between samples, used if timestamps not given.
+        timestamps: Epoch seconds of each sample. Each sample lasts until the next one.
+        initial_active (int | None): Active devices before the first sample. Defaults to min_devices of each config.
+
+    Returns:
+        Backtest result of each config, in order.
+    """
+    queue_length = np.asarray(queue_length, dtype=np.float64)
+    if timestamps is not None:
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        dt = np.diff(timestamps, append=timestamps[-1] + (np.median(np.diff(timestamps)) if len(timestamps) > 1 else interval))
+    else:
+        dt = interval
+    active = simulate(queue_length, policy, configs, max_devices, initial_active=initial_active)
+    results = []
+    for i, config in enumerate(configs):
+        start = initial_active if initial_active is not None else min(int(config.get("min_devices", 1)), max_devices)
+        results.append(summarize(queue_length, active[i], start, policy, config, dt))
+    return results
+
+def backtest(queue_length, policy: str, config: dict, max_devices: int, interval: float = 1.0, timestamps=None, initial_active: Optional[int] = None) -> BacktestResult:
+    """Backtest one PolicyConfig of a policy over a queue length trace. See sweep()."""
+    return sweep(queue_length, policy, [config], max_devices, interval=interval, timestamps=timestamps, initial_active=initial_active)[0]
+
+
+def load_trace(path: str) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Load a recorded queue length trace. Return the queue length and timestamp (None if not recorded) of each sample.
+    Supports JSON lines of people-count messages, e.g. {"queue_count": 3, "timestamp": 1755590400.0}, and CSV with a
+    "queue_count" (or "queue_length") column and an optional "timestamp" column.
+    """
+    if path.endswith(".jsonl"):
+        with open(path, "r") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(path, "r", newline="") as f:
+            rows = list(csv.DictReader(f))
+    queue_length = np.array([float(row.get("queue_count", row.get("queue_length"))) for row in rows]) # type: ignore
+    timestamps = None
+    if rows and all(row.get("timestamp") not in (None, "") for row in rows):
+        timestamps = np.array([float(row["timestamp"]) for row in rows])
+    return queue_length, timestamps
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="backtest.py",
+        description="Replay a recorded queue length trace through a queue management policy.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+
+    parser.add_argument("trace", help="Queue length trace, JSON lines or CSV.")
+    parser.add_argument("-s", "--strategy", action="store", default="energy_save", choices=[*policies], help="Strategy to replay.")
+    parser.add_argument("-c", "--config", action="append", default=None, help="PolicyConfig as JSON string. Repeat to sweep many configs. Defaults to the server's configuration of the strategy.")
+    parser.add_argument("-d", "--devices", type=int, required=True, help="Number of devices available.")
+    parser.add_argument("-i", "--interval", type=float, default=1.0, help="Seconds between samples, if the trace has no timestamp.")
+
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    if args.config:
+        configs = [json.loads(config) for config in args.config]
+    else:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from queue_core import queue_policy
+        configs = [dict(queue_policy[args.strategy])]
+
+    queue_length, timestamps = load_trace(args.trace)
+    for result in sweep(queue_length, args.strategy, configs, args.devices, interval=args.interval, timestamps=timestamps):
+        print(json.dumps(result), flush=True)
@@ -1,10 +1,20 @@
 import os
+import sys
+import json
+import base64
+import re
 import ast
+import time
 import asyncio
 from dotenv import load_dotenv
-from typing import Any, List, Dict, TypedDict, Optional
+from typing import Any, List, Dict, TypedDict, Optional, Iterable, AsyncIterator
 import httpx
-from mcp.server.fastmcp import FastMCP
+from latency_histogram import LatencyHistogram
+# metrics are shared by the MCP servers and the agent, imported from the package at the repository root
+repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if repo_dir not in sys.path:
+    sys.path.append(repo_dir)
+from queueflow_device_manager.metrics import Histogram, Counter
 
 
 class DeviceInfo(TypedDict):
@@ -12,7 +22,7 @@ class DeviceInfo(TypedDict):
     dev_id: str
     hostname: str
     ip_addr: str
-    pwr_status: str  # "on", "off", "unknown"
+    pwr_status: str  # "on", "off", "powering_on", "powering_off", "unknown"
 
 class OperationResult(TypedDict):
     guid: str
@@ -28,8 +38,92 @@ load_dotenv()
 DMT_username = os.getenv("DMT_username", "Intel")
 DMT_password = os.getenv("DMT_password", "Intel@123")
 
+# Connection pool of the shared DMT client
+DMT_max_connections = int(os.getenv("DMT_max_connections", 100))
+DMT_max_keepalive_connections = int(os.getenv("DMT_max_keepalive_connections", 20))
+DMT_keepalive_expiry = float(os.getenv("DMT_keepalive_expiry", 30)) # in seconds
+DMT_http2 = os.getenv("DMT_http2", "false").lower() == "true"
+DMT_token_refresh_margin = float(os.getenv("DMT_token_refresh_margin", 60)) # refresh JWT token this long before it expire, in seconds
+
+# Device discovery
+DMT_discovery_concurrency = int(os.getenv("DMT_discovery_concurrency", DMT_max_connections)) # max concurrent per-device lookups
+DMT_discovery_timeout = float(os.getenv("DMT_discovery_timeout", 10)) # per-device lookup deadline, in seconds
+
+# Power actions
+DMT_power_concurrency = int(os.getenv("DMT_power_concurrency", 10)) # max concurrent power actions
+DMT_power_timeout = float(os.getenv("DMT_power_timeout", 30)) # per-device power action deadline, in seconds
+
+# Power transitions
+DMT_confirm_interval = float(os.getenv("DMT_confirm_interval", 2)) # poll power state of transitioning device this often, in seconds
+DMT_confirm_timeout = float(os.getenv("DMT_confirm_timeout", 300)) # give up confirming a power transition after this long, in seconds
+DMT_ready_port = int(os.getenv("DMT_ready_port", 0)) # if set, a powered on device is only serving once this TCP port accepts connections
+
+# Metrics of the DMT API requests, served at /metrics
+dmt_request_duration = Histogram("dmt_request_duration_seconds", "Latency of Intel DMT API requests.", ["method", "endpoint"])
+dmt_request_errors = Counter("dmt_request_errors_total", "Failed Intel DMT API requests.", ["method", "endpoint", "reason"])
+GUID_PATTERN = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+
 global token
 global all_device
+token = None
+token_expiry = None # expiry of the token in epoch seconds, None if unknown
+token_refresh = None # in-flight token refresh, shared by all callers
+global discovery_time
+global dmt_client
+discovery_time = None
+dmt_client = None
+dmt_client_loop = None
+
+# Power transitions in flight keyed by device ID, and how long they took
+power_transitions: Dict[str, asyncio.Task] = {}
+boot_latency = LatencyHistogram() # seconds from power on request until the device is serving, all devices
+shutdown_latency = LatencyHistogram() # seconds from power off request until the device is off, all devices
+device_boot_latency: Dict[str, LatencyHistogram] = {}
+device_shutdown_latency: Dict[str, LatencyHistogram] = {}
+power_transition_duration = Histogram("dmt_power_transition_seconds", "Time from a power action request until the device reached its new power state.", ["action"],
+                                      collect=lambda: {("on",): boot_latency, ("off",): shutdown_latency}, buckets=boot_latency.buckets)
+
+async def get_client() -> httpx.AsyncClient:
+    """
+    Get the process-wide Intel® DMT client. The client is created once and keeps a pool of keep-alive
+    connections, so DMT calls after the first one skip the TCP/TLS handshake.
+    A new client is created if the client was created on another event loop, e.g. by a previous asyncio.run().
+
+    Returns:
+        httpx.AsyncClient: Shared DMT client.
+    """
+    global dmt_client, dmt_client_loop
+    loop = asyncio.get_running_loop()
+    if (dmt_client is None) or dmt_client.is_closed or (dmt_client_loop is not loop):
+        http2 = DMT_http2
+        if http2:
+            try:
+                import h2 # noqa: F401
+            except ImportError:
+                print("HTTP/2 requires the 'h2' package (pip install httpx[http2]). Fall back to HTTP/1.1.", flush=True)
+                http2 = False
+        dmt_client = httpx.AsyncClient(
+            headers={
+                "User-Agent": USER_AGENT,
+                "Accept": "application/json"
+            },
+            limits=httpx.Limits(
+                max_connections=DMT_max_connections,
+                max_keepalive_connections=DMT_max_keepalive_connections,
+                keepalive_expiry=DMT_keepalive_expiry
+            ),
+            http2=http2,
+            timeout=30.0
+        )
+        dmt_client_loop = loop
+    return dmt_client
+
+async def close_client():
+    global dmt_client, dmt_client_loop
+    if dmt_client is not None:
+        await dmt_client.aclose()
+    dmt_client = None
+    dmt_client_loop = None
 
 async def get_token(username: str, password: str) -> str | None:
     """
@@ -49,52 +143,105 @@ async def get_token(username: str, password: str) -> str | None:
         "User-Agent": USER_AGENT,
         "Accept": "application/json"
     }
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(url, json=payload, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            data = response.json()
-            return data["token"]
-        except Exception:
-            return None
+    client = await get_client()
+    started = time.perf_counter()
+    try:
+        response = await client.post(url, json=payload, headers=headers, timeout=30.0)
+        response.raise_for_status()
+        data = response.json()
+        return data["token"]
+    except Exception as e:
+        dmt_request_errors.inc(method="POST", endpoint="/authorize", reason=error_reason(e))
+        return None
+    finally:
+        dmt_request_duration.observe(time.perf_counter() - started, method="POST", endpoint="/authorize")
+
+def decode_token_expiry(jwt: str) -> float | None:
+    """Read the expiry ("exp" claim, in epoch seconds) of a JWT token without verifying it."""
+    try:
+        payload = jwt.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+async def refresh_token():
+    global token, token_expiry
+    new_token = await get_token(DMT_username, DMT_password) # type: ignore
+    if new_token:
+        token, token_expiry = new_token, decode_token_expiry(new_token)
+    # keep the current token if it has not expired yet, a failed refresh is retried on next request
+    elif (token_expiry is None) or (token_expiry <= time.time()):
+        token, token_expiry = None, None
 
 async def authorize():
-    global token
-    token = await get_token(DMT_username, DMT_password)
-
+    """Fetch a new JWT token. Concurrent callers share a single /authorize request."""
+    global token_refresh
+    loop = asyncio.get_running_loop()
+    if (token_refresh is None) or token_refresh.done() or (token_refresh.get_loop() is not loop):
+        token_refresh = loop.create_task(refresh_token())
+    await asyncio.shield(token_refresh)
+
+async def get_valid_token() -> str | None:
+    """Get the current JWT token, refresh it first if missing or expiring within DMT_token_refresh_margin seconds."""
+    if (token is None) or ((token_expiry is not None) and (token_expiry - time.time() <= DMT_token_refresh_margin)):
+        await authorize()
+    return token
+
+async def reauthorize(rejected_token: str | None):
+    """
+    Re-authorize after the DMT API rejected rejected_token (HTTP 401).
+    Requests rejected with the same token share one re-authorization, requests rejected with an already replaced token just retry.
+    """
+    if token == rejected_token:
+        await authorize()
+
+
+def endpoint_name(url: str) -> str:
+    """Path of a DMT API URL below DMT_API_BASE with device GUIDs replaced, so each endpoint is one metric label, e.g. "/amt/power/state/{guid}"."""
+    path = httpx.URL(url).path.removeprefix(httpx.URL(DMT_API_BASE).path)
+    return GUID_PATTERN.sub("{guid}", path)
+
+def error_reason(e: Exception) -> str:
+    """HTTP status code of a rejected request, else the exception type."""
+    return str(e.response.status_code) if isinstance(e, httpx.HTTPStatusError) else type(e).__name__
+
+async def make_dmt_request(method: str, url: str, json: dict[str, Any] | None = None) -> dict[str, Any] | None:
+    """Make a request to the Intel® DMT API with proper error handling. Retry once with a new token if the token is rejected."""
+    client = await get_client()
+    endpoint = endpoint_name(url)
+    started = time.perf_counter()
+    try:
+        for attempt in range(2):
+            request_token = await get_valid_token()
+            headers = {
+                "User-Agent": USER_AGENT,
+                "Accept": "application/json",
+                "Authorization": f"Bearer {request_token}"
+            }
+            response = await client.request(method, url, json=json, headers=headers, timeout=30.0)
+            if (response.status_code == 401) and (attempt == 0):
+                await reauthorize(request_token)
+                continue
+            response.raise_for_status()
+            return response.json()
+    except asyncio.CancelledError:
+        # cancelled by the caller deadline
+        dmt_request_errors.inc(method=method, endpoint=endpoint, reason="Cancelled")
+        raise
+    except Exception as e:
+        dmt_request_errors.inc(method=method, endpoint=endpoint, reason=error_reason(e))
+        return {"Exception": e}
+    finally:
+        dmt_request_duration.observe(time.perf_counter() - started, method=method, endpoint=endpoint)
 
 async def make_dmt_get_request(url: str) -> dict[str, Any] | None:
     """Make a GET request to the Intel® DMT API with proper error handling."""
-    global token
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Accept": "application/json",
-        "Authorization": f"Bearer {token}"
-    }
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            return {"Exception": e}
+    return await make_dmt_request("GET", url)
 
 async def make_dmt_post_request(url: str, json: dict[str, Any]) -> dict[str, Any] | None:
     """Make a POST request to the Intel® DMT API with proper error handling."""
-    global token
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Accept": "application/json",
-        "Authorization": f"Bearer {token}"
-    }
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(url, json=json, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            return {"Exception": e}
-
+    return await make_dmt_request("POST", url, json=json)
 
 async def get_power_state(guid: str) -> str:
     """ 
@@ -141,6 +288,16 @@ async def get_ip(guid: str) -> str:
     else:
         return data["wireless"]["ipAddress"] # type: ignore
 
+async def lookup_device_field(coro, what: str, semaphore: asyncio.Semaphore) -> str:
+    """Await a per-device lookup within DMT_discovery_timeout. Return an error message instead of raising if the lookup fails."""
+    async with semaphore:
+        try:
+            return await asyncio.wait_for(coro, timeout=DMT_discovery_timeout)
+        except asyncio.TimeoutError:
+            return f"Unable to get {what} of device. Exception: Timed out after {DMT_discovery_timeout} seconds."
+        except Exception as e:
+            return f"Unable to get {what} of device. Exception: {e}"
+
 async def discover_device() -> Dict[str, DeviceInfo] | str:
     """
     Discover all connected devices in the network.
@@ -173,14 +330,22 @@ async def discover_device() -> Dict[str, DeviceInfo] | str:
     if isinstance(data, list) and len(data) < 1:
         return "No device."
 
-    devices = {}
+    # look up IP address and power state of all devices concurrently. A slow or failed lookup only affects its own field.
+    semaphore = asyncio.Semaphore(DMT_discovery_concurrency)
+    lookups = []
     for item in data: # type: ignore
+        lookups.append(lookup_device_field(get_ip(item["guid"]), "IP address", semaphore)) # type: ignore
+        lookups.append(lookup_device_field(get_power_state(item["guid"]), "power state", semaphore)) # type: ignore
+    results = await asyncio.gather(*lookups)
+
+    devices = {}
+    for i, item in enumerate(data): # type: ignore
         device: DeviceInfo = {
             "guid": item["guid"], # type: ignore
             "dev_id": item["friendlyName"], # type: ignore
             "hostname": item["hostname"], # type: ignore
-            "ip_addr": await get_ip(item["guid"]), # type: ignore
-            "pwr_status": await get_power_state(item["guid"]) # type: ignore
+            "ip_addr": results[2 * i],
+            "pwr_status": results[2 * i + 1]
         }
         devices[item["friendlyName"]] = device # type: ignore
 
@@ -188,7 +353,138 @@ async def discover_device() -> Dict[str, DeviceInfo] | str:
 
 async def get_all_device():
     global all_device
+    global discovery_time
+    start = time.perf_counter()
     all_device = await discover_device()
+    discovery_time = time.perf_counter() - start
+    count = len(all_device) if isinstance(all_device, dict) else 0
+    print(f"Discovered {count} devices in {discovery_time:.3f} seconds.", flush=True)
+
+POWER_ON = 2 # corresponding to ACPI state G0 or S0 or D0
+POWER_OFF = 8 # corresponding to ACPI state G2, S5, or D3
+power_action_name = {POWER_ON: "on", POWER_OFF: "off"}
+# Power status of a device while its power action is being confirmed
+power_transition_name = {POWER_ON: "powering_on", POWER_OFF: "powering_off"}
+
+async def is_ready(ip_addr: str) -> bool:
+    """Check whether the device accepts TCP connections on DMT_ready_port."""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip_addr, DMT_ready_port), timeout=DMT_confirm_interval)
+        writer.close()
+        return True
+    except (OSError, asyncio.TimeoutError):
+        return False
+
+async def confirm_power_transition(dev_id: str, action: int, started: float):
+    """
+    Poll the power state of a device after a power action until it reaches the requested state (and, when powering on
+    with DMT_ready_port set, until the device accepts connections), then record how long the transition took.
+    If not confirmed within DMT_confirm_timeout, the device power status is set to its last polled state.
+    """
+    name = power_action_name[action]
+    device = all_device[dev_id] # type: ignore
+    last_state = "unknown"
+    try:
+        while time.monotonic() - started < DMT_confirm_timeout:
+            await asyncio.sleep(DMT_confirm_interval)
+            last_state = await get_power_state(device["guid"])
+            if last_state != name:
+                continue
+            if (action == POWER_ON) and DMT_ready_port and not await is_ready(device["ip_addr"]):
+                continue
+            latency = time.monotonic() - started
+            histograms = (boot_latency, device_boot_latency) if action == POWER_ON else (shutdown_latency, device_shutdown_latency)
+            histograms[0].observe(latency)
+            histograms[1].setdefault(dev_id, LatencyHistogram()).observe(latency)
+            device["pwr_status"] = name
+            print(f"{dev_id} (GUID: {device['guid']}). Power {name} confirmed in {latency:.1f} seconds.", flush=True)
+            return
+        device["pwr_status"] = last_state if last_state in ("on", "off") else "unknown"
+        print(f"{dev_id} (GUID: {device['guid']}). Power {name} not confirmed in {DMT_confirm_timeout} seconds. Power status: {device['pwr_status']}", flush=True)
+    finally:
+        if power_transitions.get(dev_id) is asyncio.current_task():
+            del power_transitions[dev_id]
+
+def measured_boot_time(quantile: float = 0.9, min_samples: int = 3) -> Optional[float]:
+    """Boot time (seconds) that `quantile` of measured power on transitions completed within. None until min_samples are measured."""
+    if boot_latency.count < min_samples:
+        return None
+    return boot_latency.quantile(quantile)
+
+async def power_action(dev_id: str, action: int) -> OperationResult:
+    """
+    Perform power action on a device. If succeed, the device power status becomes "powering_on" or "powering_off"
+    until the transition is confirmed in the background by confirm_power_transition().
+
+    Args:
+        dev_id (str): Device ID.
+        action (int): Power action, 2 = power on, 8 = power off.
+
+    Returns:
+        OperationResult: Operation result of the device.
+    """
+    global all_device
+    name = power_action_name[action]
+    if dev_id not in all_device: # type: ignore
+        return OperationResult(guid="", dev_id=dev_id, success=False, message="Device not found.")
+
+    guid = all_device[dev_id]["guid"] # type: ignore
+    if all_device[dev_id]["pwr_status"] == power_transition_name[action]: # type: ignore
+        return OperationResult(guid=guid, dev_id=dev_id, success=False, message=f"Device is already {power_transition_name[action].replace('_', ' ')}.")
+    url = f"{DMT_API_BASE}/amt/power/action/{guid}"
+    payload = {
+        "action": action,
+        "useSOL": "false"
+    }
+    started = time.monotonic()
+    try:
+        data = await asyncio.wait_for(make_dmt_post_request(url, json=payload), timeout=DMT_power_timeout)
+    except asyncio.TimeoutError:
+        data = {"Exception": f"Timed out after {DMT_power_timeout} seconds."}
+
+    if data.get("Exception"): # type: ignore
+        message = f"Unable to power {name} the device. Exception: {data['Exception']}" # type: ignore
+    elif data.get("ReturnValue") is None: # type: ignore
+        message = f"Unable to power {name} the device."
+    elif data["ReturnValue"] != 0: # type: ignore
+        message = f"Power {name} failed."
+    else:
+        # the device is transitioning until its new power state is confirmed, replacing any earlier transition
+        previous = power_transitions.pop(dev_id, None)
+        if previous is not None:
+            previous.cancel()
+        all_device[dev_id]["pwr_status"] = power_transition_name[action] # type: ignore
+        power_transitions[dev_id] = asyncio.get_running_loop().create_task(confirm_power_transition(dev_id, action, started))
+        return OperationResult(guid=guid, dev_id=dev_id, success=True, message=f"Power {name} successfully.")
+
+    return OperationResult(guid=guid, dev_id=dev_id, success=False, message=message)
+
+async def batch_power_action(dev_ids: Iterable[str], action: int) -> AsyncIterator[OperationResult]:
+    """
+    Perform power action on multiple devices concurrently, with at most DMT_power_concurrency actions in flight.
+    Each device has its own deadline of DMT_power_timeout seconds, so a slow device does not hold back the others.
+
+    Args:
+        dev_ids (Iterable[str]): Device IDs.
+        action (int): Power action, 2 = power on, 8 = power off.
+
+    Yields:
+        OperationResult: Operation result of each device, as soon as its action finishes.
+    """
+    semaphore = asyncio.Semaphore(DMT_power_concurrency)
+
+    async def run(dev_id: str) -> OperationResult:
+        async with semaphore:
+            return await power_action(dev_id, action)
+
+    tasks = [asyncio.create_task(run(dev_id)) for dev_id in dev_ids]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        # cancel remaining actions if the caller stop consuming the results
+        for task in tasks:
+            task.cancel()
 
 
 # @mcp.tool()
@@ -267,52 +563,7 @@ async def power_on_devices(dev_ids: Optional[List[str] | str] = None) -> List[Op
         else: 
             dev_ids = ast.literal_eval(dev_ids)
 
-    results = []
-    payload = {
-        "action": 2,
-        "useSOL": "false"
-    }
-    for dev_id in dev_ids: # type: ignore
-        guid = all_device[dev_id]["guid"] # type: ignore
-        url = f"{DMT_API_BASE}/amt/power/action/{guid}"
-        data = await make_dmt_post_request(url, json=payload)
-        # --- test ---
-        # data = {"ReturnValue": 0}
-        # --- test ---
-
-        if data.get("ReturnValue") is None: # type: ignore
-            result: OperationResult = {
-                "guid": guid,
-                "dev_id": dev_id,
-                "success": False,
-                "message": "Unable to power on the device."
-            }
-        if data.get("Exception"): # type: ignore
-            result: OperationResult = {
-                "guid": guid,
-                "dev_id": dev_id,
-                "success": False,
-                "message": f"Unable to power on the device. Exception: {data['Exception']}" # type: ignore
-            }
-        if data["ReturnValue"] != 0: # type: ignore
-            result: OperationResult = {
-                "guid": guid,
-                "dev_id": dev_id,
-                "success": False,
-                "message": "Power on failed."
-            }
-        else:
-            result: OperationResult = {
-                "guid": guid,
-                "dev_id": dev_id,
-                "success": True,
-                "message": "Power on successfully."
-            }
-            all_device[dev_id]["pwr_status"] = "on" # type: ignore
-        
-        results.append(result)
-
-    return results
+    return [result async for result in batch_power_action(dev_ids, POWER_ON)] # type: ignore
 
 # @mcp.tool()
 async def power_off_devices(dev_ids: Optional[List[str] | str] = None) -> List[OperationResult]:
@@ -348,49 +599,4 @@ async def power_off_devices(dev_ids: Optional[List[str] | str] = None) -> List[O
         else: 
             dev_ids = ast.literal_eval(dev_ids)
 
-    results = []
-    payload = {
-        "action": 8,
-        "useSOL": "false"
-    }
-    for dev_id in dev_ids: # type: ignore
-        guid = all_device[dev_id]["guid"] # type: ignore
-        url = f"{DMT_API_BASE}/amt/power/action/{guid}"
-        data = await make_dmt_post_request(url, json=payload)
-        # --- test ---
-        # data = {"ReturnValue": 0}
-        # --- test ---
-
-        if data.get("ReturnValue") is None: # type: ignore
-            result: OperationResult = {
-                "guid": guid,
-                "dev_id": dev_id,
-                "success": False,
-                "message": "Unable to power off the device."
-            }
-        if data.get("Exception"): # type: ignore
-            result: OperationResult = {
-                "guid": guid,
-                "dev_id": dev_id,
-                "success": False,
-                "message": f"Unable to power off the device. Exception: {data['Exception']}" # type: ignore
-            }
-        if data["ReturnValue"] != 0: # type: ignore
-            result: OperationResult = {
-                "guid": guid,
-                "dev_id": dev_id,
-                "success": False,
-                "message": "Power off failed."
-            }
-        else:
-            result: OperationResult = {
-                "guid": guid,
-                "dev_id": dev_id,
-                "success": True,
-                "message": "Power off successfully."
-            }
-            all_device[dev_id]["pwr_status"] = "off" # type: ignore
-        
-        results.append(result)
-
-    return results
+    return [result async for result in batch_power_action(dev_ids, POWER_OFF)] # type: ignore
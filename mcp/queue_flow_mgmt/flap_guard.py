@@ -0,0 +1,65 @@
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+
+class FlapGuard:
+    """
+    Keep power actions from toggling devices on and off on noisy queue length:
+    - a device powered on stays on for at least `min_on_time` seconds, and a device powered off stays off for at least `min_off_time` seconds,
+    - at most `max_actions_per_minute` power actions are issued across all devices in any 60 seconds (0 for no limit).
+    Power actions held back are counted by reason in `suppressed`, i.e. DMT calls avoided.
+    Times are monotonic seconds unless `now` is given, e.g. the clock of the queue length source.
+    """
+    def __init__(self, min_on_time: float = 60, min_off_time: float = 30, max_actions_per_minute: int = 20):
+        self.min_on_time = min_on_time # in seconds
+        self.min_off_time = min_off_time # in seconds
+        self.max_actions_per_minute = max_actions_per_minute
+        self.changed_at: Dict[str, Tuple[float, bool]] = {} # time of the last power action of each device, and if it powered on
+        self.actions = deque() # time of the power actions in the last 60 seconds
+        self.suppressed = {"dwell": 0, "rate_limit": 0, "hysteresis": 0}
+
+    def dwell_remaining(self, dev_id: str, power_on: bool, now: Optional[float] = None) -> float:
+        """
+        Seconds until the device may be powered on (power_on=True) or off.
+        0 if the device has no recorded power action, or its last power action was the same.
+        """
+        last = self.changed_at.get(dev_id)
+        if (last is None) or (last[1] == power_on):
+            return 0.0
+        # powering on ends an off period, powering off ends an on period
+        dwell = self.min_off_time if power_on else self.min_on_time
+        return max(0.0, last[0] + dwell - (now if now is not None else time.monotonic()))
+
+    def budget(self, now: Optional[float] = None) -> int:
+        """Number of power actions allowed right now by max_actions_per_minute."""
+        now = now if now is not None else time.monotonic()
+        while self.actions and (self.actions[0] <= now - 60):
+            self.actions.popleft()
+        if self.max_actions_per_minute <= 0:
+            return 2 ** 31
+        return max(0, self.max_actions_per_minute - len(self.actions))
+
+    def select(self, candidates: List[str], power_on: bool, count: int, now: Optional[float] = None) -> List[str]:
+        """
+        Pick up to `count` devices from `candidates` (in order) that may be powered on (power_on=True) or off now,
+        within the action budget. Devices held back are counted in `suppressed`.
+        """
+        now = now if now is not None else time.monotonic()
+        eligible = [dev_id for dev_id in candidates if self.dwell_remaining(dev_id, power_on, now) <= 0]
+        selected = eligible[:min(count, self.budget(now))]
+        # devices wanted but not available because of dwell time, then because of the action budget
+        wanted = min(count, len(candidates))
+        dwell = max(0, wanted - len(eligible))
+        self.suppressed["dwell"] += dwell
+        self.suppressed["rate_limit"] += max(0, wanted - dwell - len(selected))
+        return selected
+
+    def record(self, dev_id: str, power_on: bool, now: Optional[float] = None):
+        """Record a power action issued to the device."""
+        now = now if now is not None else time.monotonic()
+        self.changed_at[dev_id] = (now, power_on)
+        self.actions.append(now)
+
+    def suppress_hysteresis(self, count: int):
+        self.suppressed["hysteresis"] += count
@@ -0,0 +1,59 @@
+from typing import Optional
+
+
+class QueueForecaster:
+    """
+    Incremental Holt-Winters forecast of the queue length: a level, a trend (per second) and, if `season` is set,
+    an additive seasonal offset for each of `season_bins` bins of the season (e.g. 96 bins of 15 minutes in a day).
+    Every people-count message updates the model in constant time and memory. Messages may arrive at any interval,
+    so the smoothing of each update depends on the time since the last message, set by the half-lives in seconds.
+    """
+    def __init__(
+            self,
+            level_halflife: float = 60,
+            trend_halflife: float = 300,
+            season: float = 0,
+            season_bins: int = 96,
+            season_halflife: float = 7,
+        ):
+        self.level_halflife = level_halflife # in seconds
+        self.trend_halflife = trend_halflife # in seconds
+        self.season = season # length of a season in seconds, 0 disables the seasonal offset
+        self.season_bins = season_bins
+        self.season_halflife = season_halflife # in seasons
+        self.seasonal = [0.0] * season_bins if season > 0 else []
+        # level, trend and time of the last message, replaced at once so a forecast never mix old and new state
+        self.state: Optional[tuple[float, float, float]] = None
+
+    def season_bin(self, timestamp: float) -> int:
+        return int((timestamp % self.season) / self.season * self.season_bins) % self.season_bins
+
+    def update(self, queue_length: float, timestamp: float):
+        """Update the model with a queue length at `timestamp` (epoch seconds). Messages older than the last one are ignored."""
+        offset = self.seasonal[self.season_bin(timestamp)] if self.seasonal else 0.0
+        state = self.state
+        if state is None:
+            self.state = (queue_length - offset, 0.0, timestamp)
+            return
+        level, trend, last = state
+        elapsed = timestamp - last
+        if elapsed <= 0:
+            return
+        alpha = 1 - 0.5 ** (elapsed / self.level_halflife)
+        beta = 1 - 0.5 ** (elapsed / self.trend_halflife)
+        new_level = alpha * (queue_length - offset) + (1 - alpha) * (level + trend * elapsed)
+        new_trend = beta * (new_level - level) / elapsed + (1 - beta) * trend
+        if self.seasonal:
+            # each bin is only updated while its time of the season passes, so its half-life counts the time spent in the bin
+            gamma = 1 - 0.5 ** (elapsed / (self.season_halflife * self.season / self.season_bins))
+            self.seasonal[self.season_bin(timestamp)] = gamma * (queue_length - new_level) + (1 - gamma) * offset
+        self.state = (new_level, new_trend, timestamp)
+
+    def forecast(self, horizon: float) -> Optional[float]:
+        """Forecast the queue length `horizon` seconds after the last message. None before the first message."""
+        state = self.state
+        if state is None:
+            return None
+        level, trend, last = state
+        offset = self.seasonal[self.season_bin(last + horizon)] if self.seasonal else 0.0
+        return max(0.0, level + trend * horizon + offset)
@@ -0,0 +1,24 @@
+import os
+import json
+from typing import Optional
+
+
+# JSON files shared between the MCP server and the queue management worker: the policy control channel, status,
+# rate estimates and timings. Files are replaced atomically, so the reader always sees a whole file.
+
+def read_json(path: str) -> Optional[dict]:
+    """Read a JSON file. Return None if it does not exist or is not valid JSON."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path: str, data: dict):
+    """Write a JSON file atomically."""
+    # write to a temporary file then rename, rename is atomic so readers never see a partial file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,56 @@
+import bisect
+from typing import TypedDict, Optional, List
+
+
+# Upper bounds of the latency buckets, in seconds
+DEFAULT_BUCKETS = [1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 240, 300, 450, 600]
+
+
+class LatencySummary(TypedDict):
+    count: int
+    mean: Optional[float] # in seconds
+    p50: Optional[float]
+    p90: Optional[float]
+    p99: Optional[float]
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket histogram of latencies in seconds. Memory is fixed by the buckets however many latencies are observed,
+    and quantiles are interpolated within the bucket they fall in.
+    """
+    def __init__(self, buckets: Optional[List[float]] = None):
+        self.buckets = sorted(buckets or DEFAULT_BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1) # last bucket counts latencies above the largest bound
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count = self.count + 1
+        self.sum = self.sum + value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate the q-quantile (0 - 1). None if nothing observed."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and (seen + count >= rank):
+                low = self.buckets[i - 1] if i > 0 else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(self.max, low + (high - low) * (rank - seen) / count)
+            seen = seen + count
+        return self.max
+
+    def summary(self) -> LatencySummary:
+        return LatencySummary(
+            count=self.count,
+            mean=self.sum / self.count if self.count else None,
+            p50=self.quantile(0.5),
+            p90=self.quantile(0.9),
+            p99=self.quantile(0.99),
+        )
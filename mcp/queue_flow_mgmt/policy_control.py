@@ -0,0 +1,128 @@
+import os
+import json
+import asyncio
+import threading
+from typing import TypedDict, Optional, Dict, List
+from json_file import read_json, write_json
+
+
+class PolicyUpdate(TypedDict):
+    version: int # increase on every published update
+    strategy: str # selected queue policy
+    config: Dict[str, dict] # configuration of all queue policies keyed by policy name
+
+class PolicyAck(TypedDict):
+    version: int # version of the policy update applied
+    tick: int # decision tick of the queue management loop the update took effect on
+
+
+class PolicyControl:
+    """
+    Control channel between the Queue_Flow_Management server and a running queue management loop.
+    The server publishes the selected policy and configuration of all policies as one versioned update, the loop picks up
+    the latest update at the start of its next decision tick and acknowledges the tick it took effect on.
+
+    Without `path`, the update and acknowledgement are kept in memory, for the loop running inside the server.
+    With `path`, they are written to `path` and `<path>.ack` JSON files, for the loop running as a subprocess.
+    Files are replaced atomically, so the reader always sees a whole update.
+    """
+    def __init__(self, strategy: str, config: Dict[str, dict], path: Optional[str] = None, watch_interval: float = 1):
+        self.path = path
+        self.ack_path = f"{path}.ack" if path else None
+        self.watch_interval = watch_interval # how often the loop checks the update file, in seconds
+        self.lock = threading.Lock()
+        self.subscribers: List[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+        self.watcher: Optional[asyncio.Task] = None
+        self.mtime: Optional[float] = None
+        self.ack: Optional[PolicyAck] = None
+        # continue from the version left by a previous run, so an old acknowledgement never match a new update
+        previous = read_json(self.path) if self.path else None
+        version = previous["version"] if previous else 0
+        self.update = PolicyUpdate(version=version, strategy=strategy, config=json.loads(json.dumps(config)))
+
+    def publish(self, strategy: str, config: Dict[str, dict]) -> int:
+        """Publish the selected policy and configuration of all policies as a new version. Return the new version."""
+        with self.lock:
+            update = PolicyUpdate(version=self.update["version"] + 1, strategy=strategy, config=json.loads(json.dumps(config)))
+            if self.path:
+                write_json(self.path, update)
+            # replace the whole update at once, so the loop never see a new strategy with an old configuration
+            self.update = update
+        self.notify()
+        return update["version"]
+
+    def notify(self):
+        """Set the event of every subscriber, in its own event loop."""
+        for loop, event in self.subscribers:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass # event loop already closed
+
+    def read(self) -> PolicyUpdate:
+        """Read the latest update. With `path`, reload the update file if it changed."""
+        if self.path:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                mtime = None
+            if (mtime is not None) and (mtime != self.mtime):
+                update = read_json(self.path)
+                if update and (update["version"] >= self.update["version"]):
+                    self.update = PolicyUpdate(**update)
+                self.mtime = mtime
+        return self.update
+
+    def applied(self, version: int, tick: int):
+        """Acknowledge the update `version` took effect on decision `tick`."""
+        ack = PolicyAck(version=version, tick=tick)
+        if self.ack_path:
+            write_json(self.ack_path, ack)
+        self.ack = ack
+
+    def read_ack(self) -> Optional[PolicyAck]:
+        if self.ack_path:
+            ack = read_json(self.ack_path)
+            return PolicyAck(**ack) if ack else None
+        return self.ack
+
+    async def wait_applied(self, version: int, timeout: float) -> Optional[int]:
+        """Wait until the update `version`, or a later one, is applied. Return the tick it took effect on, or None on timeout."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            ack = self.read_ack()
+            if (ack is not None) and (ack["version"] >= version):
+                return ack["tick"]
+            if loop.time() >= deadline:
+                return None
+            await asyncio.sleep(0.05)
+
+    def subscribe(self) -> asyncio.Event:
+        """
+        Get an asyncio event that is set on every published update. Must be called in the event loop waiting on the event.
+        With `path`, the update file is checked every `watch_interval` seconds by one watcher shared by all subscribers.
+        """
+        event = asyncio.Event()
+        with self.lock:
+            self.subscribers = [*self.subscribers, (asyncio.get_running_loop(), event)]
+            # start the watcher again if its event loop is gone
+            if self.path and ((self.watcher is None) or self.watcher.done()):
+                self.watcher = asyncio.get_running_loop().create_task(self.watch())
+        return event
+
+    def unsubscribe(self, event: asyncio.Event):
+        with self.lock:
+            self.subscribers = [subscriber for subscriber in self.subscribers if subscriber[1] is not event]
+            # the other subscribers still need the watcher
+            if (not self.subscribers) and (self.watcher is not None):
+                self.watcher.cancel()
+                self.watcher = None
+
+    async def watch(self):
+        version = self.update["version"]
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            if self.read()["version"] != version:
+                version = self.update["version"]
+                self.notify()
@@ -0,0 +1,135 @@
+import os
+from dotenv import load_dotenv
+from typing import TypedDict, Optional
+from queue_length import LaneQueueLengthSource, KafkaQueueLengthTailer, ReplayQueueLengthSource
+
+
+# Policy definitions and the queue length source, shared by the MCP server and the queue management worker.
+# Kept free of the MCP and Kafka client packages, so the worker starts without importing them.
+
+load_dotenv()
+
+class PolicyConfig(TypedDict):
+    arrival_rate: float
+    service_rate: float
+    min_devices: int = 1 # type: ignore
+    buffer: float = 0.2 # type: ignore # 0 - 1
+    target_wait: Optional[int] = 120 # type: ignore # in seconds
+    use_estimates: bool = False # type: ignore # decide with live estimates of arrival_rate and service_rate once available
+    horizon: Optional[int] = None # type: ignore # in seconds, predictive policy forecasts the queue length this long after boot_time
+    boot_time: Optional[int] = None # type: ignore # in seconds, time from power on until a device is serving
+    hysteresis: Optional[float] = None # type: ignore # in people, change devices only if the decision holds with the queue length half this band closer to no change
+
+
+# All policy available
+queue_policy = {
+    "energy_save": PolicyConfig(
+        arrival_rate=1.5,
+        service_rate=0.5,
+        min_devices=1,
+        buffer=0.2,
+        target_wait=None, # No target wait for energy save
+        use_estimates=False,
+        horizon=None,
+        boot_time=None,
+        hysteresis=2 # ignore queue length noise of +/- 1 person
+    ),
+    "min_wait": PolicyConfig(
+        arrival_rate=1.5,
+        service_rate=0.5,
+        min_devices=1,
+        buffer=0.2,
+        target_wait=120,
+        use_estimates=False,
+        horizon=None,
+        boot_time=None,
+        hysteresis=None
+    ),
+    "erlang_c": PolicyConfig(
+        arrival_rate=1.5,
+        service_rate=0.5,
+        min_devices=1,
+        buffer=0.2,
+        target_wait=120, # M/M/c wait time target
+        use_estimates=False,
+        horizon=None,
+        boot_time=None,
+        hysteresis=None
+    ),
+    "predictive": PolicyConfig(
+        arrival_rate=1.5,
+        service_rate=0.5,
+        min_devices=1,
+        buffer=0.2,
+        target_wait=120,
+        use_estimates=False,
+        horizon=60, # forecast 60 seconds after the devices powered on now start serving
+        boot_time=90,
+        hysteresis=None
+    ),
+}
+
+# Default policy
+selected_policy = [*queue_policy][0]
+
+# Policies sizing the devices to meet target_wait, they cannot decide without one
+target_wait_policies = ["min_wait", "erlang_c", "predictive"]
+
+def policy_config_error(policy: str, config: dict) -> Optional[str]:
+    """Check a policy configuration the policy can decide with. Return the error, None if valid."""
+    target_wait = config.get("target_wait")
+    if (policy in target_wait_policies) and ((target_wait is None) or (target_wait <= 0)):
+        return f"Policy {policy} requires a positive target_wait in seconds, got {target_wait}."
+    return None
+
+# Queue length source
+kafka_timeout = int(os.getenv("kafka_timeout", 10)) # in seconds
+kafka_max_age = float(os.getenv("kafka_max_age", 30)) # queue length older than this is not fresh, in seconds
+kafka_topics = os.getenv("kafka_topics", "people-count").split(",") # people-count topics, all partitions are read
+kafka_aggregator = os.getenv("kafka_aggregator", "sum") # combine queue length of all lanes by "sum", "max" or "latest"
+queue_length_source = os.getenv("queue_length_source", "kafka") # "kafka", or "replay" the trace at queue_length_replay
+queue_length_replay = os.getenv("queue_length_replay", "") # JSON lines of people-count messages or CSV, see backtest.py
+queue_length_replay_speed = float(os.getenv("queue_length_replay_speed", 1)) # replay this many times faster than recorded
+queue_length_replay_interval = float(os.getenv("queue_length_replay_interval", 1)) # seconds between samples of a trace without timestamps
+queue_length_replay_repeat = os.getenv("queue_length_replay_repeat", "false").lower() == "true" # start over once the trace is replayed
+kafka_broker = os.getenv("kafka_broker", "localhost:9092") # broker of the people-count topics
+kafka_consumer_group = os.getenv("kafka_consumer_group", "retail")
+
+# Runtime state of the server and the worker: logs, status, policy control, estimates, metrics, timings, spans and tick history (41 MB per site)
+qflow_data_dir = os.getenv("qflow_data_dir", os.path.join(os.getenv("XDG_STATE_HOME", os.path.join(os.path.expanduser("~"), ".local", "state")), "queueflow"))
+
+queue_length_tailer: Optional[LaneQueueLengthSource] = None
+
+def get_queue_length_tailer() -> LaneQueueLengthSource:
+    """
+    Background source holding the latest queue length of each lane, selected by queue_length_source and created once per process.
+    The Kafka client is only imported when the Kafka source is created.
+    """
+    global queue_length_tailer
+    if queue_length_tailer is None:
+        if queue_length_source == "replay":
+            queue_length_tailer = ReplayQueueLengthSource(
+                queue_length_replay,
+                speed=queue_length_replay_speed,
+                interval=queue_length_replay_interval,
+                repeat=queue_length_replay_repeat,
+                aggregator=kafka_aggregator,
+                max_age=kafka_max_age,
+            )
+        else:
+            from quixstreams import Application
+            # Configure an Kafka Application.
+            # The config params will be used for the Consumer instance too.
+            kafka_app = Application(
+                broker_address=kafka_broker,
+                consumer_group=kafka_consumer_group,
+                auto_offset_reset="latest",
+            )
+            queue_length_tailer = KafkaQueueLengthTailer(
+                kafka_app,
+                topics=[topic.strip() for topic in kafka_topics if topic.strip()],
+                aggregator=kafka_aggregator,
+                watermark_timeout=kafka_timeout,
+                max_age=kafka_max_age,
+            )
+    return queue_length_tailer
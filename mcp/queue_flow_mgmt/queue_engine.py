@@ -0,0 +1,101 @@
+import asyncio
+from typing import Optional, List
+from queue_length import QueueLengthSource
+from policy_control import PolicyControl
+from rate_estimator import RateEstimator
+from tick_trace import TickTracer
+
+
+class QueueManagementEngine:
+    """
+    Run the queue management loop as an asyncio task inside the Queue_Flow_Management server, instead of a `uv run` subprocess.
+    The loop shares the server's Kafka tailer, and keeps the DMT client, token and device inventory between start and stop,
+    so start and stop take milliseconds and the status is read from memory.
+    Policy updates published on `control` are applied by the running loop without restart.
+    Engines of several sites run concurrently in the same event loop, each on its own queue length view and device pool.
+    """
+    # authorize and discover once, even if engines of several sites start together
+    discovery_lock: Optional[tuple[asyncio.AbstractEventLoop, asyncio.Lock]] = None
+
+    def __init__(
+            self,
+            tailer: QueueLengthSource,
+            control: Optional[PolicyControl] = None,
+            estimator: Optional[RateEstimator] = None,
+            devices: Optional[List[str]] = None,
+            name: str = "queue-management",
+            history_path: Optional[str] = None,
+            tracer: Optional[TickTracer] = None,
+            exclude_devices: Optional[List[str]] = None,
+        ):
+        self.tailer = tailer
+        self.control = control
+        self.estimator = estimator
+        self.devices = devices # device pool of the site, all devices but exclude_devices if None
+        self.exclude_devices = exclude_devices # devices claimed by other sites
+        self.name = name
+        self.history_path = history_path # tick history file written by the loop, none if None
+        self.tracer = tracer
+        self.task: Optional[asyncio.Task] = None
+        self.strategy: Optional[str] = None
+        self.error: Optional[str] = None
+
+    def is_running(self) -> bool:
+        return (self.task is not None) and not self.task.done()
+
+    def start(self, strategy: str, config: str):
+        """Start the queue management loop. Must be called from the running event loop."""
+        if self.is_running():
+            raise RuntimeError("The engine already started.")
+        self.strategy = strategy
+        self.error = None
+        self.task = asyncio.get_running_loop().create_task(self.run(strategy, config), name=self.name)
+        self.task.add_done_callback(self.on_done)
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+        self.task = None
+
+    async def run(self, strategy: str, config: str):
+        # imported on first start, the server does not need the DMT utilities unless the engine is used
+        import dmt_utils
+        from queue_management_utils import manage_queue, history_capacity
+        from tick_history import TickHistory
+
+        print(f"Start Queue management engine ({self.name})", flush=True)
+        print("===========================================================", flush=True)
+        # the DMT token and device inventory are kept between runs, only authorize and discover on first start
+        loop = asyncio.get_running_loop()
+        if (QueueManagementEngine.discovery_lock is None) or (QueueManagementEngine.discovery_lock[0] is not loop):
+            QueueManagementEngine.discovery_lock = (loop, asyncio.Lock())
+        async with QueueManagementEngine.discovery_lock[1]:
+            if not isinstance(getattr(dmt_utils, "all_device", None), dict):
+                await dmt_utils.authorize()
+                await dmt_utils.get_all_device()
+                print("===========================================================", flush=True)
+        history = TickHistory(self.history_path, capacity=history_capacity) if self.history_path else None
+        try:
+            await manage_queue(strategy=strategy, config=config, tailer=self.tailer, control=self.control, estimator=self.estimator, devices=self.devices, history=history, tracer=self.tracer, exclude_devices=self.exclude_devices)
+        finally:
+            if history is not None:
+                history.close()
+
+    def on_done(self, task: asyncio.Task):
+        if task.cancelled():
+            print(f"Stop Queue management engine ({self.name})", flush=True)
+            print("===========================================================", flush=True)
+            return
+        error = task.exception()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+            print(self.error, flush=True)
+
+    def status(self) -> tuple[bool, str]:
+        """Get whether the loop is running and a status message."""
+        if self.is_running():
+            strategy = self.control.read()["strategy"] if self.control is not None else self.strategy
+            return True, f"Queue management engine running smooth with policy {strategy}."
+        if self.task is None:
+            return False, "The process not running."
+        return False, f"Queue management engine stopped. {self.error or ''}".strip()
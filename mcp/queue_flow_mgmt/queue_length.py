@@ -0,0 +1,446 @@
+import os
+import sys
+import abc
+import json
+import time
+import asyncio
+import threading
+from typing import TypedDict, Optional, Dict, List, Callable, TYPE_CHECKING
+# metrics are shared by the MCP servers and the agent, imported from the package at the repository root
+repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if repo_dir not in sys.path:
+    sys.path.append(repo_dir)
+from queueflow_device_manager.metrics import Counter, Gauge
+
+if TYPE_CHECKING:
+    # the Kafka client is imported when consuming, so the other sources do not need it
+    from quixstreams import Application
+
+
+# Metrics of the people-count consumer, served at /metrics
+kafka_messages = Counter("kafka_messages_total", "People-count messages consumed.", ["topic"])
+kafka_consumer_lag = Gauge("kafka_consumer_lag_messages", "Messages behind the high watermark of each people-count partition.", ["partition"])
+
+
+class QueueLengthResult(TypedDict):
+    success: bool
+    message: str # queue length, or error message if not success
+    timestamp: Optional[float] # time of the people-count message in epoch seconds, the oldest lane for "sum" and "max"
+    age: Optional[float] # seconds since the people-count message
+    is_fresh: bool # age is within max_age
+    updated_at: Optional[float] # time of the newest people-count message of any lane, in epoch seconds
+
+class LaneQueueLength(TypedDict):
+    queue_length: int
+    timestamp: float # time of the people-count message in epoch seconds
+    age: float # seconds since the people-count message
+    is_fresh: bool # age is within max_age
+
+
+def aggregate_sum(lanes: List[tuple[int, float]]) -> tuple[int, float]:
+    # the total is only as fresh as the oldest lane
+    return sum(value for value, _ in lanes), min(timestamp for _, timestamp in lanes)
+
+def aggregate_max(lanes: List[tuple[int, float]]) -> tuple[int, float]:
+    return max(value for value, _ in lanes), min(timestamp for _, timestamp in lanes)
+
+def aggregate_latest(lanes: List[tuple[int, float]]) -> tuple[int, float]:
+    return max(lanes, key=lambda lane: lane[1])
+
+# All aggregators available to combine the queue length of each lane
+aggregators = {
+    "sum": aggregate_sum,
+    "max": aggregate_max,
+    "latest": aggregate_latest,
+}
+
+def lane_id(msg) -> str:
+    """Lane of a people-count message: the message key (camera or lane name) if any, otherwise its topic and partition."""
+    key = msg.key()
+    if key:
+        return key.decode("utf-8") if isinstance(key, bytes) else str(key)
+    return f"{msg.topic()}:{msg.partition()}"
+
+
+class QueueLengthSource(abc.ABC):
+    """
+    Latest queue length of each lane, combined by the aggregator: "sum", "max" or "latest".
+    Notifies subscribed asyncio events and calls listeners on every new queue length.
+    The loop reads the time with now() and waits with sleep(), so a source replaying a trace faster than recorded speeds it up too.
+    """
+    error: Optional[str] = None # last error reading the queue length, None once a queue length is read again
+    wall_clock: bool = True # now() is the wall time, False for a source with its own clock, e.g. a replay
+
+    def __init__(self, aggregator: str = "sum", max_age: float = 30):
+        if aggregator not in aggregators:
+            raise ValueError(f"Unknown aggregator: {aggregator}. Supported aggregators: {', '.join(aggregators)}")
+        self.aggregator = aggregator
+        self.max_age = max_age # in seconds
+        self.subscribers: List[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+        self.listeners: List[Callable[[int, float], None]] = []
+        self.lock = threading.Lock()
+
+    @abc.abstractmethod
+    def current_lanes(self) -> Dict[str, tuple[int, float]]:
+        """Latest queue length and its timestamp, keyed by lane."""
+
+    def now(self) -> float:
+        """Current time in epoch seconds, the age of the queue length is measured against it."""
+        return time.time()
+
+    async def sleep(self, seconds: float):
+        """Wait `seconds` of the source clock."""
+        await asyncio.sleep(seconds)
+
+    @abc.abstractmethod
+    async def read_latest(self, timeout: float) -> QueueLengthResult:
+        """Read the latest queue length, waiting at most `timeout` seconds for the first one."""
+
+    def subscribe(self) -> asyncio.Event:
+        """Get an asyncio event that is set on every new queue length. Must be called in the event loop waiting on the event."""
+        event = asyncio.Event()
+        with self.lock:
+            self.subscribers = [*self.subscribers, (asyncio.get_running_loop(), event)]
+        return event
+
+    def unsubscribe(self, event: asyncio.Event):
+        with self.lock:
+            self.subscribers = [subscriber for subscriber in self.subscribers if subscriber[1] is not event]
+
+    def add_listener(self, listener: Callable[[int, float], None]):
+        """Call `listener(queue_length, timestamp)` with the combined queue length of all lanes on every message, in the consumer thread."""
+        with self.lock:
+            self.listeners = [*self.listeners, listener]
+
+    def remove_listener(self, listener: Callable[[int, float], None]):
+        with self.lock:
+            self.listeners = [existing for existing in self.listeners if existing is not listener]
+
+    def notify(self):
+        for loop, event in self.subscribers:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass # event loop already closed
+
+    def publish(self, lanes: Dict[str, tuple[int, float]], timestamp: float):
+        """Call the listeners with the combined queue length and notify the subscribers of a new queue length at `timestamp`."""
+        listeners = self.listeners
+        if listeners and lanes:
+            value, _ = aggregators[self.aggregator](list(lanes.values()))
+            for listener in listeners:
+                try:
+                    listener(value, timestamp)
+                except Exception as e:
+                    print(f"Queue length listener error: {e}", flush=True)
+        self.notify()
+
+    def read(self) -> QueueLengthResult:
+        """Read the latest queue length of all lanes combined by the aggregator from memory."""
+        lanes, error = self.current_lanes(), self.error
+        if not lanes:
+            return QueueLengthResult(
+                success=False,
+                message=error or "No latest queue length.",
+                timestamp=None,
+                age=None,
+                is_fresh=False,
+                updated_at=None
+            )
+        value, timestamp = aggregators[self.aggregator](list(lanes.values()))
+        age = max(0.0, self.now() - timestamp)
+        return QueueLengthResult(
+            success=True,
+            message=f"{value}",
+            timestamp=timestamp,
+            age=age,
+            is_fresh=age <= self.max_age,
+            updated_at=max(lane_timestamp for _, lane_timestamp in lanes.values())
+        )
+
+    def read_lanes(self) -> Dict[str, LaneQueueLength]:
+        """Read the latest queue length of each lane from memory."""
+        now = self.now()
+        lanes = {}
+        for lane, (value, timestamp) in sorted(self.current_lanes().items()):
+            age = max(0.0, now - timestamp)
+            lanes[lane] = LaneQueueLength(queue_length=value, timestamp=timestamp, age=age, is_fresh=age <= self.max_age)
+        return lanes
+
+
+class LaneQueueLengthSource(QueueLengthSource):
+    """
+    Source holding the latest queue length of each lane in memory, fed by a background thread started on first read.
+    The queue length of all lanes are combined by the aggregator: "sum", "max" or "latest".
+    Views of a subset of lanes share the source, e.g. one view for the cameras of each site.
+    """
+    thread_name = "queue-length-source"
+
+    def __init__(self, aggregator: str = "sum", max_age: float = 30):
+        super().__init__(aggregator=aggregator, max_age=max_age)
+        self.lanes: Dict[str, tuple[int, float]] = {} # latest queue length and its timestamp, keyed by lane
+        self.received = threading.Event() # set once the first queue length is received
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.started_at: Optional[float] = None
+        self.views: List["QueueLengthView"] = []
+
+    def start(self):
+        """Start the background thread. Does nothing if it is already running."""
+        with self.lock:
+            if (self.thread is not None) and self.thread.is_alive():
+                return
+            self.stopped.clear()
+            self.started_at = time.monotonic()
+            self.thread = threading.Thread(target=self.run, name=self.thread_name, daemon=True)
+            self.thread.start()
+
+    @abc.abstractmethod
+    def run(self):
+        """Feed the lanes with update_lane() until `stopped` is set, in the background thread."""
+
+    def wait_ready(self, timeout: float) -> bool:
+        """Wait until the first queue length is received, at most `timeout` seconds after the source started."""
+        remaining = (self.started_at or time.monotonic()) + timeout - time.monotonic()
+        return self.received.wait(max(0.0, remaining))
+
+    async def read_latest(self, timeout: float) -> QueueLengthResult:
+        """Start the source if needed and read the latest queue length. Only wait, at most `timeout` seconds after start, until the first queue length is received."""
+        self.start()
+        if not self.received.is_set():
+            await asyncio.to_thread(self.wait_ready, timeout)
+        return self.read()
+
+    def current_lanes(self) -> Dict[str, tuple[int, float]]:
+        return self.lanes
+
+    def view(self, lanes: Optional[List[str]] = None, aggregator: Optional[str] = None) -> "QueueLengthView":
+        """Get a view of the queue length of the given lanes (all lanes if None), sharing this source."""
+        view = QueueLengthView(self, lanes, aggregator or self.aggregator)
+        with self.lock:
+            self.views = [*self.views, view]
+        return view
+
+    def stop(self, timeout: float = 5):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout=timeout)
+
+    def update_lane(self, lane: str, queue_length: int, timestamp: float):
+        """Record a new queue length of a lane, then notify the listeners and subscribers of this source and of the views of the lane."""
+        # copy on write, so readers never see a half updated lanes
+        lanes = dict(self.lanes)
+        lanes[lane] = (queue_length, timestamp)
+        self.lanes = lanes
+        self.error = None
+        self.received.set()
+        self.publish(lanes, timestamp)
+        for view in self.views:
+            if view.matches(lane):
+                view.publish(view.current_lanes(), timestamp)
+
+
+class KafkaQueueLengthTailer(LaneQueueLengthSource):
+    """
+    Background consumer that keeps reading all partitions of the people-count topics and holds the latest queue length
+    of each lane in memory, so reading the queue length does not need to create a consumer, fetch watermarks and poll on every call.
+    """
+    thread_name = "kafka-tailer"
+
+    def __init__(
+            self,
+            app: "Application",
+            topics: Optional[List[str]] = None,
+            aggregator: str = "sum",
+            watermark_timeout: float = 10,
+            max_age: float = 30,
+        ):
+        super().__init__(aggregator=aggregator, max_age=max_age)
+        self.app = app
+        self.topics = topics or ["people-count"]
+        self.watermark_timeout = watermark_timeout # in seconds
+        Gauge("kafka_message_age_seconds", "Seconds since the latest people-count message of each lane.", ["lane"],
+              collect=lambda: {(lane,): lane_length["age"] for lane, lane_length in self.read_lanes().items()})
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.consume()
+            except Exception as e:
+                self.error = f"Kafka consumer error: {e}"
+                print(self.error, flush=True)
+                # back off before reconnecting
+                self.stopped.wait(1)
+
+    def consume(self):
+        from confluent_kafka import TopicPartition
+        with self.app.get_consumer() as consumer:
+            # start every partition from its last message, so the latest queue length of each lane is available right away
+            assignment = []
+            for topic in self.topics:
+                metadata = consumer.list_topics(topic, timeout=self.watermark_timeout)
+                for partition in metadata.topics[topic].partitions:
+                    low, high = consumer.get_watermark_offsets(TopicPartition(topic, partition), timeout=self.watermark_timeout)
+                    assignment.append(TopicPartition(topic, partition, max(high - 1, low)))
+            consumer.assign(assignment)
+
+            while not self.stopped.is_set():
+                msg = consumer.poll(1.0)
+                if msg is None:
+                    continue
+                if msg.error():
+                    self.error = f"Kafka error: {msg.error()}"
+                    continue
+                self.update(msg)
+                # Storing offset only after the message is processed enables at-least-once delivery guarantees.
+                # Malformed messages are stored too, so they are not read again on every reconnect.
+                consumer.store_offsets(message=msg)
+                self.record_lag(consumer, msg)
+
+    def record_lag(self, consumer, msg):
+        from confluent_kafka import TopicPartition
+        kafka_messages.inc(topic=msg.topic())
+        try:
+            # cached watermark from the consumer statistics, no broker round trip per message
+            _, high = consumer.get_watermark_offsets(TopicPartition(msg.topic(), msg.partition()), cached=True)
+        except Exception:
+            return
+        if high >= 0:
+            kafka_consumer_lag.set(max(0, high - msg.offset() - 1), partition=f"{msg.topic()}:{msg.partition()}")
+
+    def update(self, msg) -> bool:
+        """Record the queue length of a people-count message. Return False, with the error recorded, if the message is malformed."""
+        try:
+            value = json.loads(msg.value().decode("utf-8")) # type: ignore
+            queue_length = int(value["queue_count"])
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.error = f"Malformed people-count message at {msg.topic()}:{msg.partition()}: {type(e).__name__}: {e}"
+            print(self.error, flush=True)
+            return False
+        timestamp_type, timestamp_ms = msg.timestamp()
+        timestamp = timestamp_ms / 1000 if timestamp_type and (timestamp_ms > 0) else time.time()
+        self.update_lane(lane_id(msg), queue_length, timestamp)
+        return True
+
+
+class MemoryQueueLengthSource(LaneQueueLengthSource):
+    """Queue length pushed by the caller instead of read from Kafka, e.g. by a test or a benchmark driving the loop without a broker."""
+    def start(self):
+        # nothing to run, queue lengths arrive through push()
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+
+    def run(self):
+        pass
+
+    def push(self, queue_length: int, timestamp: Optional[float] = None, lane: str = "default"):
+        """Record a new queue length of a lane, at `timestamp` (epoch seconds) or now."""
+        self.update_lane(lane, int(queue_length), timestamp if timestamp is not None else self.now())
+
+
+class ReplayQueueLengthSource(LaneQueueLengthSource):
+    """
+    Replay a recorded queue length trace (JSON lines of people-count messages or CSV, see backtest.load_trace) as one lane,
+    `speed` times faster than recorded. Samples keep their recorded timestamps (or `interval` seconds apart from the start
+    if not recorded) and the source clock runs `speed` times faster from the first sample, so ages, rate estimates and
+    forecasts see the recorded timing. With `repeat`, the trace starts over once finished, shifted by its duration.
+    """
+    thread_name = "queue-length-replay"
+    wall_clock = False
+
+    def __init__(
+            self,
+            path: str,
+            speed: float = 1.0,
+            interval: float = 1.0,
+            repeat: bool = False,
+            lane: str = "replay",
+            aggregator: str = "sum",
+            max_age: float = 30,
+        ):
+        super().__init__(aggregator=aggregator, max_age=max_age)
+        if speed <= 0:
+            raise ValueError("Replay speed must be positive.")
+        # the trace loader of the backtest, imported on use as it needs numpy
+        from backtest import load_trace
+        queue_length, timestamps = load_trace(path)
+        if len(queue_length) == 0:
+            raise ValueError(f"No queue length in trace: {path}")
+        self.queue_length = [int(round(value)) for value in queue_length]
+        self.recorded = timestamps is not None
+        self.timestamps = [float(timestamp) for timestamp in timestamps] if timestamps is not None else [i * interval for i in range(len(queue_length))]
+        self.interval = interval
+        self.speed = speed
+        self.repeat = repeat
+        self.lane = lane
+        self.finished = threading.Event() # set once the whole trace is replayed, never with repeat
+        self.origin: Optional[tuple[float, float]] = None # wall time and trace time the replay started at
+
+    def start(self):
+        # a finished replay keeps its last queue length, it is not replayed again on the next read
+        if not self.finished.is_set():
+            super().start()
+
+    def now(self) -> float:
+        if self.origin is None:
+            return time.time()
+        wall, trace = self.origin
+        return trace + (time.time() - wall) * self.speed
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds / self.speed)
+
+    def run(self):
+        # traces without timestamps start now
+        offset = 0.0 if self.recorded else time.time()
+        self.origin = (time.time(), self.timestamps[0] + offset)
+        while not self.stopped.is_set():
+            for value, timestamp in zip(self.queue_length, self.timestamps):
+                delay = (timestamp + offset - self.now()) / self.speed
+                if (delay > 0) and self.stopped.wait(delay):
+                    return
+                self.update_lane(self.lane, value, timestamp + offset)
+            if not self.repeat:
+                self.finished.set()
+                return
+            offset = offset + self.timestamps[-1] - self.timestamps[0] + self.interval
+
+
+class QueueLengthView(QueueLengthSource):
+    """
+    Queue length of a subset of the lanes read by a shared source, e.g. the cameras of one site.
+    Subscribers and listeners are only notified on messages of the view's lanes.
+    """
+    def __init__(self, tailer: LaneQueueLengthSource, lanes: Optional[List[str]] = None, aggregator: str = "sum"):
+        super().__init__(aggregator=aggregator, max_age=tailer.max_age)
+        self.tailer = tailer
+        self.lanes = set(lanes) if lanes else None # None for all lanes
+
+    def matches(self, lane: str) -> bool:
+        return (self.lanes is None) or (lane in self.lanes)
+
+    def current_lanes(self) -> Dict[str, tuple[int, float]]:
+        lanes = self.tailer.lanes
+        if self.lanes is None:
+            return lanes
+        return {lane: value for lane, value in lanes.items() if lane in self.lanes}
+
+    @property
+    def error(self) -> Optional[str]: # type: ignore
+        # errors come from the shared source
+        return self.tailer.error
+
+    @property
+    def wall_clock(self) -> bool: # type: ignore
+        return self.tailer.wall_clock
+
+    def now(self) -> float:
+        return self.tailer.now()
+
+    async def sleep(self, seconds: float):
+        await self.tailer.sleep(seconds)
+
+    async def read_latest(self, timeout: float) -> QueueLengthResult:
+        """Start the shared source if needed and read the latest queue length of the view's lanes."""
+        await self.tailer.read_latest(timeout)
+        return self.read()
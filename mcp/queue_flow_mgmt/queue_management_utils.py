@@ -1,18 +1,64 @@
 import os
 import sys
-import time
 import argparse
 import json
+import math
+import time
 import asyncio
+from typing import Optional, Callable, Awaitable, Dict, List
 import dmt_utils
 from dotenv import load_dotenv
-from server import queue_policy, get_queue_length
+from queue_core import queue_policy, kafka_timeout, get_queue_length_tailer
+from queue_length import QueueLengthSource
+from policy_control import PolicyControl
+from rate_estimator import RateEstimator
+from forecast import QueueForecaster
+from flap_guard import FlapGuard
+from tick_history import TickHistory
+from worker_log import RotatingLog, write_status
+# metrics are shared by the MCP servers and the agent, imported from the package at the repository root
+repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if repo_dir not in sys.path:
+    sys.path.append(repo_dir)
+from queueflow_device_manager.metrics import Histogram, Counter, write_metrics
+import tick_trace
+from tick_trace import TickTracer, TickTrace, STAGES
 
 
 load_dotenv()
 
 global kafka_interval
 kafka_interval = int(os.getenv("kafka_interval", 3)) # in seconds
+queue_management_mode = os.getenv("queue_management_mode", "event") # "event": decide on new queue length, "poll": decide every kafka_interval
+kafka_debounce = float(os.getenv("kafka_debounce", 0.5)) # wait for burst of queue length to settle before deciding, in seconds
+kafka_heartbeat = float(os.getenv("kafka_heartbeat", 60)) # decide at least this often without new queue length, in seconds
+estimator_halflife = float(os.getenv("estimator_halflife", 900)) # queue samples older than this count half in rate estimates, in seconds
+forecast_level_halflife = float(os.getenv("forecast_level_halflife", 60)) # in seconds
+forecast_trend_halflife = float(os.getenv("forecast_trend_halflife", 300)) # in seconds
+forecast_season = float(os.getenv("forecast_season", 0)) # length of the seasonal pattern in seconds, e.g. 86400 for daily, 0 disables it
+forecast_season_bins = int(os.getenv("forecast_season_bins", 96))
+default_boot_time = float(os.getenv("default_boot_time", 90)) # time from power on until a device is serving, in seconds
+history_capacity = int(os.getenv("history_capacity", 30 * 86400)) # decision ticks kept in the tick history file, 16 bytes each
+log_max_bytes = int(os.getenv("log_max_bytes", 10 * 1024 * 1024)) # rotate the worker log at this size
+log_max_age = float(os.getenv("log_max_age", 86400)) # rotate the worker log after this long, in seconds, 0 to rotate on size only
+log_backups = int(os.getenv("log_backups", 5)) # rotated worker logs kept
+min_on_time = float(os.getenv("min_on_time", 60)) # a device powered on is not powered off before this, in seconds
+min_off_time = float(os.getenv("min_off_time", 30)) # a device powered off is not powered on before this, in seconds
+max_power_actions_per_minute = int(os.getenv("max_power_actions_per_minute", 20)) # power actions across all devices, 0 for no limit
+metrics_interval = float(os.getenv("metrics_interval", 5)) # write the metrics and timings files for the server this often, in seconds
+estimates_interval = float(os.getenv("estimates_interval", 5)) # write the rate estimates file for the server at most this often, in seconds
+erlang_b_precision = int(os.getenv("erlang_b_precision", 3)) # offered load is rounded to this many decimals to share Erlang-B tables across ticks
+erlang_b_max_tables = int(os.getenv("erlang_b_max_tables", 256)) # Erlang-B tables kept, the oldest is dropped first
+
+# kept across restarts of the loop in the server process, so a restart does not reset dwell times
+flap_guard = FlapGuard(min_on_time=min_on_time, min_off_time=min_off_time, max_actions_per_minute=max_power_actions_per_minute)
+
+# Metrics of the decision loop, served at /metrics
+tick_duration = Histogram("qflow_tick_duration_seconds", "Time from reading the queue length to the end of the power actions of a decision tick.")
+power_actions = Counter("qflow_power_actions_total", "Power actions of the decision loop by action and outcome.", ["action", "outcome"])
+skipped_decisions = Counter("qflow_skipped_decisions_total", "Decision ticks skipped as queue length and device state not change.")
+Counter("qflow_suppressed_power_actions_total", "Power actions held back by dwell time, action rate limit or hysteresis band.", ["reason"],
+        collect=lambda: {(reason,): count for reason, count in flap_guard.suppressed.items()})
 
     
 def energy_save(
@@ -24,18 +70,24 @@ def energy_save(
         min_devices: int = 1,
         buffer = 0.2,
         target_wait = None,
+        in_flight: int = 0,
     ) -> int:
-    if (current_active < min_devices):
+    # devices powering on count as active
+    committed = current_active + in_flight
+    if (committed < min_devices):
         return min_devices 
     
     offered_load = arrival_rate / service_rate   
     buffer = max(1, buffer * offered_load)  # Dynamic buffer (20% of N)
     
-    if current_active < max_devices and queue_length > (offered_load + buffer):
-        return current_active + 1
-    elif current_active > min_devices and queue_length < (offered_load - buffer):
-        return current_active - 1
-    return current_active
+    if committed < max_devices and queue_length > (offered_load + buffer):
+        # the queue stays long while devices boot, wait for them to serve before adding another one
+        if in_flight > 0:
+            return committed
+        return committed + 1
+    elif committed > min_devices and queue_length < (offered_load - buffer):
+        return committed - 1
+    return committed
 
 def min_wait(
         queue_length: int, 
@@ -46,10 +98,12 @@ def min_wait(
         min_devices: int = 1,
         buffer = 0.2,
         target_wait = 120,
+        in_flight: int = 0,
     ) -> int:
     """
     Dynamically adjusts active devices to maintain wait times below target.
     Expands when wait exceeds target, reduces when system is underutilized.
+    Wait is estimated with the serving devices (current_active), while devices powering on (in_flight) count towards the devices required.
     """
     # Convert target to minutes
     target_min = target_wait / 60
@@ -63,96 +117,443 @@ def min_wait(
     current_wait = float('inf') if net_capacity <= 0 else queue_length / net_capacity
     
     # 1. Reduce devices if underutilized and safe
-    if current_active > min_devices:
+    committed = current_active + in_flight
+    if committed > min_devices:
         reduction_threshold = target_min * (1 - buffer)
         if utilization < 0.7 and current_wait < reduction_threshold:
             # Test with one less device
-            test_capacity = (current_active - 1) * service_rate - arrival_rate
+            test_capacity = (committed - 1) * service_rate - arrival_rate
             if test_capacity > 0 and queue_length / test_capacity <= target_min:
-                return current_active - 1
+                return committed - 1
     
     # 2. Add devices if wait exceeds target
     if current_wait > target_min or utilization >= 1:
         # Find minimum devices that meet wait target
-        for devices in range(current_active + 1, max_devices + 1):
+        def meets_target(devices: int) -> bool:
             test_capacity = devices * service_rate - arrival_rate
-            if test_capacity > 0 and queue_length / test_capacity <= target_min:
-                return devices
-        return max_devices  # Return max if target can't be met
+            return test_capacity > 0 and queue_length / test_capacity <= target_min
+        devices = search_devices(meets_target, committed, max_devices)
+        return devices if devices is not None else max_devices  # Return max if target can't be met
     
     # 3. Maintain current configuration
-    return current_active
+    return committed
 
-def calculate_devices(strategy: str, arrival_rate, service_rate, queue_length, current_active, max_devices, min_devices, buffer, target_wait):
-    if strategy.lower() == "energy_save":
-        return energy_save(queue_length, arrival_rate, service_rate, current_active, max_devices, min_devices, buffer, target_wait)
-    elif strategy.lower() == "min_wait":
-        return min_wait(queue_length, arrival_rate, service_rate, current_active, max_devices, min_devices, buffer, target_wait)
-    raise ValueError(f"Unknown strategy: {strategy}")
+def search_devices(meets_target: Callable[[int], bool], low: int, high: int) -> Optional[int]:
+    """
+    Binary search the minimum devices in [low, high] that meet the target. meets_target must be monotonic,
+    i.e. once a device count meets the target, every larger count does too. Return None if high does not meet the target.
+    """
+    if (low > high) or not meets_target(high):
+        return None
+    while low < high:
+        mid = (low + high) // 2
+        if meets_target(mid):
+            high = mid
+        else:
+            low = mid + 1
+    return low
 
-def manage_queue(strategy: str, config: str):
-    while True:
-        queue_length_result = asyncio.run(get_queue_length())
-        # if fail to get queue_length, raise error
-        if not queue_length_result["success"]:
-            raise Exception(f"Failed to get queue length. {queue_length_result['message']}. {e}")
-        queue_length = int(queue_length_result["message"])
-        print(f"Queue Length: {queue_length}", flush=True)
-
-        all_device = dmt_utils.all_device
-        # if get error message instead of device list
-        if isinstance(all_device, str): 
-            raise Exception(f"Failed to get available device. {all_device}")
-        max_devices = len(all_device)
-        print(f"Max Devices: {max_devices}", flush=True)
-
-        policies = json.loads(config)
-        arrival_rate, service_rate, min_devices, buffer, target_wait = policies[strategy].values()
-        print(f"Min Devices: {min_devices}", flush=True)
-        print(f"Arrival Rate: {arrival_rate}", flush=True)
-        print(f"Service Rate: {service_rate}", flush=True)
-        print(f"Buffer: {buffer}", flush=True)
-        print(f"Target Wait: {target_wait} {'seconds' if target_wait else ''}", flush=True)
-        print(f"Strategy: {strategy}", flush=True)
-
-        current_active = 0
-        active_devices = []
-        inactive_devices = []
-        for device_name in all_device.keys():
-            if all_device[device_name]["pwr_status"] == "on":
-                active_devices.append(device_name)
-                current_active = current_active + 1
-            else:
-                inactive_devices.append(device_name)
-        print(f"Current Active: {current_active}", flush=True)
-
-        try:
-            device_required = calculate_devices(strategy, arrival_rate, service_rate, queue_length, current_active, max_devices, min_devices, buffer, target_wait)
-            print(f"Device Required: {device_required}", flush=True)
-        except Exception as e:
-            raise Exception(f"Failed to get device required. {e}")
-
-        # perform power action if device_required != current_active
-        results = []
-        if device_required > current_active:
-            diff = device_required - current_active
-            print(f"Power on devices: {','.join(inactive_devices[:diff])}", flush=True)
-            results = asyncio.run(dmt_utils.power_on_devices(inactive_devices[:diff]))
-        if device_required < current_active:
-            diff = current_active - device_required
-            print(f"Power off devices: {','.join(active_devices[:diff])}", flush=True)
-            results = asyncio.run(dmt_utils.power_off_devices(active_devices[:diff]))
-
-        # check power action results
-        for result in results:
-            guid, dev_id, success, message = result.values()
-            if success:
-                print(f"{dev_id} (GUID: {guid}). {message}", flush=True)
-            else:
-                raise Exception(f"{dev_id} (GUID: {guid}). {message}")
+# Erlang-B blocking probability of 0, 1, 2, ... devices, keyed by offered load rounded to erlang_b_precision decimals
+erlang_b_tables: Dict[float, List[float]] = {}
 
-        print("===========================================================", flush=True)
-        time.sleep(kafka_interval)
+def erlang_b(devices: int, offered_load: float) -> float:
+    """
+    Erlang-B blocking probability of `devices` devices for the offered load, read from the memoized table of the rounded
+    offered load. The table is extended here, only as far as the devices asked for.
+    """
+    load = round(offered_load, erlang_b_precision)
+    table = erlang_b_tables.get(load)
+    if table is None:
+        # live rate estimates change the offered load on every tick, keep a bounded number of tables
+        while len(erlang_b_tables) >= erlang_b_max_tables:
+            del erlang_b_tables[next(iter(erlang_b_tables))]
+        table = erlang_b_tables[load] = [1.0]
+    # Erlang-B recurrence: B(c) = a * B(c - 1) / (c + a * B(c - 1))
+    while len(table) <= devices:
+        c = len(table)
+        table.append(load * table[-1] / (c + load * table[-1]))
+    return table[devices]
+
+def erlang_c(devices: int, arrival_rate: float, service_rate: float) -> float:
+    """Probability an arrival has to wait in an M/M/c queue with `devices` servers (Erlang-C). 1 if the devices cannot keep up."""
+    offered_load = arrival_rate / service_rate
+    if devices <= offered_load:
+        return 1.0
+    blocking = erlang_b(devices, offered_load)
+    return devices * blocking / (devices - offered_load * (1 - blocking))
+
+def erlang_c_wait(devices: int, arrival_rate: float, service_rate: float, queue_length: int = 0) -> float:
+    """
+    Expected wait (minutes) of an arrival in an M/M/c queue with `devices` servers: the steady state Erlang-C wait
+    plus the time to clear the current queue length with the spare capacity. Infinite if the devices cannot keep up.
+    """
+    net_capacity = devices * service_rate - arrival_rate
+    if net_capacity <= 0:
+        return float('inf')
+    return erlang_c(devices, arrival_rate, service_rate) / net_capacity + queue_length / net_capacity
+
+def erlang_c_policy(
+        queue_length: int,
+        arrival_rate: float,
+        service_rate: float,
+        current_active: int,
+        max_devices: int,
+        min_devices: int = 1,
+        buffer = 0.2,
+        target_wait = 120,
+        in_flight: int = 0,
+    ) -> int:
+    """
+    Sizes the active devices from M/M/c (Erlang-C) wait time, with the minimum devices found by binary search.
+    Expands to the minimum devices meeting the target wait, reduces only when fewer devices still meet the target
+    tightened by buffer, so the active devices do not flap around the target. Devices powering on (in_flight) count as active.
+    """
+    current_active = current_active + in_flight
+    # Convert target to minutes
+    target_min = target_wait / 60
+
+    def devices_for(target: float) -> int:
+        devices = search_devices(lambda c: erlang_c_wait(c, arrival_rate, service_rate, queue_length) <= target, max(min_devices, 1), max_devices)
+        return devices if devices is not None else max_devices  # Return max if target can't be met
+
+    # 1. Add devices if the target wait is not met
+    required = devices_for(target_min)
+    if required > current_active:
+        return required
+    # 2. Reduce devices if fewer devices still meet the tightened target
+    reduced = devices_for(target_min * (1 - buffer))
+    if reduced < current_active:
+        return max(reduced, min_devices)
+    # 3. Maintain current configuration
+    return max(current_active, min_devices)
+
+def predictive(
+        queue_length: int,
+        arrival_rate: float,
+        service_rate: float,
+        current_active: int,
+        max_devices: int,
+        min_devices: int = 1,
+        buffer = 0.2,
+        target_wait = 120,
+        forecast_queue_length: Optional[float] = None,
+        in_flight: int = 0,
+    ) -> int:
+    """
+    Sizes the active devices with Erlang-C for the larger of the current queue length and the queue length forecast
+    one boot time plus horizon ahead, so devices are powered on early enough to be serving when the surge arrives,
+    and are not powered off ahead of a forecast rise.
+    """
+    if forecast_queue_length is not None:
+        queue_length = max(queue_length, math.ceil(forecast_queue_length))
+    return erlang_c_policy(queue_length, arrival_rate, service_rate, current_active, max_devices, min_devices, buffer, target_wait, in_flight)
+
+# All policies available, keyed by strategy name
+policies = {
+    "energy_save": energy_save,
+    "min_wait": min_wait,
+    "erlang_c": erlang_c_policy,
+    "predictive": predictive,
+}
+
+def calculate_devices(strategy: str, arrival_rate, service_rate, queue_length, current_active, max_devices, min_devices, buffer, target_wait, forecast_queue_length=None, in_flight=0):
+    """
+    Get the devices required by the policy, counting both serving devices and devices powering on.
+    current_active is the serving capacity, in_flight the devices powering on that are not serving yet.
+    """
+    policy = policies.get(strategy.lower())
+    if policy is None:
+        raise ValueError(f"Unknown strategy: {strategy}")
+    if policy is predictive:
+        return policy(queue_length, arrival_rate, service_rate, current_active, max_devices, min_devices, buffer, target_wait, forecast_queue_length, in_flight)
+    return policy(queue_length, arrival_rate, service_rate, current_active, max_devices, min_devices, buffer, target_wait, in_flight=in_flight)
+
+def apply_hysteresis(hysteresis, device_required, strategy: str, arrival_rate, service_rate, queue_length, current_active, max_devices, min_devices, buffer, target_wait, forecast_queue_length=None, in_flight=0):
+    """
+    Keep the devices unchanged unless the decision still holds with the queue length half the hysteresis band closer to no change,
+    so a queue length moving around a policy threshold does not toggle devices.
+    """
+    committed = current_active + in_flight
+    if not hysteresis or (device_required == committed):
+        return device_required
+    shift = -hysteresis / 2 if device_required > committed else hysteresis / 2
+    confirmed = calculate_devices(strategy, arrival_rate, service_rate, max(0, queue_length + shift), current_active, max_devices, min_devices, buffer, target_wait, forecast_queue_length, in_flight)
+    if (confirmed - committed) * (device_required - committed) <= 0:
+        return committed
+    return device_required
+
+def get_site_devices(devices: Optional[List[str]] = None, exclude_devices: Optional[List[str]] = None) -> Dict[str, dict] | str:
+    """
+    Get the discovered devices of a site's device pool, all devices but `exclude_devices` if `devices` is None.
+    The error message if discovery failed, or if a device of the pool is not in the inventory.
+    """
+    all_device = dmt_utils.all_device
+    if isinstance(all_device, str):
+        return all_device
+    if devices is None:
+        excluded = set(exclude_devices or [])
+        return {dev_id: device for dev_id, device in all_device.items() if dev_id not in excluded}
+    missing = [dev_id for dev_id in devices if dev_id not in all_device]
+    if missing:
+        return f"Devices not found in the inventory: {', '.join(missing)}"
+    return {dev_id: all_device[dev_id] for dev_id in devices}
+
+def get_device_state(devices: Optional[List[str]] = None, exclude_devices: Optional[List[str]] = None) -> tuple:
+    all_device = get_site_devices(devices, exclude_devices)
+    if isinstance(all_device, str):
+        return ()
+    return tuple(device["pwr_status"] for device in all_device.values())
+
+async def wait_any(events: list[asyncio.Event], timeout: float, sleep: Callable[[float], Awaitable] = asyncio.sleep):
+    """Wait until any of the events is set, at most `timeout` seconds waited by `sleep`."""
+    waiters = [asyncio.ensure_future(event.wait()) for event in events] + [asyncio.ensure_future(sleep(timeout))]
+    try:
+        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+async def wait_next_tick(
+        mode: str,
+        queue_update: asyncio.Event | None,
+        device_changed: bool,
+        policy_update: asyncio.Event | None = None,
+        sleep: Callable[[float], Awaitable] = asyncio.sleep,
+    ):
+    """
+    Wait until the next decision. In "poll" mode, wait kafka_interval seconds.
+    In "event" mode, wait for a new queue length (at most kafka_heartbeat seconds) unless the device state changed since the last decision,
+    then wait kafka_debounce seconds so a burst of queue length only trigger one decision.
+    A published policy update ends the wait right away. Seconds are waited by `sleep`, e.g. the clock of the queue length source.
+    """
+    policy_events = [policy_update] if policy_update is not None else []
+    if policy_events and policy_update.is_set(): # type: ignore
+        return
+    if (mode != "event") or (queue_update is None):
+        await wait_any(policy_events, kafka_interval, sleep)
+        return
+    if not device_changed:
+        await wait_any([queue_update, *policy_events], kafka_heartbeat, sleep)
+    if not (policy_events and policy_update.is_set()): # type: ignore
+        await sleep(kafka_debounce)
+    queue_update.clear()
+
+async def manage_queue(
+        strategy: str,
+        config: str,
+        mode: str = queue_management_mode,
+        tailer: Optional[QueueLengthSource] = None,
+        control: Optional[PolicyControl] = None,
+        estimator: Optional[RateEstimator] = None,
+        guard: Optional[FlapGuard] = None,
+        devices: Optional[List[str]] = None,
+        history: Optional[TickHistory] = None,
+        tracer: Optional[TickTracer] = None,
+        exclude_devices: Optional[List[str]] = None,
+    ):
+    """
+    Decide and power on/off devices on every new queue length (or every kafka_interval seconds in poll mode) until cancelled.
+    `devices` limits the loop to a site's device pool, all discovered devices but `exclude_devices` if None.
+    Every tick is written to `history`, if any, and its stages are timed by `tracer`.
+    """
+    # the shared background source of the process, created on first use
+    if tailer is None:
+        tailer = get_queue_length_tailer()
+    # the control channel delivers policy switch and configuration update without restarting the loop
+    if control is None:
+        control = PolicyControl(strategy, json.loads(config))
+    policy_update = control.subscribe()
+    # learn arrival rate and service rate from the queue length and active devices
+    if estimator is None:
+        estimator = RateEstimator(halflife=estimator_halflife)
+    # forecast the queue length from every people-count message, for the predictive policy
+    forecaster = QueueForecaster(
+        level_halflife=forecast_level_halflife,
+        trend_halflife=forecast_trend_halflife,
+        season=forecast_season,
+        season_bins=forecast_season_bins,
+    )
+    forecast_listener = forecaster.update
+    # hold back power actions that would toggle devices faster than the dwell times and action rate allow
+    if guard is None:
+        # a source on its own clock gets its own guard, so times of a replay never carry into a live run sharing flap_guard
+        guard = flap_guard if tailer.wall_clock else FlapGuard(min_on_time=min_on_time, min_off_time=min_off_time, max_actions_per_minute=max_power_actions_per_minute)
+    # time reading the queue length, reading the device state, the policy and the power actions of every tick
+    if tracer is None:
+        tracer = TickTracer()
+    tailer.add_listener(forecast_listener)
+    # in event mode, get notified on every new queue length instead of sleeping
+    queue_update = tailer.subscribe() if mode == "event" else None
+    last_inputs = None # queue length and device state of the last decision
+    applied_version = None # version of policy update in effect
+    skipped = 0
+    last_record = None # devices on, powering on and required of the last decision, written again on skipped ticks
+    held_back = False # power actions held back by dwell time or action rate on the last decision, decide again even if inputs not change
+    tick = 0
+    trace: Optional[TickTrace] = None
+    try:
+        while True:
+            if last_inputs is not None:
+                await wait_next_tick(mode, queue_update, device_changed=last_inputs[1] != get_device_state(devices, exclude_devices), policy_update=policy_update, sleep=tailer.sleep)
+            tick = tick + 1
+            started = time.perf_counter()
+            trace = tracer.start(tick=tick)
+
+            # apply the latest policy update at the start of the tick, strategy and configuration always change together
+            policy_update.clear()
+            update = control.read()
+            if update["version"] != applied_version:
+                strategy, policy_configs = update["strategy"], update["config"]
+                if strategy not in policy_configs:
+                    raise Exception(f"Unknown strategy: {strategy}")
+                if applied_version is not None:
+                    print(f"Policy update (version {update['version']}) applied on tick {tick}. Strategy: {strategy}", flush=True)
+                applied_version = update["version"]
+                control.applied(applied_version, tick)
+                # decide again with the new policy even if the queue length and device state not change
+                last_inputs = None
+
+            with trace.span("queue_length") as attributes:
+                queue_length_result = await tailer.read_latest(kafka_timeout)
+                # if fail to get queue_length, raise error
+                if not queue_length_result["success"]:
+                    raise Exception(f"Failed to get queue length. {queue_length_result['message']}")
+                queue_length = int(queue_length_result["message"])
+                attributes.update(queue_length=queue_length, age=queue_length_result["age"])
+
+            with trace.span("devices") as attributes:
+                all_device = get_site_devices(devices, exclude_devices)
+                # if get error message instead of device list
+                if isinstance(all_device, str): 
+                    raise Exception(f"Failed to get available device. {all_device}")
+                attributes.update(devices=len(all_device))
+
+            # the newest message, the oldest lane of the total stops moving while a camera is silent
+            estimator.update(queue_length, queue_length_result["updated_at"], sum(device["pwr_status"] == "on" for device in all_device.values())) # type: ignore
+
+            # forecast one boot time plus horizon ahead, so devices powered on now are serving by then
+            policy = policy_configs[strategy]
+            forecast, lead_time = None, None
+            if strategy == "predictive":
+                # boot time measured from confirmed power on, or the configured boot time until enough are measured
+                boot_time = dmt_utils.measured_boot_time() or policy.get("boot_time") or default_boot_time
+                lead_time = boot_time + (policy.get("horizon") or 0)
+                if forecaster.state is None:
+                    forecaster.update(queue_length, queue_length_result["timestamp"]) # type: ignore
+                forecast = forecaster.forecast(lead_time)
+
+            # skip the decision if neither queue length, forecast nor device state changed since last decision
+            inputs = (queue_length, get_device_state(devices, exclude_devices), math.ceil(forecast) if forecast is not None else None)
+            if (inputs == last_inputs) and not held_back:
+                skipped = skipped + 1
+                skipped_decisions.inc()
+                if (history is not None) and (last_record is not None):
+                    history.append(time.time(), queue_length, *last_record, 0, 0, strategy, skipped=True)
+                tracer.end(trace, strategy=strategy, skipped=True)
+                continue
+            last_inputs = inputs
+
+            print(f"Queue Length: {queue_length} (age: {queue_length_result['age']:.1f} seconds{'' if queue_length_result['is_fresh'] else ', stale'})", flush=True)
+            max_devices = len(all_device)
+            print(f"Max Devices: {max_devices}", flush=True)
+
+            if forecast is not None:
+                print(f"Forecast Queue Length: {forecast:.1f} (in {lead_time:.0f} seconds)", flush=True)
+            arrival_rate, service_rate = estimator.apply(policy)
+            min_devices, buffer, target_wait = policy.get("min_devices", 1), policy.get("buffer", 0.2), policy.get("target_wait")
+            print(f"Min Devices: {min_devices}", flush=True)
+            print(f"Arrival Rate: {arrival_rate:.3g}{' (estimated)' if arrival_rate != policy['arrival_rate'] else ''}", flush=True)
+            print(f"Service Rate: {service_rate:.3g}{' (estimated)' if service_rate != policy['service_rate'] else ''}", flush=True)
+            print(f"Buffer: {buffer}", flush=True)
+            print(f"Target Wait: {target_wait} {'seconds' if target_wait else ''}", flush=True)
+            hysteresis = policy.get("hysteresis") or 0
+            print(f"Hysteresis: {hysteresis}", flush=True)
+            print(f"Strategy: {strategy}", flush=True)
+
+            current_active = 0
+            in_flight = 0
+            active_devices = []
+            inactive_devices = []
+            for device_name in all_device.keys():
+                pwr_status = all_device[device_name]["pwr_status"]
+                if pwr_status == "on":
+                    active_devices.append(device_name)
+                    current_active = current_active + 1
+                elif pwr_status == "powering_on":
+                    in_flight = in_flight + 1
+                # devices powering off are neither serving nor available to power on until their transition is confirmed
+                elif pwr_status != "powering_off":
+                    inactive_devices.append(device_name)
+            print(f"Current Active: {current_active}", flush=True)
+            print(f"Powering On: {in_flight}", flush=True)
+
+            committed = current_active + in_flight
+            with trace.span("policy", strategy=strategy) as attributes:
+                try:
+                    device_required = calculate_devices(strategy, arrival_rate, service_rate, queue_length, current_active, max_devices, min_devices, buffer, target_wait, forecast, in_flight)
+                    banded = apply_hysteresis(hysteresis, device_required, strategy, arrival_rate, service_rate, queue_length, current_active, max_devices, min_devices, buffer, target_wait, forecast, in_flight)
+                    if banded != device_required:
+                        print(f"Within hysteresis band: keep {banded} devices instead of {device_required}", flush=True)
+                        guard.suppress_hysteresis(abs(device_required - banded))
+                        device_required = banded
+                    print(f"Device Required: {device_required}", flush=True)
+                except Exception as e:
+                    raise Exception(f"Failed to get device required. {e}")
+                attributes.update(device_required=device_required)
+
+            # perform power action if device_required != serving and powering on devices, on devices past their dwell time
+            target_devices = []
+            action = None
+            held_back = False
+            if device_required > committed:
+                diff = device_required - committed
+                target_devices, action = guard.select(inactive_devices, True, diff, now=tailer.now()), dmt_utils.POWER_ON
+                held_back = len(target_devices) < min(diff, len(inactive_devices))
+                print(f"Power on devices: {','.join(target_devices)}", flush=True)
+            if device_required < committed:
+                diff = committed - device_required
+                target_devices, action = guard.select(active_devices, False, diff, now=tailer.now()), dmt_utils.POWER_OFF
+                held_back = len(target_devices) < min(diff, len(active_devices))
+                print(f"Power off devices: {','.join(target_devices)}", flush=True)
+            if not target_devices:
+                action = None
+
+            # check power action results as each device finish
+            errors = []
+            powered = 0
+            if action is not None:
+                with trace.span("power_action", action=dmt_utils.power_action_name[action], devices=len(target_devices)) as attributes:
+                    async for result in dmt_utils.batch_power_action(target_devices, action):
+                        guid, dev_id, success, message = result.values()
+                        power_actions.inc(action=dmt_utils.power_action_name[action], outcome="success" if success else "failure")
+                        if success:
+                            guard.record(dev_id, action == dmt_utils.POWER_ON, now=tailer.now())
+                            powered = powered + 1
+                            print(f"{dev_id} (GUID: {guid}). {message}", flush=True)
+                        else:
+                            errors.append(f"{dev_id} (GUID: {guid}). {message}")
+                    attributes.update(failed=len(errors))
+            last_record = (current_active, in_flight, device_required)
+            if history is not None:
+                power_on = action == dmt_utils.POWER_ON
+                history.append(time.time(), queue_length, *last_record, powered if power_on else 0, 0 if power_on else powered, strategy)
+            tick_duration.observe(time.perf_counter() - started)
+            tracer.end(trace, strategy=strategy)
+            if errors:
+                raise Exception(" ".join(errors))
+
+            print(f"Skipped Decisions: {skipped}", flush=True)
+            print(f"Suppressed Power Actions: {', '.join(f'{reason}={count}' for reason, count in guard.suppressed.items())}", flush=True)
+            print(f"Tick Timings: {', '.join(f'{name}={trace.durations[name] * 1000:.1f} ms' for name in ['tick', *STAGES] if name in trace.durations)}", flush=True)
+            print("===========================================================", flush=True)
+    finally:
+        # a tick ended by an error is traced too, with the failed stage
+        if trace is not None:
+            tracer.end(trace)
+        tailer.remove_listener(forecast_listener)
+        control.unsubscribe(policy_update)
+        if queue_update is not None:
+            tailer.unsubscribe(queue_update)
 
 def parse_args(argv=None):
     parser = argparse.ArgumentParser(
@@ -163,19 +564,91 @@ def parse_args(argv=None):
 
     parser.add_argument("-s", "--strategy", action="store", default="energy_save", help="Strategy used to manage queue.")
     parser.add_argument("-c", "--config", action="store", default=json.dumps(queue_policy), help="Available queue policies and their configuration.")
+    parser.add_argument("-p", "--control", action="store", default=None, help="Path of the policy update file published by the server. The loop applies updates without restart.")
+    parser.add_argument("-e", "--estimates", action="store", default=None, help="Path to write the live arrival rate and service rate estimates to.")
+    parser.add_argument("-t", "--history", action="store", default=None, help="Path of the tick history file to write every decision tick to.")
+    parser.add_argument("-l", "--log", action="store", default=None, help="Path of the rotating log to write the output to, instead of stdout.")
+    parser.add_argument("-u", "--status", action="store", default=None, help="Path of the status file to record the state and last error of the process in.")
+    parser.add_argument("-i", "--timings", action="store", default=None, help="Path of the tick and stage timings summary to write every metrics_interval seconds.")
+    parser.add_argument("-x", "--metrics", action="store", default=None, help="Path of the metrics file to write every metrics_interval seconds, served by the server at /metrics.")
+    parser.add_argument("-d", "--exclude-devices", action="store", default=None, help="Device ids claimed by other sites, as JSON list. The loop manages all other devices.")
+    parser.add_argument("-m", "--mode", action="store", default=queue_management_mode, choices=["event", "poll"], help="Decide on every new queue length (event) or every kafka_interval seconds (poll).")
+
+    return parser.parse_args(argv)
+
 
-    return parser.parse_args()
+def write_state(metrics_path: Optional[str], tracer: TickTracer):
+    """Write the metrics and tick timings of this process for the server to serve, as the server cannot read them from another process."""
+    try:
+        if metrics_path:
+            write_metrics(metrics_path)
+        tracer.write()
+    except OSError as e:
+        print(f"Failed to write metrics. {e}", flush=True)
+
+
+async def write_state_periodically(metrics_path: Optional[str], tracer: TickTracer):
+    while True:
+        write_state(metrics_path, tracer)
+        await asyncio.sleep(metrics_interval)
+
+
+async def main(
+        strategy: str,
+        config: str,
+        mode: str = queue_management_mode,
+        control_path: Optional[str] = None,
+        estimates_path: Optional[str] = None,
+        history_path: Optional[str] = None,
+        metrics_path: Optional[str] = None,
+        timings_path: Optional[str] = None,
+        exclude_devices: Optional[List[str]] = None,
+    ):
+    # run the whole process in one event loop, so every DMT call share the same DMT client
+    history = TickHistory(history_path, capacity=history_capacity) if history_path else None
+    estimator = RateEstimator(halflife=estimator_halflife, path=estimates_path, write_interval=estimates_interval)
+    tracer = TickTracer(path=timings_path)
+    state_writer = asyncio.create_task(write_state_periodically(metrics_path, tracer)) if (metrics_path or timings_path) else None
+    try:
+        # authorize the DMT session
+        await dmt_utils.authorize()
+        # get all device in the network
+        await dmt_utils.get_all_device()
+
+        print("===========================================================", flush=True)
+        control = PolicyControl(strategy, json.loads(config), path=control_path)
+        await manage_queue(strategy=strategy, config=config, mode=mode, control=control, estimator=estimator, history=history, tracer=tracer, exclude_devices=exclude_devices)
+    finally:
+        if state_writer is not None:
+            state_writer.cancel()
+            write_state(metrics_path, tracer)
+        # the samples since the last throttled write
+        estimator.write()
+        await dmt_utils.close_client()
+        if history is not None:
+            history.close()
+        # flush the spans not exported yet
+        for exporter in tick_trace.default_exporters():
+            exporter.close()
 
 
 if __name__ == '__main__':
     args = parse_args(sys.argv[1:])
+    if args.log:
+        # output and tracebacks go to the rotating log
+        sys.stdout = sys.stderr = RotatingLog(args.log, max_bytes=log_max_bytes, max_age=log_max_age, backups=log_backups)
     
     print("Start Queue management process", flush=True)
     print("===========================================================", flush=True)
-    # authorize the DMT session
-    asyncio.run(dmt_utils.authorize())
-    # get all device in the network
-    asyncio.run(dmt_utils.get_all_device())
-
-    print("===========================================================", flush=True)
-    manage_queue(strategy=args.strategy, config=args.config)
+    if args.status:
+        write_status(args.status, "running")
+    try:
+        asyncio.run(main(strategy=args.strategy, config=args.config, mode=args.mode, control_path=args.control, estimates_path=args.estimates, history_path=args.history, metrics_path=args.metrics, timings_path=args.timings, exclude_devices=json.loads(args.exclude_devices) if args.exclude_devices else None))
+    except Exception as e:
+        # the server reads the last error from the status file instead of the log
+        if args.status:
+            write_status(args.status, "error", f"{type(e).__name__}: {e}")
+        raise
+    except KeyboardInterrupt:
+        if args.status:
+            write_status(args.status, "stopped")
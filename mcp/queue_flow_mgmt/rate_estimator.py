@@ -0,0 +1,137 @@
+import math
+import time
+from typing import TypedDict, Optional
+from json_file import read_json, write_json
+
+
+class RateEstimate(TypedDict):
+    arrival_rate: Optional[float] # per minute, None if not enough samples yet
+    arrival_rate_low: Optional[float] # 95% confidence bounds
+    arrival_rate_high: Optional[float]
+    service_rate: Optional[float] # per minute per device, None if not enough samples or the active devices never change
+    service_rate_low: Optional[float]
+    service_rate_high: Optional[float]
+    samples: int # samples used since start
+    effective_samples: float # weight of recent samples, after exponential decay
+    updated_at: Optional[float] # epoch seconds of the last sample used
+
+
+class RateEstimator:
+    """
+    Online estimate of arrival rate (λ) and service rate per device (μ) from the queue length and active devices.
+    While customers are waiting, the queue changes by λ - μ * active devices per minute, so λ and μ are fitted by
+    exponentially weighted least squares of the queue length change rate on the active devices. Only running sums are
+    kept, so memory is O(1) however long the stream. Samples older than `halflife` seconds count half as much.
+
+    Without `path`, the estimate is kept in memory, for the loop running inside the server.
+    With `path`, the estimate is also written to `path` at most every `write_interval` seconds, for the loop running as a subprocess.
+    """
+    def __init__(self, halflife: float = 900, min_samples: float = 10, path: Optional[str] = None, write_interval: float = 5):
+        self.halflife = halflife # in seconds
+        self.min_samples = min_samples # effective samples needed before the estimate is used
+        self.path = path
+        self.write_interval = write_interval # in seconds
+        self.written_at: Optional[float] = None # monotonic time of the last write to path
+        self.last: Optional[tuple[float, float, int]] = None # queue length, timestamp and active devices of the last sample
+        self.samples = 0
+        self.updated_at: Optional[float] = None
+        # exponentially weighted sums of weight, x (active devices), y (queue change per minute) and their products
+        self.w = self.w2 = self.x = self.y = self.xx = self.xy = self.yy = 0.0
+
+    def update(self, queue_length: float, timestamp: float, active_devices: int) -> bool:
+        """Add a queue length sample and the active devices at that time. Return True if the sample was used."""
+        last = self.last
+        if (last is not None) and (timestamp <= last[1]):
+            return False # same or older queue length
+        self.last = (queue_length, timestamp, active_devices)
+        if last is None:
+            return False
+        last_queue_length, last_timestamp, last_active = last
+        # an empty queue hides the arrivals served right away, so only intervals with customers waiting throughout are used
+        if (last_queue_length <= 0) or (queue_length <= 0):
+            return False
+
+        elapsed = timestamp - last_timestamp
+        decay = 0.5 ** (elapsed / self.halflife)
+        x = float(last_active)
+        y = (queue_length - last_queue_length) / (elapsed / 60)
+        self.w = self.w * decay + 1
+        self.w2 = self.w2 * decay * decay + 1
+        self.x = self.x * decay + x
+        self.y = self.y * decay + y
+        self.xx = self.xx * decay + x * x
+        self.xy = self.xy * decay + x * y
+        self.yy = self.yy * decay + y * y
+        self.samples = self.samples + 1
+        self.updated_at = timestamp
+        if self.path and ((self.written_at is None) or (time.monotonic() - self.written_at >= self.write_interval)):
+            self.write()
+        return True
+
+    def write(self):
+        """Write the current estimate to `path`, if any."""
+        if self.path:
+            write_json(self.path, self.estimate())
+            self.written_at = time.monotonic()
+
+    def estimate(self, service_rate: Optional[float] = None) -> RateEstimate:
+        """
+        Get the current estimate with 95% confidence bounds. While the active devices never changed, μ cannot be told apart
+        from λ: μ is None and λ is estimated with the given `service_rate`, if any.
+        """
+        estimate = RateEstimate(
+            arrival_rate=None, arrival_rate_low=None, arrival_rate_high=None,
+            service_rate=None, service_rate_low=None, service_rate_high=None,
+            samples=self.samples, effective_samples=0.0, updated_at=self.updated_at,
+        )
+        if self.w <= 0:
+            return estimate
+        n = self.w * self.w / self.w2
+        estimate["effective_samples"] = n
+        if n < max(self.min_samples, 3):
+            return estimate
+
+        mean_x, mean_y = self.x / self.w, self.y / self.w
+        var_x = max(0.0, self.xx / self.w - mean_x * mean_x)
+        var_y = max(0.0, self.yy / self.w - mean_y * mean_y)
+        cov_xy = self.xy / self.w - mean_x * mean_y
+        z = 1.96
+
+        if var_x > 1e-3:
+            slope = cov_xy / var_x
+            mu, lam = -slope, mean_y - slope * mean_x
+            residual = max(0.0, var_y - slope * cov_xy) * n / (n - 2)
+            se_mu = math.sqrt(residual / (n * var_x))
+            se_lam = math.sqrt(residual * (1 / n + mean_x * mean_x / (n * var_x)))
+            if mu > 0:
+                estimate.update(service_rate=mu, service_rate_low=max(0.0, mu - z * se_mu), service_rate_high=mu + z * se_mu)
+                estimate.update(arrival_rate=max(0.0, lam), arrival_rate_low=max(0.0, lam - z * se_lam), arrival_rate_high=max(0.0, lam + z * se_lam))
+                return estimate
+        if service_rate is not None:
+            lam = mean_y + service_rate * mean_x
+            se_lam = math.sqrt(var_y * n / (n - 1) / n)
+            estimate.update(arrival_rate=max(0.0, lam), arrival_rate_low=max(0.0, lam - z * se_lam), arrival_rate_high=max(0.0, lam + z * se_lam))
+        return estimate
+
+    def read(self) -> RateEstimate:
+        """Read the current estimate. With `path`, read the estimate written by the running loop."""
+        if self.path:
+            estimate = read_json(self.path)
+            if estimate:
+                return RateEstimate(**estimate)
+        return self.estimate()
+
+    def apply(self, policy: dict) -> tuple[float, float]:
+        """
+        Get the arrival rate and service rate to decide with. If the policy opted in with "use_estimates", each configured
+        rate is replaced by its live estimate once available.
+        """
+        arrival_rate, service_rate = policy["arrival_rate"], policy["service_rate"]
+        if not policy.get("use_estimates"):
+            return arrival_rate, service_rate
+        estimate = self.estimate(service_rate=service_rate)
+        if estimate["service_rate"] is not None:
+            service_rate = estimate["service_rate"]
+        if estimate["arrival_rate"] is not None:
+            arrival_rate = estimate["arrival_rate"]
+        return arrival_rate, service_rate
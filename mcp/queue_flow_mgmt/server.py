@@ -2,24 +2,30 @@ import os
 import sys
 import ast
 import json
+import time
 import subprocess
 from dotenv import load_dotenv
 from typing import List, Dict, Any, TypedDict, Optional
 from pydantic import TypeAdapter
 from mcp.server.fastmcp import FastMCP
-from quixstreams import Application
-from confluent_kafka import TopicPartition
+from queue_length import QueueLengthResult, LaneQueueLength
+from queue_core import PolicyConfig, queue_policy, selected_policy, kafka_timeout, get_queue_length_tailer, qflow_data_dir, policy_config_error
+from queue_engine import QueueManagementEngine
+from policy_control import PolicyControl
+from rate_estimator import RateEstimator, RateEstimate
+from sites import Site, SiteInfo, DEFAULT_SITE, load_sites, claimed_devices
+from tick_history import TickHistory, QueueHistory
+from worker_log import tail_lines, read_status, write_status
+# metrics are shared by the MCP servers and the agent, imported from the package at the repository root
+repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if repo_dir not in sys.path:
+    sys.path.append(repo_dir)
+from queueflow_device_manager.metrics import instrument_mcp, read_metrics
+from tick_trace import TickTracer, TickTimings
 
 
 load_dotenv()
 
-class PolicyConfig(TypedDict):
-    arrival_rate: float
-    service_rate: float
-    min_devices: int = 1 # type: ignore
-    buffer: float = 0.2 # type: ignore # 0 - 1
-    target_wait: Optional[int] = 120 # type: ignore # in seconds
-
 class OperationResult(TypedDict):
     success: bool
     message: str
@@ -33,45 +39,79 @@ PolicyConfigValidator = TypeAdapter(PolicyConfig)
 # Initialize FastMCP server
 mcp = FastMCP("Queue_Flow_Management", host="localhost", port=6969)
 
-# All policy available
-queue_policy = {
-    "energy_save": PolicyConfig(
-        arrival_rate=1.5,
-        service_rate=0.5,
-        min_devices=1,
-        buffer=0.2,
-        target_wait=None # No target wait for energy save
-    ),
-    "min_wait": PolicyConfig(
-        arrival_rate=1.5,
-        service_rate=0.5,
-        min_devices=1,
-        buffer=0.2,
-        target_wait=120
-    ),
-}
-
-# Default policy
-selected_policy = [*queue_policy][0]
-
-# Configure an Kafka Application.
-# The config params will be used for the Consumer instance too.
-kafka_app = Application(
-    broker_address="localhost:9092",
-    consumer_group="retail",
-    auto_offset_reset="latest",
-)
-latest = 0
-kafka_timeout = int(os.getenv("kafka_timeout", 10)) # in seconds
+# Background source holding the latest queue length of each lane
+queue_length_tailer = get_queue_length_tailer()
 
 # Initialize queue management process
 global queue_management_process
 queue_management_process = None
 
+# Run queue management loop as "subprocess" (`uv run queue_management_utils.py`), or as "asyncio" task inside this server
+queue_management_engine = os.getenv("queue_management_engine", "subprocess")
+policy_apply_timeout = float(os.getenv("policy_apply_timeout", 10)) # wait for the running loop to apply a policy update, in seconds
+estimator_halflife = float(os.getenv("estimator_halflife", 900)) # queue samples older than this count half in rate estimates, in seconds
+
 queue_management_dir = os.path.dirname(os.path.abspath(__file__))
-log_path = os.path.join(queue_management_dir, "qflow.log")
+# runtime state is kept out of the source tree, in qflow_data_dir
+os.makedirs(qflow_data_dir, exist_ok=True)
+log_path = os.path.join(qflow_data_dir, "qflow.log")
+startup_log_path = os.path.join(qflow_data_dir, "qflow_startup.log") # output of the worker before its rotating log is open, e.g. uv and import errors
+status_path = os.path.join(qflow_data_dir, "qflow_status.json")
+control_path = os.path.join(qflow_data_dir, "qflow_control.json")
+estimates_path = os.path.join(qflow_data_dir, "qflow_estimates.json")
+history_path = os.path.join(qflow_data_dir, "qflow_history.bin")
+metrics_path = os.path.join(qflow_data_dir, "qflow_metrics.prom")
+timings_path = os.path.join(qflow_data_dir, "qflow_timings.json")
 queue_management_script = os.path.join(queue_management_dir, "queue_management_utils.py")
 
+# Control channel to the running loop, policy switch and configuration update take effect on the next decision tick without restart
+policy_control = PolicyControl(selected_policy, queue_policy, path=control_path if queue_management_engine != "asyncio" else None)
+# Live estimates of arrival rate and service rate, updated by the running loop
+rate_estimator = RateEstimator(halflife=estimator_halflife, path=estimates_path if queue_management_engine != "asyncio" else None)
+# Timings of every decision tick and its stages, updated by the running loop
+tick_tracer = TickTracer(path=timings_path if queue_management_engine != "asyncio" else None)
+
+# The default site manages all lanes and the devices of no other site. Other sites, loaded from sites_config, each manage their own lanes and
+# device pool with their own policy, and always run as asyncio tasks in this server sharing the Kafka consumer and DMT client
+sites_path = os.getenv("sites_config", os.path.join(queue_management_dir, "qflow_sites.json"))
+named_sites = load_sites(sites_path, queue_length_tailer, queue_policy, estimator_halflife, history_dir=qflow_data_dir)
+# a device is powered by one loop only
+default_exclude_devices = claimed_devices(named_sites)
+queue_engine = QueueManagementEngine(queue_length_tailer, policy_control, rate_estimator, history_path=history_path, tracer=tick_tracer, exclude_devices=default_exclude_devices)
+sites: Dict[str, Site] = {
+    DEFAULT_SITE: Site(DEFAULT_SITE, queue_policy, selected_policy, queue_length_tailer, policy_control, rate_estimator, queue_engine, history_path=history_path, tracer=tick_tracer, exclude_devices=default_exclude_devices),
+    **named_sites,
+}
+
+def worker_metrics() -> str:
+    """Metrics of the decision loop and its DMT requests written by the queue management process, while it runs."""
+    if (queue_management_process is None) or (queue_management_process.poll() is not None):
+        return ""
+    return read_metrics(metrics_path)
+
+# tool call latency and errors, Kafka consumer, DMT API and decision loop metrics, served at /metrics
+instrument_mcp(mcp, extra=worker_metrics)
+
+def get_site(site: Optional[str] = None) -> Optional[Site]:
+    """Get the named site, the default site if None. None if the site not exist."""
+    return sites.get(site or DEFAULT_SITE)
+
+def is_subprocess(state: Site) -> bool:
+    """Whether the site's queue management loop runs as a `uv run` subprocess instead of an asyncio task."""
+    return (state.name == DEFAULT_SITE) and (queue_management_engine != "asyncio")
+
+async def apply_policy_update(state: Site) -> tuple[int, Optional[int]]:
+    """Publish the selected policy and configuration of all policies. If the loop is running, wait for the decision tick it took effect on."""
+    version = state.control.publish(state.selected_policy, state.queue_policy)
+    if not get_queue_management_status(state.name)["is_running"]:
+        return version, None
+    return version, await state.control.wait_applied(version, policy_apply_timeout)
+
+def applied_message(version: int, tick: Optional[int]) -> str:
+    if tick is None:
+        return f"Policy version {version} will take effect on the next decision tick."
+    return f"Policy version {version} took effect on decision tick {tick}."
+
 
 @mcp.tool()
 def get_queue_policy() -> list[str]:
@@ -82,18 +122,18 @@ def get_queue_policy() -> list[str]:
         None
 
     Returns:
-        List of supported queue management policy, e.g.: ["energy_save", "min_wait"]
+        List of supported queue management policy, e.g.: ["energy_save", "min_wait", "erlang_c", "predictive"]
     """
     global queue_policy
     return [*queue_policy]
 
 @mcp.tool()
-def get_current_queue_policy() -> OperationResult:
+def get_current_queue_policy(site: Optional[str] = None) -> OperationResult:
     """
     Get current in used/activated queue management policy.
 
     Args:
-        None
+        site (str | None): Name of the site, see get_sites(). The default site managing all lanes and the devices of no other site if None.
 
     Returns:
         Operation results, e.g.:
@@ -102,11 +142,16 @@ def get_current_queue_policy() -> OperationResult:
             "message": "Current selected policy: energy_save"
         }
     """
+    state = get_site(site)
+    if state is None:
+        return OperationResult(
+            success=False,
+            message="Error: Site not exist."
+        )
     try:
-        global selected_policy
         return OperationResult(
             success=True,
-            message=f"Current selected policy: {selected_policy}."
+            message=f"Current selected policy: {state.selected_policy}."
         )
     except Exception as e:
         return OperationResult(
@@ -115,57 +160,63 @@ def get_current_queue_policy() -> OperationResult:
         )
 
 @mcp.tool()
-def select_queue_policy(policy: str) -> OperationResult:
+async def select_queue_policy(policy: str, site: Optional[str] = None) -> OperationResult:
     """
     Select the queue management policy to activate.
 
     Args:
         policy (str): Name of queue management policy.
+        site (str | None): Name of the site, see get_sites(). The default site managing all lanes and the devices of no other site if None.
 
     Returns:
         Operation results, e.g.:
         {
             "sucess": True
-            "message": "Current selected policy: energy_save"
+            "message": "Current selected policy: energy_save. Policy version 3 took effect on decision tick 42."
         }
     """
-    global queue_policy
-    if policy not in [*queue_policy]:
+    state = get_site(site)
+    if state is None:
+        return OperationResult(
+            success=False,
+            message="Error: Site not exist."
+        )
+    if policy not in [*state.queue_policy]:
         return OperationResult(
             success=False,
             message="Error: Policy not exist."
         )
     
-    global selected_policy
     # if selected policy change
-    if policy != selected_policy:
-        selected_policy = policy
-
-        global queue_management_process
-        # if the process is running, restart the process with new selected policy
-        if (queue_management_process is not None) or (hasattr(queue_management_process, "poll") and (queue_management_process.poll() is None)): # type: ignore
-            stop_queue_management()
-            start_queue_management()
-            is_running, message = get_queue_management_status()
+    if policy != state.selected_policy:
+        state.selected_policy = policy
 
-            if not is_running:
-                return OperationResult(
-                    success=False,
-                    message=f"Current selected policy: {selected_policy}. Failed to restart queue management process. {message}"
-                )
+        # switch the policy of the running process on its next decision tick, without restart
+        try:
+            version, tick = await apply_policy_update(state)
+        except Exception as e:
+            return OperationResult(
+                success=False,
+                message=f"Current selected policy: {state.selected_policy}. Failed to update queue management process. {e}"
+            )
+        return OperationResult(
+            success=True,
+            message=f"Current selected policy: {state.selected_policy}. {applied_message(version, tick)}"
+        )
 
     return OperationResult(
         success=True,
-        message=f"Current selected policy: {selected_policy}."
+        message=f"Current selected policy: {state.selected_policy}."
     )
 
 @mcp.tool()
-def get_policy_config(policy: Optional[List[str] | str] = None) -> Dict[str, PolicyConfig]:
+def get_policy_config(policy: Optional[List[str] | str] = None, site: Optional[str] = None) -> Dict[str, PolicyConfig]:
     """
     Get the configuration for all queue management policies. Return the default and updated configuration.
     
     Args:
         policy (list | None): List of target policies. Will returns all policies configuration if policy is None.
+        site (str | None): Name of the site, see get_sites(). The default site managing all lanes and the devices of no other site if None.
 
     Returns:
         Dictionary of queue management policy configuration keyed by policy name, e.g.:
@@ -180,8 +231,10 @@ def get_policy_config(policy: Optional[List[str] | str] = None) -> Dict[str, Pol
                 }
         }
     """
-    global queue_policy
-    all_policy = [*queue_policy]
+    state = get_site(site)
+    if state is None:
+        return {}
+    all_policy = [*state.queue_policy]
     if (policy is None) or (not policy):
         policy = all_policy
     if isinstance(policy, str):
@@ -193,12 +246,12 @@ def get_policy_config(policy: Optional[List[str] | str] = None) -> Dict[str, Pol
     config = {}
     for p in policy:  # type: ignore
         if p in all_policy:
-            config[p] = queue_policy[p]
+            config[p] = state.queue_policy[p] # type: ignore
     
     return config
 
 @mcp.tool()
-def update_policy_config(policy: str, config: str) -> OperationResult: # type: ignore
+async def update_policy_config(policy: str, config: str, site: Optional[str] = None) -> OperationResult: # type: ignore
     """
     Update the queue management policy configuration.
 
@@ -212,6 +265,7 @@ def update_policy_config(policy: str, config: str) -> OperationResult: # type: i
                 "buffer": 0.2,
                 "target_wait": 120,
             }
+        site (str | None): Name of the site, see get_sites(). The default site managing all lanes and the devices of no other site if None.
 
     Returns:
         Operation results, e.g.:
@@ -220,8 +274,13 @@ def update_policy_config(policy: str, config: str) -> OperationResult: # type: i
             "message": "Error: Policy not exist."
         }
     """
-    global queue_policy
-    global selected_policy
+    state = get_site(site)
+    if state is None:
+        return OperationResult(
+            success=False,
+            message="Error: Site not exist."
+        )
+    queue_policy = state.queue_policy
     if policy not in [*queue_policy]:
         return OperationResult(
             success=False,
@@ -247,6 +306,13 @@ def update_policy_config(policy: str, config: str) -> OperationResult: # type: i
             else:
                 current_config[key] = config[key]
         config = current_config # type: ignore
+
+    error = policy_config_error(policy, config)
+    if error is not None:
+        return OperationResult(
+            success=False,
+            message=f"Failed to update policy configuration. {error}"
+        )
     
     # if the provided configuration is same with old configuration
     if config == queue_policy[policy]:
@@ -257,110 +323,228 @@ def update_policy_config(policy: str, config: str) -> OperationResult: # type: i
 
     queue_policy[policy] = config
 
-    if policy == selected_policy:
-        global queue_management_process
-        # if the process is running, restart the process with new config
-        if (queue_management_process is not None) or (hasattr(queue_management_process, "poll") and (queue_management_process.poll() is None)): # type: ignore
-            stop_queue_management()
-            start_queue_management()
-            is_running, message = get_queue_management_status()
+    if policy == state.selected_policy:
+        # update the configuration of the running process on its next decision tick, without restart
+        try:
+            version, tick = await apply_policy_update(state)
+        except Exception as e:
+            return OperationResult(
+                success=False,
+                message=f"Policy configuration update successfully. Failed to update queue management process. {e}"
+            )
+        return OperationResult(
+            success=True,
+            message=f"Policy configuration update successfully. {applied_message(version, tick)}"
+        )
+    # configuration of the other policies is published too, so a later policy switch use it
+    state.control.publish(state.selected_policy, queue_policy)
 
-            if not is_running:
-                return OperationResult(
-                    success=False,
-                    message=f"Policy configuration update successfully. Failed to restart queue management process. {message}"
-                )
-            
     return OperationResult(
         success=True,
         message="Policy configuration update successfully."
     )
 
 @mcp.tool()
-async def get_queue_length() -> OperationResult:
+async def get_queue_length(site: Optional[str] = None) -> QueueLengthResult:
     """
     Get current queue length.
 
     Args:
-        None
+        site (str | None): Name of the site, see get_sites(). The default site managing all lanes and the devices of no other site if None.
 
     Returns:
-        OperationResult object containing the current queue length, e.g.:
+        QueueLengthResult object containing the current queue length, time of the reading (of the oldest lane), its age in seconds, whether it is fresh and the time of the newest message, e.g.:
         {
             "sucess": True
-            "message": "3"
+            "message": "3",
+            "timestamp": 1755590400.0,
+            "age": 1.5,
+            "is_fresh": True,
+            "updated_at": 1755590401.0
         }
     """
-    global latest
-    # Create a consumer and start a polling loop
-    with kafka_app.get_consumer() as consumer:
-        topic = "people-count"  # specify the topic name
-        partition = 0  # adjust if multiple partitions
+    state = get_site(site)
+    if state is None:
+        return QueueLengthResult(success=False, message="Error: Site not exist.", timestamp=None, age=None, is_fresh=False, updated_at=None)
+    # the consumer keeps running in background, the queue length is read from memory
+    return await state.tailer.read_latest(kafka_timeout)
 
-        # Get the latest offset (high watermark)
-        try:
-            low, high = consumer.get_watermark_offsets(TopicPartition(topic, partition), timeout=kafka_timeout)
-        except Exception as e:
-            return OperationResult(
-                success=False,
-                message=f"Failed to get watermark offsets. {e}"
-            )
+@mcp.tool()
+async def get_queue_lanes(site: Optional[str] = None) -> Dict[str, LaneQueueLength]:
+    """
+    Get current queue length of each lane (camera) separately. The queue length returned by get_queue_length() combines all lanes.
 
-        if high > latest:
-            latest = high
-        elif high == 0 or high == latest:
-            return OperationResult(
-                success=False,
-                message="No latest queue length."
-            )
+    Args:
+        site (str | None): Name of the site, see get_sites(). The default site managing all lanes and the devices of no other site if None.
 
-        # Assign consumer to the latest offset (start consuming new messages only)
-        consumer.assign([TopicPartition(topic, partition, high-1)])
+    Returns:
+        Dictionary of queue length, time of the reading, its age in seconds and whether it is fresh, keyed by lane, e.g.:
+        {
+            "camera-1": {
+                "queue_length": 3,
+                "timestamp": 1755590400.0,
+                "age": 1.5,
+                "is_fresh": True
+            },
+            "people-count:1": {
+                "queue_length": 5,
+                "timestamp": 1755590399.0,
+                "age": 2.5,
+                "is_fresh": True
+            }
+        }
+    """
+    state = get_site(site)
+    if state is None:
+        return {}
+    await state.tailer.read_latest(kafka_timeout)
+    return state.tailer.read_lanes()
 
-        # Poll for new message
-        try:
-            msg = consumer.poll(0.1)
-        except Exception as e:
-            return OperationResult(
-                success=False,
-                message=f"Failed to poll new message. {e}"
-            )
-        
-        if msg is None:
-            return OperationResult(
-                success=False,
-                message="No latest queue length."
-            )
-        elif msg.error():
-            return OperationResult(
-                success=False,
-                message=f"Kafka error: {msg.error()}"
-            )
+@mcp.tool()
+def get_rate_estimates(site: Optional[str] = None) -> RateEstimate:
+    """
+    Get the live estimates of arrival rate (customers per minute) and service rate (customers per minute per device),
+    with 95% confidence bounds, learned from the queue length and active devices while queue management is running.
+    A rate is None until enough samples are collected. The service rate is None while the active devices never change.
+    Policies with "use_estimates" set to true in their configuration decide with these estimates instead of the configured rates.
 
-        value = json.loads(msg.value().decode("utf-8")) # type: ignore
-        print(f"High: {high}, Latest: {latest}, Received: {value}", flush=True)
-        # Do some work with the value here ...
-        # Store the offset of the processed message on the Consumer
-        # for the auto-commit mechanism.
-        # It will send it to Kafka in the background.
-        # Storing offset only after the message is processed enables at-least-once delivery
-        # guarantees.
-        consumer.store_offsets(message=msg)
-        consumer.close()
-        return OperationResult(
-            success=True,
-            message=f"{value["queue_count"]}"
-        )
+    Args:
+        site (str | None): Name of the site, see get_sites(). The default site managing all lanes and the devices of no other site if None.
+
+    Returns:
+        Rate estimates, e.g.:
+        {
+            "arrival_rate": 1.62,
+            "arrival_rate_low": 1.41,
+            "arrival_rate_high": 1.83,
+            "service_rate": 0.48,
+            "service_rate_low": 0.43,
+            "service_rate_high": 0.53,
+            "samples": 240,
+            "effective_samples": 118.4,
+            "updated_at": 1755590400.0
+        }
+    """
+    state = get_site(site)
+    if state is None:
+        raise ValueError("Site not exist.")
+    return state.estimator.read()
 
 @mcp.tool()
-def start_queue_management() -> OperationResult:
+def get_tick_timings(site: Optional[str] = None) -> TickTimings:
+    """
+    Get how long the decision ticks of the running queue management take, and how long each stage of a tick takes:
+    reading the queue length from Kafka ("queue_length"), reading the device state ("devices"), deciding the devices required
+    by the policy ("policy") and powering devices on/off through DMT ("power_action"). Durations are in seconds.
+    Use it to tell whether slow ticks come from Kafka, the policy or DMT.
+
+    Args:
+        site (str | None): Name of the site, see get_sites(). The default site managing all lanes and the devices of no other site if None.
+
+    Returns:
+        TickTimings object, e.g.:
+        {
+            "ticks": 1250,
+            "stages": {
+                "tick": {"count": 1250, "mean": 0.41, "p50": 0.0042, "p95": 2.1, "p99": 4.3, "max": 6.2},
+                "queue_length": {"count": 1250, "mean": 0.0008, "p50": 0.0004, "p95": 0.0021, "p99": 0.0046, "max": 0.012},
+                "devices": {"count": 1250, "mean": 0.00002, "p50": 0.00001, "p95": 0.00004, "p99": 0.00008, "max": 0.0002},
+                "policy": {"count": 830, "mean": 0.0003, "p50": 0.0002, "p95": 0.0009, "p99": 0.0023, "max": 0.004},
+                "power_action": {"count": 96, "mean": 3.9, "p50": 2.8, "p95": 5.4, "p99": 7.1, "max": 7.7}
+            },
+            "last_tick": {"queue_length": 0.0005, "devices": 0.00001, "policy": 0.0002, "tick": 0.0031},
+            "updated_at": 1755590400.0
+        }
+    """
+    state = get_site(site)
+    if state is None:
+        raise ValueError("Site not exist.")
+    return state.tracer.read()
+
+@mcp.tool()
+def get_queue_history(start: Optional[float] = None, end: Optional[float] = None, resolution: float = 60, site: Optional[str] = None) -> QueueHistory:
+    """
+    Get the history of queue length, devices and power actions recorded on every decision tick, downsampled into buckets.
+
+    Args:
+        start (float | None): Start time in epoch seconds, or negative for seconds before end, e.g. -3600 for the last hour. One hour before end if None.
+        end (float | None): End time in epoch seconds. Now if None.
+        resolution (float): Length of each bucket in seconds. Raised if the range would give more than 1000 buckets.
+        site (str | None): Name of the site, see get_sites(). The default site managing all lanes and the devices of no other site if None.
+
+    Returns:
+        QueueHistory object with the buckets that have decision ticks, e.g.:
+        {
+            "start": 1755586800.0,
+            "end": 1755590400.0,
+            "resolution": 60,
+            "buckets": [
+                {
+                    "timestamp": 1755586800.0,
+                    "ticks": 20,
+                    "queue_length_mean": 6.5,
+                    "queue_length_max": 9,
+                    "active_mean": 2.4,
+                    "device_required_max": 3,
+                    "powered_on": 1,
+                    "powered_off": 0,
+                    "policy": "energy_save"
+                }
+            ]
+        }
+    """
+    end = end if end is not None else time.time()
+    start = start if start is not None else -3600
+    if start < 0:
+        start = end + start
+    empty = QueueHistory(start=start, end=end, resolution=resolution, buckets=[])
+    state = get_site(site)
+    if (state is None) or (state.history_path is None) or (not os.path.exists(state.history_path)):
+        return empty
+    # the file is memory-mapped read-only, the running loop keeps appending to it
+    with TickHistory(state.history_path, readonly=True) as history:
+        return history.query(start, end, resolution)
+
+@mcp.tool()
+def get_sites() -> Dict[str, SiteInfo]:
+    """
+    Get the sites managed by this server, each with its own queue lanes, device pool, policy and queue management loop.
+    The "default" site manages all lanes and the devices of no other site.
+
+    Args:
+        None
+
+    Returns:
+        Dictionary of site lanes (None for all lanes), devices (None for the devices of no other site), selected policy and whether its queue management is running, keyed by site name, e.g.:
+        {
+            "default": {
+                "lanes": None,
+                "devices": None,
+                "policy": "energy_save",
+                "is_running": False
+            },
+            "store-12": {
+                "lanes": ["camera-12a", "camera-12b"],
+                "devices": ["Device 01", "Device 02"],
+                "policy": "erlang_c",
+                "is_running": True
+            }
+        }
+    """
+    infos = {name: state.info() for name, state in sites.items()}
+    # the default site may run as a subprocess
+    infos[DEFAULT_SITE]["is_running"] = get_queue_management_status(DEFAULT_SITE)["is_running"]
+    return infos
+
+@mcp.tool()
+def start_queue_management(site: Optional[str] = None) -> OperationResult:
     """
     Start the queue management service if the following conditions are met:
     - Queue managment policy has been pre-selected through select_queue_policy(), and
     - Queue managment loop has not started.
 
     Args:
-        None
+        site (str | None): Name of the site, see get_sites(). The default site managing all lanes and the devices of no other site if None.
 
     Returns:
         Operation results, e.g.:
@@ -370,14 +554,42 @@ def start_queue_management() -> OperationResult:
         }
     """
     # Initialize queue management process
-    global queue_policy
-    global selected_policy
     global queue_management_process
+    state = get_site(site)
+    if state is None:
+        return OperationResult(
+            success=False,
+            message="Error: Site not exist."
+        )
+    if not is_subprocess(state):
+        if state.engine.is_running():
+            return OperationResult(
+                success=False,
+                message="Failed to start queue management process. The process already started."
+            )
+        try:
+            state.control.publish(state.selected_policy, state.queue_policy)
+            state.engine.start(state.selected_policy, json.dumps(state.queue_policy))
+            return OperationResult(
+                success=True,
+                message="Successfully start queue management process."
+            )
+        except Exception as e:
+            return OperationResult(
+                success=False,
+                message=f"Failed to start queue management process. {e}"
+            )
+
     # check if the process haven't run
     if (queue_management_process is None) or (hasattr(queue_management_process, "poll") and (queue_management_process.poll() is not None)):
         try:
-            log_file = open(log_path, "a", 1)
-            queue_management_process = subprocess.Popen(["uv", "run", queue_management_script, "--strategy", selected_policy, "--config", json.dumps(queue_policy)], stdout=log_file, stderr=log_file, bufsize=1)
+            state.control.publish(state.selected_policy, state.queue_policy)
+            write_status(status_path, "starting")
+            # the worker writes its own rotating log, the startup log only catch output before it starts.
+            # kept apart from the rotating log, which renames its file while these file descriptors stay open,
+            # and truncated on every start so it stays small
+            with open(startup_log_path, "w", 1) as log_file:
+                queue_management_process = subprocess.Popen(["uv", "run", queue_management_script, "--strategy", state.selected_policy, "--config", json.dumps(state.queue_policy), "--control", control_path, "--estimates", estimates_path, "--history", history_path, "--log", log_path, "--status", status_path, "--metrics", metrics_path, "--timings", timings_path, "--exclude-devices", json.dumps(default_exclude_devices)], stdout=log_file, stderr=log_file, bufsize=1)
             return OperationResult(
                 success=True,
                 message="Successfully start queue management process."
@@ -394,12 +606,12 @@ def start_queue_management() -> OperationResult:
     )
 
 @mcp.tool()
-def stop_queue_management() -> OperationResult:
+def stop_queue_management(site: Optional[str] = None) -> OperationResult:
     """
     Stop the running queue management service. If queue managment service is not running, return operation success.
 
     Args:
-        None
+        site (str | None): Name of the site, see get_sites(). The default site managing all lanes and the devices of no other site if None.
 
     Returns:
         Operation results, e.g.:
@@ -409,6 +621,20 @@ def stop_queue_management() -> OperationResult:
         }
     """
     global queue_management_process
+    state = get_site(site)
+    if state is None:
+        return OperationResult(
+            success=False,
+            message="Error: Site not exist."
+        )
+    if not is_subprocess(state):
+        is_running = state.engine.is_running()
+        state.engine.stop()
+        return OperationResult(
+            success=True,
+            message="Successfully stop queue management process." if is_running else "Successfully stop queue management process. The process not running."
+        )
+
     # check if the process haven't run
     if (queue_management_process is None) or (hasattr(queue_management_process, "poll") and (queue_management_process.poll() is not None)):
         return OperationResult(
@@ -419,6 +645,7 @@ def stop_queue_management() -> OperationResult:
     try:
         queue_management_process.terminate()
         queue_management_process = None
+        write_status(status_path, "stopped")
 
         with open(log_path, "a", 1) as log_file:
             log_file.write("Stop Queue management process\n")
@@ -435,12 +662,12 @@ def stop_queue_management() -> OperationResult:
         )
 
 @mcp.tool()
-def get_queue_management_status() -> QueueManagementStatus:
+def get_queue_management_status(site: Optional[str] = None) -> QueueManagementStatus:
     """
     Get the current status of the queue management service.
 
     Args:
-        None
+        site (str | None): Name of the site, see get_sites(). The default site managing all lanes and the devices of no other site if None.
 
     Returns:
         QueueManagementStatus object containing the current status of the queue management service, e.g.:
@@ -450,6 +677,20 @@ def get_queue_management_status() -> QueueManagementStatus:
         }
     """
     global queue_management_process
+    state = get_site(site)
+    if state is None:
+        return QueueManagementStatus(
+            is_running=False,
+            message="Error: Site not exist."
+        )
+    # status of the in-process engine is kept in memory
+    if not is_subprocess(state):
+        is_running, message = state.engine.status()
+        return QueueManagementStatus(
+            is_running=is_running,
+            message=message
+        )
+
     # if the process not running
     if queue_management_process is None:
         return QueueManagementStatus(
@@ -458,9 +699,15 @@ def get_queue_management_status() -> QueueManagementStatus:
         )
     # if the process have error
     if hasattr(queue_management_process, "poll") and (queue_management_process.poll() is not None):
-        error_msg = ""
-        with open(log_path, "r") as log:
-            error_msg = log.readlines()[-1].strip()
+        # the last error recorded by the process, or the last line of its latest log if it exited before recording one
+        status = read_status(status_path)
+        if (status is not None) and (status["state"] == "error"):
+            error_msg = status["message"]
+        else:
+            logs = [path for path in (log_path, startup_log_path) if os.path.exists(path)]
+            # the startup log if the process failed before opening its rotating log
+            last_log = max(logs, key=os.path.getmtime) if logs else None
+            error_msg = "".join(tail_lines(last_log, 1)).strip() if last_log else ""
         return QueueManagementStatus(
             is_running=False,
             message=f"Exit code: {queue_management_process.poll()}. {error_msg}"
@@ -473,6 +720,8 @@ def get_queue_management_status() -> QueueManagementStatus:
 
 if __name__ == "__main__":
     try:
+        # Start reading queue length in background
+        queue_length_tailer.start()
         # Run the server
         mcp.run(transport='streamable-http')
 
@@ -0,0 +1,133 @@
+import os
+import re
+import json
+from typing import TypedDict, Optional, List, Dict
+from queue_length import LaneQueueLengthSource, QueueLengthSource
+from queue_core import policy_config_error
+from queue_engine import QueueManagementEngine
+from policy_control import PolicyControl
+from rate_estimator import RateEstimator
+from tick_trace import TickTracer
+
+
+# Name of the site managing all lanes and the devices no other site claims, always available
+DEFAULT_SITE = "default"
+# Site names are part of file names, e.g. the tick history of the site
+SITE_NAME_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]{0,63}")
+
+
+class SiteConfig(TypedDict):
+    lanes: Optional[List[str]] # lanes (camera message key, or topic:partition) of the site queue, None for all lanes
+    devices: List[str] # device ids of the site device pool, in no other site's pool
+    policy: Optional[str] # selected queue policy, the first policy if None
+    config: Optional[Dict[str, dict]] # configuration overriding the default configuration, keyed by policy name
+
+class SiteInfo(TypedDict):
+    lanes: Optional[List[str]]
+    devices: Optional[List[str]]
+    policy: str
+    is_running: bool
+
+
+class Site:
+    """
+    Queue, device pool, policy configuration and queue management loop of one site (e.g. a store).
+    Every site reads its queue length from a view of the shared queue length source and powers devices through the shared DMT client,
+    so many sites are managed from one process and one event loop.
+    """
+    def __init__(
+            self,
+            name: str,
+            queue_policy: Dict[str, dict],
+            selected_policy: str,
+            tailer: QueueLengthSource,
+            control: PolicyControl,
+            estimator: RateEstimator,
+            engine: Optional[QueueManagementEngine] = None,
+            lanes: Optional[List[str]] = None,
+            devices: Optional[List[str]] = None,
+            history_path: Optional[str] = None,
+            tracer: Optional[TickTracer] = None,
+            exclude_devices: Optional[List[str]] = None,
+        ):
+        self.name = name
+        self.queue_policy = queue_policy
+        self.selected_policy = selected_policy
+        self.tailer = tailer
+        self.control = control
+        self.estimator = estimator
+        self.lanes = lanes
+        self.devices = devices
+        self.exclude_devices = exclude_devices # devices of other sites, if devices is None
+        self.history_path = history_path # tick history file of the site, none if None
+        self.tracer = tracer or TickTracer()
+        self.engine = engine or QueueManagementEngine(tailer, control, estimator, devices=devices, name=f"queue-management-{name}", history_path=history_path, tracer=self.tracer, exclude_devices=exclude_devices)
+
+    def info(self) -> SiteInfo:
+        return SiteInfo(lanes=self.lanes, devices=self.devices, policy=self.selected_policy, is_running=self.engine.is_running())
+
+
+def load_sites(
+        path: Optional[str],
+        tailer: LaneQueueLengthSource,
+        queue_policy: Dict[str, dict],
+        estimator_halflife: float = 900,
+        history_dir: Optional[str] = None,
+    ) -> Dict[str, Site]:
+    """
+    Load the sites from a JSON file of site configuration keyed by site name, e.g.:
+    {
+        "store-12": {"lanes": ["camera-12a", "camera-12b"], "devices": ["Device 01", "Device 02"], "policy": "erlang_c"},
+        "store-40": {"lanes": ["people-count:3"], "devices": ["Device 03"], "config": {"erlang_c": {"target_wait": 60}}}
+    }
+    Return no site if the file does not exist. Each site writes its ticks to `qflow_history.<site>.bin` in `history_dir`, if given.
+    A device belongs to one site only, so two loops never power the same device. Raise ValueError if device pools overlap.
+    Site names are letters, digits, "_", "." and "-", starting with a letter or digit. Raise ValueError otherwise.
+    """
+    if (not path) or (not os.path.exists(path)):
+        return {}
+    with open(path, "r") as f:
+        site_configs: Dict[str, SiteConfig] = json.load(f)
+
+    owners: Dict[str, str] = {}
+    for name, site_config in site_configs.items():
+        if not SITE_NAME_PATTERN.fullmatch(name):
+            raise ValueError(f"Invalid site name: {name!r}. Use up to 64 letters, digits, '_', '.' or '-', starting with a letter or digit.")
+        if not site_config.get("devices"):
+            raise ValueError(f"Site {name}: no devices listed. Devices of no site are managed by the {DEFAULT_SITE} site.")
+        for dev_id in site_config["devices"]: # type: ignore
+            if dev_id in owners:
+                raise ValueError(f"Device {dev_id} is in the device pool of both site {owners[dev_id]} and site {name}.")
+            owners[dev_id] = name
+
+    sites = {}
+    for name, site_config in site_configs.items():
+        if name == DEFAULT_SITE:
+            raise ValueError(f"Site name {DEFAULT_SITE} is reserved for the site managing all lanes and the devices of no other site.")
+        policies = json.loads(json.dumps(queue_policy))
+        for policy, config in (site_config.get("config") or {}).items():
+            if policy not in policies:
+                raise ValueError(f"Site {name}: unknown policy {policy}.")
+            policies[policy].update(config)
+            error = policy_config_error(policy, policies[policy])
+            if error is not None:
+                raise ValueError(f"Site {name}: {error}")
+        selected_policy = site_config.get("policy") or [*policies][0]
+        if selected_policy not in policies:
+            raise ValueError(f"Site {name}: unknown policy {selected_policy}.")
+        sites[name] = Site(
+            name,
+            policies,
+            selected_policy,
+            tailer.view(site_config.get("lanes")),
+            PolicyControl(selected_policy, policies),
+            RateEstimator(halflife=estimator_halflife),
+            lanes=site_config.get("lanes"),
+            devices=site_config.get("devices"),
+            history_path=os.path.join(history_dir, f"qflow_history.{name}.bin") if history_dir else None,
+        )
+    return sites
+
+def claimed_devices(sites: Dict[str, Site]) -> List[str]:
+    """Devices in the device pool of the sites, excluded from the default site's pool."""
+    return [dev_id for site in sites.values() for dev_id in (site.devices or [])]
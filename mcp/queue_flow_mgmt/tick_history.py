@@ -0,0 +1,194 @@
+import os
+import mmap
+import json
+import math
+import time
+import struct
+import bisect
+import numpy as np
+from typing import TypedDict, Optional, List
+
+
+MAGIC = b"QFHIST1\0"
+HEADER = struct.Struct("<8sIIQd") # magic, record size, capacity, records written since creation, epoch of the record time
+HEADER_SIZE = 256 # header followed by the policy names as JSON, padded with null bytes
+WRITTEN_OFFSET = 16 # offset of the records written in the header
+
+# One decision tick in 16 bytes, time in tenths of a second since the file epoch
+RECORD = np.dtype([
+    ("time", "<u4"),
+    ("queue_length", "<u2"),
+    ("active", "<u2"), # devices on
+    ("in_flight", "<u2"), # devices powering on
+    ("device_required", "<u2"),
+    ("powered_on", "u1"), # devices powered on this tick
+    ("powered_off", "u1"), # devices powered off this tick
+    ("policy", "u1"), # index in the policy names of the header
+    ("flags", "u1"),
+])
+FLAG_SKIPPED = 1 # decision skipped, queue length and device state unchanged since the last decision
+
+CHUNK = 65536 # records aggregated at once by queries
+
+
+class HistoryBucket(TypedDict):
+    timestamp: float # start of the bucket in epoch seconds
+    ticks: int
+    queue_length_mean: float
+    queue_length_max: int
+    active_mean: float
+    device_required_max: int
+    powered_on: int
+    powered_off: int
+    policy: str # policy of the last tick in the bucket
+
+class QueueHistory(TypedDict):
+    start: float # epoch seconds
+    end: float
+    resolution: float # seconds per bucket
+    buckets: List[HistoryBucket] # buckets without ticks are left out
+
+
+class TickHistory:
+    """
+    Append-only ring file of fixed-width decision tick records, memory-mapped for reads and writes.
+    A record is 16 bytes, so 30 days of 1 Hz ticks take 41 MB, and once `capacity` records are written the oldest are overwritten.
+    The records written counter in the header is updated after each record, so readers in other processes only see whole records.
+    """
+    def __init__(self, path: str, capacity: int = 30 * 86400, readonly: bool = False):
+        self.path = path
+        self.readonly = readonly
+        if not os.path.exists(path):
+            if readonly:
+                raise FileNotFoundError(path)
+            self.create(path, capacity)
+        self.file = open(path, "rb" if readonly else "r+b")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ if readonly else mmap.ACCESS_WRITE)
+        magic, record_size, self.capacity, _, self.epoch = HEADER.unpack_from(self.mm, 0)
+        if (magic != MAGIC) or (record_size != RECORD.itemsize):
+            self.close()
+            raise ValueError(f"Not a tick history file: {path}")
+        self.records = np.frombuffer(self.mm, dtype=RECORD, count=self.capacity, offset=HEADER_SIZE)
+        self.policies: List[str] = self.read_policies()
+
+    @staticmethod
+    def create(path: str, capacity: int):
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, RECORD.itemsize, capacity, 0, math.floor(time.time())).ljust(HEADER_SIZE, b"\0"))
+            # sparse until written
+            f.truncate(HEADER_SIZE + capacity * RECORD.itemsize)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.records = None
+        self.mm.close()
+        self.file.close()
+
+    @property
+    def written(self) -> int:
+        return struct.unpack_from("<Q", self.mm, WRITTEN_OFFSET)[0]
+
+    def read_policies(self) -> List[str]:
+        names = bytes(self.mm[HEADER.size:HEADER_SIZE]).rstrip(b"\0")
+        return json.loads(names) if names else []
+
+    def policy_index(self, policy: str) -> int:
+        if policy not in self.policies:
+            policies = [*self.policies, policy]
+            names = json.dumps(policies).encode("utf-8")
+            if len(names) > HEADER_SIZE - HEADER.size:
+                raise ValueError("Too many policies in tick history.")
+            self.mm[HEADER.size:HEADER_SIZE] = names.ljust(HEADER_SIZE - HEADER.size, b"\0")
+            self.policies = policies
+        return self.policies.index(policy)
+
+    def append(
+            self,
+            timestamp: float,
+            queue_length: int,
+            active: int,
+            in_flight: int,
+            device_required: int,
+            powered_on: int,
+            powered_off: int,
+            policy: str,
+            skipped: bool = False,
+        ):
+        """Append a decision tick, overwriting the oldest once the file is full. Time before the file epoch and counts are clamped to their field width."""
+        written = self.written
+        self.records[written % self.capacity] = (
+            max(0, round((timestamp - self.epoch) * 10)),
+            min(max(0, queue_length), 0xFFFF),
+            min(active, 0xFFFF),
+            min(in_flight, 0xFFFF),
+            min(max(0, device_required), 0xFFFF),
+            min(powered_on, 0xFF),
+            min(powered_off, 0xFF),
+            self.policy_index(policy),
+            FLAG_SKIPPED if skipped else 0,
+        )
+        struct.pack_into("<Q", self.mm, WRITTEN_OFFSET, written + 1)
+
+    def segments(self) -> List[np.ndarray]:
+        """Views of the written records from oldest to newest, without copying."""
+        written = self.written
+        if written <= self.capacity:
+            return [self.records[:written]]
+        oldest = written % self.capacity
+        return [self.records[oldest:], self.records[:oldest]]
+
+    def query(self, start: float, end: float, resolution: float, max_buckets: int = 1000) -> QueueHistory:
+        """
+        Downsample the ticks from `start` to `end` (epoch seconds) into buckets of `resolution` seconds, in constant memory:
+        the records are read through the memory map in chunks. The resolution is raised if it would give more than `max_buckets` buckets.
+        """
+        resolution = max(resolution, (end - start) / max_buckets, 0.1)
+        count = max(1, math.ceil((end - start) / resolution))
+        ticks = np.zeros(count, dtype=np.int64)
+        queue_sum = np.zeros(count)
+        queue_max = np.zeros(count, dtype=np.int64)
+        active_sum = np.zeros(count)
+        required_max = np.zeros(count, dtype=np.int64)
+        powered_on = np.zeros(count, dtype=np.int64)
+        powered_off = np.zeros(count, dtype=np.int64)
+        policy = np.zeros(count, dtype=np.int64)
+
+        low_time, high_time = (start - self.epoch) * 10, (end - self.epoch) * 10
+        for segment in self.segments():
+            # ticks are in time order within a segment, binary search reads only log(n) records
+            times = segment["time"]
+            low = bisect.bisect_left(times, low_time)
+            high = bisect.bisect_left(times, high_time)
+            for chunk_start in range(low, high, CHUNK):
+                chunk = segment[chunk_start:min(chunk_start + CHUNK, high)]
+                index = ((chunk["time"] - low_time) / 10 // resolution).astype(np.int64)
+                np.clip(index, 0, count - 1, out=index)
+                ticks += np.bincount(index, minlength=count)
+                queue_sum += np.bincount(index, weights=chunk["queue_length"], minlength=count)
+                active_sum += np.bincount(index, weights=chunk["active"], minlength=count)
+                powered_on += np.bincount(index, weights=chunk["powered_on"], minlength=count).astype(np.int64)
+                powered_off += np.bincount(index, weights=chunk["powered_off"], minlength=count).astype(np.int64)
+                np.maximum.at(queue_max, index, chunk["queue_length"])
+                np.maximum.at(required_max, index, chunk["device_required"])
+                policy[index] = chunk["policy"]
+
+        policies = self.read_policies()
+        buckets = []
+        for i in np.flatnonzero(ticks):
+            buckets.append(HistoryBucket(
+                timestamp=float(start + i * resolution),
+                ticks=int(ticks[i]),
+                queue_length_mean=float(queue_sum[i] / ticks[i]),
+                queue_length_max=int(queue_max[i]),
+                active_mean=float(active_sum[i] / ticks[i]),
+                device_required_max=int(required_max[i]),
+                powered_on=int(powered_on[i]),
+                powered_off=int(powered_off[i]),
+                policy=policies[policy[i]] if policy[i] < len(policies) else "",
+            ))
+        return QueueHistory(start=start, end=end, resolution=resolution, buckets=buckets)
@@ -0,0 +1,255 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from typing import TypedDict, Optional, List, Dict, Any
+from latency_histogram import LatencyHistogram
+from json_file import read_json, write_json
+from worker_log import RotatingLog
+from queue_core import qflow_data_dir
+
+
+load_dotenv()
+trace_exporter = os.getenv("trace_exporter", "") # comma separated span exporters: "file", "otel", none if empty
+trace_file = os.getenv("trace_file", os.path.join(qflow_data_dir, "qflow_trace.jsonl")) # spans of the file exporter, one JSON per line
+trace_file_max_bytes = int(os.getenv("trace_file_max_bytes", 10 * 1024 * 1024)) # rotate the span file at this size
+trace_file_backups = int(os.getenv("trace_file_backups", 2)) # rotated span files kept
+
+# Stages of a decision tick, in order, each traced as a child span of the tick
+STAGES = ["queue_length", "devices", "policy", "power_action"]
+# Upper bounds of the stage duration buckets, in seconds
+STAGE_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+
+class Span(TypedDict):
+    trace_id: str # 32 hex digits, shared by the tick and its stages
+    span_id: str # 16 hex digits
+    parent_span_id: Optional[str] # span of the tick for a stage, None for the tick
+    name: str # "tick" or the stage
+    start_time_unix_nano: int
+    end_time_unix_nano: int
+    attributes: Dict[str, Any]
+    status: str # "ok" or "error"
+
+class StageSummary(TypedDict):
+    count: int
+    mean: Optional[float] # in seconds
+    p50: Optional[float]
+    p95: Optional[float]
+    p99: Optional[float]
+    max: Optional[float]
+
+class TickTimings(TypedDict):
+    ticks: int # ticks traced since the loop started
+    stages: Dict[str, StageSummary] # keyed by "tick" and the stages
+    last_tick: Dict[str, float] # seconds spent in the tick and each stage on the last tick
+    updated_at: Optional[float] # epoch seconds
+
+
+class TickTrace:
+    """Spans of one decision tick. Stages are timed with `span()` and the tick is ended by TickTracer.end()."""
+    def __init__(self, attributes: Dict[str, Any]):
+        self.trace_id = os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.attributes = attributes
+        self.start_time = time.time_ns()
+        self.started = time.perf_counter()
+        self.spans: List[Span] = []
+        self.durations: Dict[str, float] = {}
+        self.status = "ok"
+        self.ended = False
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Time a stage of the tick. Attributes can be added to the yielded dict until the stage ends."""
+        start_time = time.time_ns()
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield attributes
+        except Exception:
+            status = self.status = "error"
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            self.durations[name] = self.durations.get(name, 0.0) + duration
+            self.spans.append(Span(
+                trace_id=self.trace_id,
+                span_id=os.urandom(8).hex(),
+                parent_span_id=self.span_id,
+                name=name,
+                start_time_unix_nano=start_time,
+                end_time_unix_nano=start_time + int(duration * 1e9),
+                attributes=attributes,
+                status=status,
+            ))
+
+
+class FileSpanExporter:
+    """Append spans as JSON lines, in a file rotated like the worker log."""
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, backups: int = 2):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.log: Optional[RotatingLog] = None
+
+    def export(self, spans: List[Span]):
+        if self.log is None:
+            self.log = RotatingLog(self.path, max_bytes=self.max_bytes, max_age=0, backups=self.backups)
+        self.log.write("".join(json.dumps(span) + "\n" for span in spans))
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+
+class OpenTelemetrySpanExporter:
+    """
+    Emit the spans of each tick through OpenTelemetry, requires the opentelemetry-api package.
+    Spans go to the tracer provider of the process. If the process has none and OTEL_EXPORTER_OTLP_ENDPOINT is set,
+    a provider exporting over OTLP/HTTP is set up, which requires opentelemetry-sdk and opentelemetry-exporter-otlp-proto-http.
+    """
+    def __init__(self, tracer_provider=None, service_name: str = "queue-flow-management"):
+        from opentelemetry import trace
+        from opentelemetry.trace import Status, StatusCode
+        self.provider = None # provider set up here, shut down on close to flush its spans
+        if (tracer_provider is None) and os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT") and isinstance(trace.get_tracer_provider(), trace.ProxyTracerProvider):
+            try:
+                from opentelemetry.sdk.resources import Resource
+                from opentelemetry.sdk.trace import TracerProvider
+                from opentelemetry.sdk.trace.export import BatchSpanProcessor
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+                self.provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+                self.provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+                trace.set_tracer_provider(self.provider)
+            except ImportError:
+                print("OTLP export requires the 'opentelemetry-sdk' and 'opentelemetry-exporter-otlp-proto-http' packages. Spans go to the default tracer provider.", flush=True)
+        self.trace = trace
+        self.error_status = Status(StatusCode.ERROR)
+        self.tracer = trace.get_tracer("queueflow.tick", tracer_provider=tracer_provider)
+
+    @staticmethod
+    def otel_attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+        # OpenTelemetry attributes are primitive values
+        return {key: value if isinstance(value, (str, bool, int, float)) else str(value) for key, value in attributes.items() if value is not None}
+
+    def export(self, spans: List[Span]):
+        # the tick is the last span, its stages are recreated as its children with their recorded times
+        tick = spans[-1]
+        root = self.tracer.start_span(tick["name"], start_time=tick["start_time_unix_nano"], attributes=self.otel_attributes(tick["attributes"]))
+        context = self.trace.set_span_in_context(root)
+        for span in spans[:-1]:
+            child = self.tracer.start_span(span["name"], context=context, start_time=span["start_time_unix_nano"], attributes=self.otel_attributes(span["attributes"]))
+            if span["status"] == "error":
+                child.set_status(self.error_status)
+            child.end(end_time=span["end_time_unix_nano"])
+        if tick["status"] == "error":
+            root.set_status(self.error_status)
+        root.end(end_time=tick["end_time_unix_nano"])
+
+    def close(self):
+        if self.provider is not None:
+            self.provider.shutdown()
+            self.provider = None
+
+
+exporters: Optional[List] = None
+
+def default_exporters() -> List:
+    """Span exporters selected by trace_exporter, created once and shared by all loops of the process."""
+    global exporters
+    if exporters is None:
+        exporters = []
+        for name in [name.strip() for name in trace_exporter.split(",") if name.strip()]:
+            if name == "file":
+                os.makedirs(os.path.dirname(os.path.abspath(trace_file)), exist_ok=True)
+                exporters.append(FileSpanExporter(trace_file, max_bytes=trace_file_max_bytes, backups=trace_file_backups))
+            elif name == "otel":
+                try:
+                    exporters.append(OpenTelemetrySpanExporter())
+                except ImportError:
+                    print("OpenTelemetry export requires the 'opentelemetry-api' package (pip install opentelemetry-api). Spans are not exported.", flush=True)
+            else:
+                print(f"Unknown trace exporter: {name}. Supported exporters: file, otel", flush=True)
+    return exporters
+
+
+class TickTracer:
+    """
+    Trace every decision tick and its stages: reading the queue length, reading the device state, deciding the devices required
+    by the policy and performing the power actions, so a slow tick can be attributed to Kafka, the policy or DMT.
+    Stage durations are summarized in fixed-bucket histograms in memory, and the spans are handed to the exporters.
+    Without `path`, the summary is kept in memory, for the loop running inside the server.
+    With `path`, the summary is also written to `path` by write(), called periodically by the loop running as a subprocess.
+    """
+    def __init__(self, exporters: Optional[List] = None, path: Optional[str] = None):
+        self.exporters = exporters if exporters is not None else default_exporters()
+        self.path = path
+        self.stages: Dict[str, LatencyHistogram] = {}
+        self.last_tick: Dict[str, float] = {}
+        self.ticks = 0
+        self.updated_at: Optional[float] = None
+
+    def start(self, **attributes) -> TickTrace:
+        return TickTrace(attributes)
+
+    def end(self, trace: TickTrace, **attributes):
+        """End the tick, summarize the durations of the tick and its stages, and export its spans. Does nothing if already ended."""
+        if trace.ended:
+            return
+        trace.ended = True
+        duration = time.perf_counter() - trace.started
+        trace.durations["tick"] = duration
+        trace.spans.append(Span(
+            trace_id=trace.trace_id,
+            span_id=trace.span_id,
+            parent_span_id=None,
+            name="tick",
+            start_time_unix_nano=trace.start_time,
+            end_time_unix_nano=trace.start_time + int(duration * 1e9),
+            attributes={**trace.attributes, **attributes},
+            status=trace.status,
+        ))
+        for name, stage_duration in trace.durations.items():
+            if name not in self.stages:
+                self.stages[name] = LatencyHistogram(buckets=STAGE_BUCKETS)
+            self.stages[name].observe(stage_duration)
+        self.last_tick = trace.durations
+        self.ticks = self.ticks + 1
+        self.updated_at = time.time()
+        for exporter in self.exporters:
+            try:
+                exporter.export(trace.spans)
+            except Exception as e:
+                print(f"Failed to export tick spans. {type(exporter).__name__}: {e}", flush=True)
+
+    def write(self):
+        """Write the tick timings to `path`, if any."""
+        if self.path:
+            write_json(self.path, self.timings())
+
+    def timings(self) -> TickTimings:
+        stages = {}
+        for name in ["tick", *STAGES, *sorted(set(self.stages) - {"tick", *STAGES})]:
+            histogram = self.stages.get(name)
+            if histogram is None:
+                continue
+            stages[name] = StageSummary(
+                count=histogram.count,
+                mean=histogram.sum / histogram.count if histogram.count else None,
+                p50=histogram.quantile(0.5),
+                p95=histogram.quantile(0.95),
+                p99=histogram.quantile(0.99),
+                max=histogram.max if histogram.count else None,
+            )
+        return TickTimings(ticks=self.ticks, stages=stages, last_tick=dict(self.last_tick), updated_at=self.updated_at)
+
+    def read(self) -> TickTimings:
+        """Read the tick timings. With `path`, read the timings written by the running loop."""
+        if self.path:
+            timings = read_json(self.path)
+            if timings:
+                return TickTimings(**timings)
+        return self.timings()
@@ -0,0 +1,92 @@
+import os
+import time
+from typing import TypedDict, Optional, List
+from json_file import read_json, write_json
+
+
+class WorkerStatus(TypedDict):
+    pid: int
+    state: str # "running", "stopped" or "error"
+    message: str # last error if state is "error"
+    updated_at: float # epoch seconds
+
+
+class RotatingLog:
+    """
+    Line buffered text log that rotates to `<path>.1` ... `<path>.<backups>` once a line would take it past `max_bytes`
+    or was written for more than `max_age` seconds since this process opened it, so the worker output never grows without bound.
+    Used as sys.stdout and sys.stderr of the queue management worker.
+    """
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, max_age: float = 86400, backups: int = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age # in seconds, 0 to rotate on size only
+        self.backups = backups
+        self.open()
+
+    def open(self):
+        self.file = open(self.path, "a", 1)
+        self.size = self.file.tell()
+        self.opened_at = time.time()
+        self.line_start = True
+
+    def should_rotate(self, length: int) -> bool:
+        if self.size == 0:
+            return False
+        if self.size + length > self.max_bytes:
+            return True
+        return (self.max_age > 0) and (time.time() - self.opened_at > self.max_age)
+
+    def rotate(self):
+        self.file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.open()
+
+    def write(self, text: str) -> int:
+        length = len(text.encode("utf-8"))
+        # print() writes a line and its line break separately, only rotate between lines
+        if self.line_start and self.should_rotate(length):
+            self.rotate()
+        self.size = self.size + length
+        if text:
+            self.line_start = text.endswith("\n")
+        return self.file.write(text)
+
+    def flush(self):
+        self.file.flush()
+
+    def isatty(self) -> bool:
+        return False
+
+    def close(self):
+        self.file.close()
+
+
+def tail_lines(path: str, count: int = 1, block_size: int = 4096) -> List[str]:
+    """Read the last `count` lines of a file, seeking from the end so only the last blocks are read however large the file."""
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        data = b""
+        # one more line break than lines wanted, so the first line returned is whole
+        while (end > 0) and (data.count(b"\n") <= count):
+            size = min(block_size, end)
+            end = end - size
+            f.seek(end)
+            data = f.read(size) + data
+    return [line.decode("utf-8", errors="replace") for line in data.splitlines()[-count:]]
+
+
+def write_status(path: str, state: str, message: str = ""):
+    """Record the worker state in a small status file, replaced atomically."""
+    write_json(path, WorkerStatus(pid=os.getpid(), state=state, message=message, updated_at=time.time()))
+
+def read_status(path: str) -> Optional[WorkerStatus]:
+    """Read the worker state recorded in the status file. None if the worker never recorded one."""
+    status = read_json(path)
+    return WorkerStatus(**status) if status else None
@@ -5,6 +5,7 @@ from google.adk.models.lite_llm import LiteLlm
 import logging
 from .config import config
 from . import prompts
+from .tool_cache import tool_cache
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +17,9 @@ root_agent = LlmAgent(
     name=config.name,
     description="A Model Context Protocol (MCP) Orchestrator AI Agent for managing queue flows.",
     instruction=prompts.INSTRUCTION,
+    # serve read-only tools from the cache, mutating tools drop the results they change
+    before_tool_callback=tool_cache.before_tool_callback,
+    after_tool_callback=tool_cache.after_tool_callback,
     tools=[
         MCPToolset(
             connection_params=StreamableHTTPServerParams(
@@ -28,6 +32,11 @@ root_agent = LlmAgent(
                 "get_policy_config",
                 "update_policy_config",
                 "get_queue_length",
+                "get_queue_lanes",
+                "get_queue_history",
+                "get_tick_timings",
+                "get_rate_estimates",
+                "get_sites",
                 "start_queue_management",
                 "stop_queue_management",
                 "get_queue_management_status",
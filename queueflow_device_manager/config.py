@@ -18,5 +18,8 @@ class Config(BaseSettings):
     name: str = "queueflow_device_manager"
     API_KEY: str = Field(default="")
     MODEL: str = Field(default=MODEL_OLLAMA)
+    TOOL_CACHE_TTL: float = Field(default=30) # in seconds, results of read-only queue management tools are reused this long
+    TOOL_CACHE_DEVICE_TTL: float = Field(default=5) # in seconds, device power state also changes by the queue management loop
+    TOOL_CACHE_SIZE: int = Field(default=256) # tool results kept, least recently used are evicted first
 
 config = Config()
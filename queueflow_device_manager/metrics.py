@@ -0,0 +1,216 @@
+import os
+import time
+import bisect
+import threading
+from typing import Optional, List, Dict, Callable, Iterable, Any
+
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds of the latency buckets, in seconds
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+
+class HistogramValue:
+    """Counts of observations per bucket, the last count is for observations above the largest bound."""
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count = self.count + 1
+        self.sum = self.sum + value
+
+
+class Registry:
+    """Metrics of the process, rendered in the Prometheus text format. A metric replaces an earlier one of the same name."""
+    def __init__(self):
+        self.metrics: Dict[str, "Metric"] = {}
+
+    def register(self, metric: "Metric"):
+        self.metrics[metric.name] = metric
+
+    def render(self, skip: Iterable[str] = ()) -> str:
+        """Render all metrics except those named in `skip`."""
+        skip = set(skip)
+        lines = []
+        for metric in list(self.metrics.values()):
+            if metric.name not in skip:
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n" if lines else ""
+
+REGISTRY = Registry()
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+def format_labels(names: Iterable[str], values: Iterable[Any]) -> str:
+    escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def family_names(text: str) -> set:
+    """Names of the metrics rendered in `text`, e.g. the metrics written by another process."""
+    return {line.split()[2] for line in text.splitlines() if line.startswith("# TYPE ")}
+
+
+class Metric:
+    """
+    Metric with optional labels. Values are set by the process as events happen, or read from `collect` when rendered,
+    a callable returning the value of each label values tuple. Values may be set from any thread, e.g. the Kafka consumer.
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), registry: Optional[Registry] = REGISTRY, collect: Optional[Callable[[], Dict[tuple, Any]]] = None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.collect = collect
+        self.values: Dict[tuple, Any] = {}
+        self.lock = threading.RLock() # values are updated and rendered from different threads
+        if registry is not None:
+            registry.register(self)
+
+    def key(self, labels: Dict[str, Any]) -> tuple:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {', '.join(self.label_names)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def items(self) -> List[tuple]:
+        if self.collect is not None:
+            return sorted(self.collect().items())
+        with self.lock:
+            return sorted(self.values.items())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self.items():
+            lines.append(f"{self.name}{format_labels(self.label_names, key)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), registry: Optional[Registry] = REGISTRY, collect=None, buckets: Optional[List[float]] = None):
+        super().__init__(name, documentation, labels, registry, collect)
+        self.buckets = sorted(buckets or DEFAULT_BUCKETS)
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            histogram = self.values.get(key)
+            if histogram is None:
+                histogram = self.values[key] = HistogramValue(self.buckets)
+            histogram.observe(value)
+
+    def time(self, **labels) -> "Timer":
+        """Observe the time spent in a `with` block."""
+        return Timer(self, labels)
+
+    def render(self) -> List[str]:
+        # hold the lock throughout, so the buckets, sum and count of a histogram are rendered from the same observations
+        with self.lock:
+            return self.render_histograms()
+
+    def render_histograms(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, histogram in self.items():
+            # any value with buckets, counts, count and sum, e.g. a latency histogram kept by the process
+            cumulative = 0
+            for bound, count in zip([*histogram.buckets, float("inf")], histogram.counts):
+                cumulative = cumulative + count
+                labels = format_labels([*self.label_names, "le"], [*key, format_value(bound)])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(histogram.sum)}")
+            lines.append(f"{self.name}_count{labels} {histogram.count}")
+        return lines
+
+
+class Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, Any]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+def write_metrics(path: str, registry: Registry = REGISTRY):
+    """Write the metrics to a file replaced atomically, for another process to serve."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(registry.render())
+    os.replace(temp_path, path)
+
+def read_metrics(path: str) -> str:
+    """Read the metrics written by another process. Empty if none written."""
+    try:
+        with open(path) as f:
+            return f.read()
+    except FileNotFoundError:
+        return ""
+
+
+def instrument_mcp(mcp, registry: Registry = REGISTRY, extra: Optional[Callable[[], str]] = None):
+    """
+    Measure the latency and errors of every tool call of a FastMCP server, and serve the metrics at /metrics.
+    `extra` returns more metrics in text format to serve, e.g. written by a worker process.
+    """
+    tool_duration = Histogram("mcp_tool_duration_seconds", "Latency of MCP tool calls.", ["tool"], registry)
+    tool_errors = Counter("mcp_tool_errors_total", "MCP tool calls that raised an error.", ["tool"], registry)
+    # FastMCP has no public hook around tool calls, its private tool manager is called for every tool call (mcp 1.12).
+    # A FastMCP release without it leaves tool calls unmeasured instead of failing the server.
+    tool_manager = getattr(mcp, "_tool_manager", None)
+    call_tool = getattr(tool_manager, "call_tool", None)
+
+    async def metered_call_tool(name: str, arguments: dict, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await call_tool(name, arguments, **kwargs) # type: ignore
+        except Exception:
+            tool_errors.inc(tool=name)
+            raise
+        finally:
+            tool_duration.observe(time.perf_counter() - started, tool=name)
+
+    if callable(call_tool):
+        tool_manager.call_tool = metered_call_tool
+    else:
+        print("FastMCP tool manager not found, MCP tool calls are not measured.", flush=True)
+
+    @mcp.custom_route("/metrics", methods=["GET"])
+    async def metrics(request):
+        from starlette.responses import Response
+        text = extra() if extra is not None else ""
+        return Response(registry.render(skip=family_names(text)) + text, media_type=CONTENT_TYPE)
@@ -0,0 +1,145 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from .config import config
+from .metrics import Counter, Gauge
+
+# Read-only tools whose results are served from the cache, with their time to live in seconds
+CACHED_TOOLS = {
+    "get_queue_policy": config.TOOL_CACHE_TTL,
+    "get_current_queue_policy": config.TOOL_CACHE_TTL,
+    "get_policy_config": config.TOOL_CACHE_TTL,
+    "get_devices": config.TOOL_CACHE_DEVICE_TTL,
+}
+# Mutating tools and the cached tools whose results they change
+INVALIDATES = {
+    "select_queue_policy": ["get_current_queue_policy"],
+    "update_policy_config": ["get_policy_config", "get_queue_policy"],
+    "power_on_devices": ["get_devices"],
+    "power_off_devices": ["get_devices"],
+    # the queue management loop powers devices on and off
+    "start_queue_management": ["get_devices"],
+    "stop_queue_management": ["get_devices"],
+}
+# Cached tools taking a site, only invalidated by mutating tools of the same site
+SITE_TOOLS = {"get_current_queue_policy", "get_policy_config"}
+DEFAULT_SITE = "default"
+
+# Metrics of the tool cache, served at /metrics
+tool_cache_requests = Counter("agent_tool_cache_requests_total", "Read-only tool calls served from the cache (hit) or the MCP server (miss).", ["tool", "result"])
+tool_cache_invalidations = Counter("agent_tool_cache_invalidations_total", "Cached tool results dropped by a mutating tool call.", ["tool"])
+
+
+class ToolResultCache:
+    """
+    TTL and LRU cache of the results of read-only MCP tools, shared by every user and session of the agent,
+    so repeated calls to e.g. get_devices in a conversation do not each make a round trip to the MCP server.
+    Hooked into the agent as before_tool_callback and after_tool_callback. Mutating tool calls drop the cached results
+    they change, both before and after the call, and results read while a mutating call was in flight are not cached.
+    """
+    def __init__(self, ttls: Optional[Dict[str, float]] = None, invalidates: Optional[Dict[str, List[str]]] = None, max_size: int = 256):
+        self.ttls = CACHED_TOOLS if ttls is None else ttls
+        self.invalidates = INVALIDATES if invalidates is None else invalidates
+        self.max_size = max_size
+        self.entries: OrderedDict[tuple, tuple[float, Any]] = OrderedDict() # result and its expiry time, keyed by tool, arguments and site
+        self.generation = 0 # incremented on every invalidation
+        self.pending: OrderedDict[Any, int] = OrderedDict() # generation at the start of each read-only call in flight, keyed by function call ID
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def site(tool: str, args: Dict[str, Any]) -> Optional[str]:
+        return (args.get("site") or DEFAULT_SITE) if tool in SITE_TOOLS else None
+
+    @staticmethod
+    def key(tool: str, args: Dict[str, Any]) -> tuple:
+        return (tool, json.dumps(args, sort_keys=True, default=str), ToolResultCache.site(tool, args))
+
+    def get(self, tool: str, args: Dict[str, Any]) -> Optional[Any]:
+        key = self.key(tool, args)
+        entry = self.entries.get(key)
+        if (entry is None) or (entry[0] <= time.monotonic()):
+            if entry is not None:
+                del self.entries[key]
+            self.misses = self.misses + 1
+            tool_cache_requests.inc(tool=tool, result="miss")
+            return None
+        self.entries.move_to_end(key)
+        self.hits = self.hits + 1
+        tool_cache_requests.inc(tool=tool, result="hit")
+        return entry[1]
+
+    def ttl(self, tool: str, args: Dict[str, Any]) -> float:
+        # a caller asking for information at most max_age seconds old never gets an older cached result
+        max_age = args.get("max_age")
+        return self.ttls[tool] if max_age is None else min(self.ttls[tool], float(max_age))
+
+    def put(self, tool: str, args: Dict[str, Any], result: Any):
+        ttl = self.ttl(tool, args)
+        if ttl <= 0:
+            return
+        key = self.key(tool, args)
+        self.entries[key] = (time.monotonic() + ttl, result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, tool: str, args: Dict[str, Any]):
+        """Drop the cached results changed by a call to the mutating `tool`. Results of site tools are only dropped for its site."""
+        tools = self.invalidates.get(tool, [])
+        site = args.get("site") or DEFAULT_SITE
+        self.generation = self.generation + 1
+        # results of the calls in flight are not cached anymore
+        self.pending.clear()
+        for key in [key for key in self.entries if (key[0] in tools) and (key[2] in (None, site))]:
+            del self.entries[key]
+            tool_cache_invalidations.inc(tool=key[0])
+
+    @staticmethod
+    def call_id(tool_context) -> Any:
+        return getattr(tool_context, "function_call_id", None) or id(tool_context)
+
+    @staticmethod
+    def is_error(result: Any) -> bool:
+        # MCP tools return a CallToolResult, flagged on error
+        if isinstance(result, dict):
+            return bool(result.get("isError") or result.get("error"))
+        return bool(getattr(result, "isError", False))
+
+    def before_tool_callback(self, tool, args: Dict[str, Any], tool_context) -> Optional[Any]:
+        """Serve the result of a read-only tool from the cache. The tool is called if None is returned."""
+        if tool.name in self.invalidates:
+            self.invalidate(tool.name, args)
+            return None
+        if tool.name not in self.ttls:
+            return None
+        if self.ttl(tool.name, args) <= 0:
+            return None
+        result = self.get(tool.name, args)
+        if result is None:
+            self.pending[self.call_id(tool_context)] = self.generation
+            # calls that failed never reach after_tool_callback, drop the oldest
+            while len(self.pending) > self.max_size:
+                self.pending.popitem(last=False)
+        return result
+
+    def after_tool_callback(self, tool, args: Dict[str, Any], tool_context, tool_response: Any) -> None:
+        """Cache the result of a read-only tool, or drop the results changed by a mutating tool. Never changes the result."""
+        if tool.name in self.invalidates:
+            self.invalidate(tool.name, args)
+            return None
+        generation = self.pending.pop(self.call_id(tool_context), None)
+        # skip results read while a mutating call was in flight, they may be stale already
+        if (generation is not None) and (generation == self.generation) and not self.is_error(tool_response):
+            self.put(tool.name, args, tool_response)
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_ratio": self.hits / requests if requests else None, "entries": len(self.entries)}
+
+
+# Shared by every session of the agent
+tool_cache = ToolResultCache(max_size=config.TOOL_CACHE_SIZE)
+Gauge("agent_tool_cache_entries", "Tool results held in the cache.", collect=lambda: {(): len(tool_cache.entries)})
@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+import dmt_utils # noqa: E402
+from tests.mock_dmt_api import MockDMTServer # noqa: E402
+
+# Latency of DMT GET requests with a new httpx.AsyncClient per request (before) vs. the shared pooled client (after).
+# Usage: uv run tests/bench_dmt_client.py --requests 500 --latency 0.001
+
+
+async def get_with_new_client(url: str) -> dict:
+    # what make_dmt_get_request did before the pooled client
+    async with httpx.AsyncClient() as client:
+        headers = {
+            "User-Agent": dmt_utils.USER_AGENT,
+            "Accept": "application/json",
+            "Authorization": f"Bearer {dmt_utils.token}"
+        }
+        response = await client.get(url, headers=headers, timeout=30.0)
+        response.raise_for_status()
+        return response.json()
+
+async def measure(request, url: str, count: int) -> list[float]:
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        await request(url)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def summary(name: str, latencies: list[float]) -> str:
+    ms = sorted(x * 1000 for x in latencies)
+    p95 = ms[int(0.95 * (len(ms) - 1))]
+    return f"{name:<10} mean {statistics.mean(ms):8.3f} ms | p50 {statistics.median(ms):8.3f} ms | p95 {p95:8.3f} ms | total {sum(ms) / 1000:7.3f} s"
+
+async def run(count: int, api_base: str):
+    dmt_utils.DMT_API_BASE = api_base
+    url = f"{api_base}/amt/power/state/{'00000000-0000-0000-0000-000000000001'}"
+    try:
+        await dmt_utils.authorize()
+        before = await measure(get_with_new_client, url, count)
+        after = await measure(dmt_utils.make_dmt_get_request, url, count)
+    finally:
+        await dmt_utils.close_client()
+    print(summary("before", before))
+    print(summary("after", after))
+    print(f"speedup    {statistics.mean(before) / statistics.mean(after):.1f}x")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="bench_dmt_client.py",
+        description="Benchmark per-request vs. pooled DMT client.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--requests", type=int, default=500, help="Number of requests per client mode.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Server-side latency per request, in seconds.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    with MockDMTServer(device_count=1, latency=args.latency) as server:
+        asyncio.run(run(args.requests, server.api_base))
@@ -0,0 +1,163 @@
+import io
+import os
+import sys
+import time
+import asyncio
+import logging
+import contextlib
+import argparse
+import statistics
+import importlib.util
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+from tests.mock_dmt_api import MockDMTServer, Latency # noqa: E402
+
+# Discovery and power action throughput and latency at fleet scale, against the mock DMT API with configurable latency,
+# error rates and boot delays. Client and mock server share one process, so absolute numbers are a lower bound.
+# Usage: uv run tests/bench_dmt_fleet.py --devices 10 100 1000 --latency 0.005 --latency-distribution lognormal --error-rate 0.01
+
+
+def load_target(name: str):
+    """DMT client to measure: dmt_utils of the queue management loop, or the device MCP server."""
+    if name == "dmt_utils":
+        import dmt_utils
+        return dmt_utils
+    server_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "device_mgmt_toolkit", "server.py")
+    sys.path.append(os.path.dirname(server_path))
+    spec = importlib.util.spec_from_file_location("device_mgmt_server", server_path)
+    module = importlib.util.module_from_spec(spec) # type: ignore
+    spec.loader.exec_module(module) # type: ignore
+    return module
+
+def percentiles(latencies: list[float]) -> tuple[float, float, float]:
+    """p50, p95 and p99 in milliseconds."""
+    if not latencies:
+        return (float("nan"),) * 3 # type: ignore
+    if len(latencies) == 1:
+        return (latencies[0] * 1000,) * 3 # type: ignore
+    cuts = statistics.quantiles([x * 1000 for x in latencies], n=100, method="inclusive")
+    return cuts[49], cuts[94], cuts[98]
+
+async def run(target, api_base: str, boot_timeout: float = 0.0) -> dict:
+    """Discover all devices, then power on every device that is off. Return the throughput and latency of both."""
+    target.DMT_API_BASE = api_base
+    target.token, target.token_expiry, target.token_refresh = None, None, None
+    if hasattr(target, "boot_latency"):
+        target.boot_latency = type(target.boot_latency)()
+
+    # time every DMT request, as seen by the client
+    request_latencies = []
+    make_dmt_request = target.make_dmt_request
+    async def timed_request(method, url, json=None):
+        start = time.perf_counter()
+        try:
+            return await make_dmt_request(method, url, json=json)
+        finally:
+            request_latencies.append(time.perf_counter() - start)
+    target.make_dmt_request = timed_request
+
+    try:
+        await target.authorize()
+        request_latencies.clear()
+        start = time.perf_counter()
+        await target.get_all_device()
+        discovery_time = time.perf_counter() - start
+        devices = target.all_device if isinstance(target.all_device, dict) else {}
+        discovery_latencies = list(request_latencies)
+        failed_lookups = sum(device["pwr_status"].startswith("Unable") or device["ip_addr"].startswith("Unable") for device in devices.values())
+
+        request_latencies.clear()
+        off = [dev_id for dev_id, device in devices.items() if device["pwr_status"] == "off"]
+        start = time.perf_counter()
+        results = [result async for result in target.batch_power_action(off, target.POWER_ON)]
+        action_time = time.perf_counter() - start
+        action_latencies = list(request_latencies)
+
+        # wait for the powered on devices to be confirmed on, dmt_utils only
+        boot = None
+        if (boot_timeout > 0) and hasattr(target, "power_transitions"):
+            deadline = time.monotonic() + boot_timeout
+            while target.power_transitions and (time.monotonic() < deadline):
+                await asyncio.sleep(0.1)
+            boot = target.boot_latency.summary()
+    finally:
+        for task in list(getattr(target, "power_transitions", {}).values()):
+            task.cancel()
+        target.make_dmt_request = make_dmt_request
+        await target.close_client()
+
+    return {
+        "devices": len(devices),
+        "discovery_time": discovery_time,
+        "discovery_requests": len(discovery_latencies),
+        "discovery_latency": percentiles(discovery_latencies),
+        "failed_lookups": failed_lookups,
+        "actions": len(results),
+        "action_time": action_time,
+        "action_latency": percentiles(action_latencies),
+        "failed_actions": sum(not result["success"] for result in results),
+        "boot": boot,
+    }
+
+def run_size(target, device_count: int, boot_timeout: float = 0.0, **mock) -> dict:
+    # leave out the per-device output of the DMT client
+    with MockDMTServer(device_count=device_count, **mock) as server, contextlib.redirect_stdout(io.StringIO()):
+        return asyncio.run(run(target, server.api_base, boot_timeout))
+
+def report(result: dict) -> str:
+    line = (
+        f"{result['devices']:>7} | discovery {result['discovery_time']:7.3f} s {result['devices'] / result['discovery_time']:8.1f} dev/s"
+        f" | request p50 {result['discovery_latency'][0]:7.2f} p95 {result['discovery_latency'][1]:7.2f} p99 {result['discovery_latency'][2]:7.2f} ms"
+        f" | failed {result['failed_lookups']:>4}"
+        f" | power on {result['actions']:>4} in {result['action_time']:7.3f} s {result['actions'] / result['action_time'] if result['action_time'] else 0:8.1f} /s"
+        f" | action p50 {result['action_latency'][0]:7.2f} p95 {result['action_latency'][1]:7.2f} p99 {result['action_latency'][2]:7.2f} ms"
+        f" | failed {result['failed_actions']:>4}"
+    )
+    if result["boot"] is not None:
+        boot = result["boot"]
+        line = line + f" | boot confirmed {boot['count']:>4} p50 {boot['p50'] or 0:6.1f} p90 {boot['p90'] or 0:6.1f} s"
+    return line
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="bench_dmt_fleet.py",
+        description="Benchmark device discovery and power actions at fleet scale.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--devices", type=int, nargs="+", default=[10, 100, 1000], help="Fleet sizes to measure.")
+    parser.add_argument("--target", default="dmt_utils", choices=["dmt_utils", "device_server"], help="DMT client to measure.")
+    parser.add_argument("--latency", type=float, default=0.005, help="Mean server-side latency per request, in seconds.")
+    parser.add_argument("--latency-distribution", default="lognormal", choices=Latency.distributions, help="Distribution of the request latency.")
+    parser.add_argument("--latency-spread", type=float, default=0.5, help="Spread of the uniform and lognormal latency distributions.")
+    parser.add_argument("--action-latency", type=float, default=0.05, help="Mean server-side latency of power actions, in seconds.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of per-device requests failing with HTTP 500.")
+    parser.add_argument("--action-failure-rate", type=float, default=0.0, help="Fraction of power actions failed by the device.")
+    parser.add_argument("--boot-delay", type=float, default=0.0, help="Mean time from power on until the device reports on, in seconds.")
+    parser.add_argument("--boot-timeout", type=float, default=0.0, help="Wait this long for boots to be confirmed (dmt_utils only), in seconds. 0 to skip.")
+    parser.add_argument("--confirm-interval", type=float, default=0.5, help="Poll interval of power transitions, in seconds.")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the random latencies, errors and delays.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    target = load_target(args.target)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if hasattr(target, "DMT_confirm_interval"):
+        target.DMT_confirm_interval = args.confirm_interval
+    print(f"target {args.target}, latency {args.latency_distribution} mean {args.latency * 1000:.1f} ms (power action {args.action_latency * 1000:.1f} ms), "
+          f"error rate {args.error_rate}, action failure rate {args.action_failure_rate}, boot delay {args.boot_delay} s", flush=True)
+    for device_count in args.devices:
+        result = run_size(
+            target,
+            device_count,
+            boot_timeout=args.boot_timeout,
+            latency=Latency(args.latency, args.latency_distribution, args.latency_spread),
+            endpoint_latency={"power_action": Latency(args.action_latency, args.latency_distribution, args.latency_spread)},
+            boot_delay=Latency(args.boot_delay, args.latency_distribution, args.latency_spread),
+            error_rate=args.error_rate,
+            action_failure_rate=args.action_failure_rate,
+            seed=args.seed,
+        )
+        print(report(result), flush=True)
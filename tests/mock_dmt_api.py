@@ -0,0 +1,296 @@
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import base64
+import socket
+import asyncio
+import argparse
+import threading
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+# Stand-in of the Intel® DMT REST API, used to measure dmt_utils and the device MCP server without AMT hardware.
+
+API_PREFIX = "/api/v1"
+# Endpoints, for per-endpoint latency
+ENDPOINTS = ["authorize", "devices", "power_state", "power_action", "network_settings"]
+
+
+class Latency:
+    """
+    Distribution of a delay in seconds with the given mean:
+        "constant": always the mean
+        "uniform": uniform within mean * (1 +/- spread)
+        "exponential": exponential, e.g. requests queued at a busy server
+        "lognormal": lognormal with shape spread, a long tail like real AMT round trips
+    """
+    distributions = ["constant", "uniform", "exponential", "lognormal"]
+
+    def __init__(self, mean: float = 0.0, distribution: str = "constant", spread: float = 0.5):
+        if distribution not in self.distributions:
+            raise ValueError(f"Unknown latency distribution: {distribution}. Supported distributions: {', '.join(self.distributions)}")
+        self.mean = mean
+        self.distribution = distribution
+        self.spread = spread
+
+    @classmethod
+    def of(cls, latency: "Latency | float") -> "Latency":
+        return latency if isinstance(latency, Latency) else cls(latency)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.mean <= 0:
+            return 0.0
+        match self.distribution:
+            case "uniform": return max(0.0, rng.uniform(self.mean * (1 - self.spread), self.mean * (1 + self.spread)))
+            case "exponential": return rng.expovariate(1 / self.mean)
+            # mu chosen so the mean stays self.mean
+            case "lognormal": return rng.lognormvariate(math.log(self.mean) - self.spread ** 2 / 2, self.spread)
+            case _: return self.mean
+
+
+def make_devices(count: int) -> dict[str, dict]:
+    """Create `count` fake devices keyed by GUID. Odd devices start powered on."""
+    devices = {}
+    for i in range(1, count + 1):
+        guid = str(uuid.UUID(int=i))
+        devices[guid] = {
+            "guid": guid,
+            "friendlyName": f"Device {i:02d}",
+            "hostname": f"kiosk-{i:02d}",
+            "ip_addr": f"10.0.{i // 256}.{i % 256}",
+            "powerstate": 2 if i % 2 else 8,
+        }
+    return devices
+
+
+def make_token(expiry: float) -> str:
+    """Create an unsigned JWT token expiring at `expiry` (epoch seconds)."""
+    def encode(data: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+    return f"{encode({'alg': 'none', 'typ': 'JWT'})}.{encode({'exp': expiry, 'jti': uuid.uuid4().hex})}."
+
+
+class MockDMTState:
+    def __init__(
+            self,
+            device_count: int = 3,
+            latency: Latency | float = 0.0,
+            token_ttl: float = 3600,
+            boot_delay: Latency | float = 0.0,
+            shutdown_delay: Latency | float = 0.0,
+            endpoint_latency: dict[str, Latency | float] | None = None,
+            error_rate: float = 0.0,
+            action_failure_rate: float = 0.0,
+            seed: int | None = None,
+        ):
+        self.devices = make_devices(device_count)
+        self.latency = Latency.of(latency) # in seconds, added to every request
+        self.endpoint_latency = {endpoint: Latency.of(value) for endpoint, value in (endpoint_latency or {}).items()} # replaces latency for these endpoints
+        self.token_ttl = token_ttl # in seconds
+        self.boot_delay = Latency.of(boot_delay) # in seconds, power state stays off this long after power on
+        self.shutdown_delay = Latency.of(shutdown_delay) # in seconds, power state stays on this long after power off
+        self.error_rate = error_rate # fraction of per-device requests failing with HTTP 500
+        self.action_failure_rate = action_failure_rate # fraction of power actions accepted but failed by the device (non-zero ReturnValue)
+        self.rng = random.Random(seed)
+        self.pending = {} # GUID -> (power state, time the device reaches it)
+        self.tokens = {} # issued token -> expiry
+        self.connections = set() # (host, port) of every client connection seen
+        self.requests = 0
+        self.authorize_requests = 0
+        self.error_guids = set() # per-device requests for these GUIDs fail with HTTP 500
+        self.errors = 0 # requests failed by error_rate
+        self.action_failures = 0 # power actions failed by action_failure_rate
+
+    async def on_request(self, request: Request, endpoint: str):
+        self.requests += 1
+        if request.client is not None:
+            self.connections.add((request.client.host, request.client.port))
+        delay = self.endpoint_latency.get(endpoint, self.latency).sample(self.rng)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def is_failing(self, device: dict) -> bool:
+        if device["guid"] in self.error_guids:
+            return True
+        if (self.error_rate > 0) and (self.rng.random() < self.error_rate):
+            self.errors += 1
+            return True
+        return False
+
+    def is_authorized(self, request: Request) -> bool:
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        return self.tokens.get(token, 0) > time.time()
+
+    def revoke_tokens(self):
+        self.tokens.clear()
+
+    def power_state(self, device: dict) -> int:
+        pending = self.pending.get(device["guid"])
+        if (pending is not None) and (time.monotonic() >= pending[1]):
+            device["powerstate"] = pending[0]
+            del self.pending[device["guid"]]
+        return device["powerstate"]
+
+    def set_power_state(self, device: dict, action: int):
+        delay = (self.boot_delay if action == 2 else self.shutdown_delay).sample(self.rng)
+        if delay > 0:
+            self.pending[device["guid"]] = (action, time.monotonic() + delay)
+        else:
+            self.pending.pop(device["guid"], None)
+            device["powerstate"] = action
+
+
+def create_app(state: MockDMTState) -> Starlette:
+    async def authorize(request: Request):
+        await state.on_request(request, "authorize")
+        state.authorize_requests += 1
+        expiry = time.time() + state.token_ttl
+        token = make_token(expiry)
+        state.tokens[token] = expiry
+        return JSONResponse({"token": token})
+
+    def unauthorized():
+        return JSONResponse({"message": "Unauthorized"}, status_code=401)
+
+    async def devices(request: Request):
+        await state.on_request(request, "devices")
+        if not state.is_authorized(request):
+            return unauthorized()
+        return JSONResponse([
+            {"guid": d["guid"], "friendlyName": d["friendlyName"], "hostname": d["hostname"]}
+            for d in state.devices.values()
+        ])
+
+    async def power_state(request: Request):
+        await state.on_request(request, "power_state")
+        if not state.is_authorized(request):
+            return unauthorized()
+        device = state.devices.get(request.path_params["guid"])
+        if device is None:
+            return JSONResponse({"error": "Device not found"}, status_code=404)
+        if state.is_failing(device):
+            return JSONResponse({"error": "Internal server error"}, status_code=500)
+        return JSONResponse({"powerstate": state.power_state(device)})
+
+    async def power_action(request: Request):
+        await state.on_request(request, "power_action")
+        if not state.is_authorized(request):
+            return unauthorized()
+        device = state.devices.get(request.path_params["guid"])
+        if device is None:
+            return JSONResponse({"error": "Device not found"}, status_code=404)
+        if state.is_failing(device):
+            return JSONResponse({"error": "Internal server error"}, status_code=500)
+        payload = await request.json()
+        if (state.action_failure_rate > 0) and (state.rng.random() < state.action_failure_rate):
+            state.action_failures += 1
+            return JSONResponse({"ReturnValue": 2})
+        state.set_power_state(device, payload["action"])
+        return JSONResponse({"ReturnValue": 0})
+
+    async def network_settings(request: Request):
+        await state.on_request(request, "network_settings")
+        if not state.is_authorized(request):
+            return unauthorized()
+        device = state.devices.get(request.path_params["guid"])
+        if device is None:
+            return JSONResponse({"error": "Device not found"}, status_code=404)
+        if state.is_failing(device):
+            return JSONResponse({"error": "Internal server error"}, status_code=500)
+        return JSONResponse({"wired": {"ipAddress": device["ip_addr"]}, "wireless": {"ipAddress": None}})
+
+    return Starlette(routes=[
+        Route(f"{API_PREFIX}/authorize", authorize, methods=["POST"]),
+        Route(f"{API_PREFIX}/devices", devices, methods=["GET"]),
+        Route(f"{API_PREFIX}/amt/power/state/{{guid}}", power_state, methods=["GET"]),
+        Route(f"{API_PREFIX}/amt/power/action/{{guid}}", power_action, methods=["POST"]),
+        Route(f"{API_PREFIX}/amt/networkSettings/{{guid}}", network_settings, methods=["GET"]),
+    ])
+
+
+class MockDMTServer:
+    """
+    Run the mock DMT API in a background thread on a free local port, e.g.:
+
+        with MockDMTServer(device_count=10) as server:
+            dmt_utils.DMT_API_BASE = server.api_base
+    """
+    def __init__(self, device_count: int = 3, latency: Latency | float = 0.0, token_ttl: float = 3600, boot_delay: Latency | float = 0.0, shutdown_delay: Latency | float = 0.0, host: str = "127.0.0.1", port: int = 0, **kwargs):
+        # kwargs: endpoint_latency, error_rate, action_failure_rate and seed of MockDMTState
+        self.state = MockDMTState(device_count=device_count, latency=latency, token_ttl=token_ttl, boot_delay=boot_delay, shutdown_delay=shutdown_delay, **kwargs)
+        self.host = host
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(create_app(self.state), log_level="warning", lifespan="off"))
+        self.thread = None
+
+    @property
+    def api_base(self) -> str:
+        return f"http://{self.host}:{self.port}{API_PREFIX}"
+
+    def __enter__(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.bind((self.host, self.port))
+        self.port = sock.getsockname()[1]
+        self.thread = threading.Thread(target=self.server.run, kwargs={"sockets": [sock]}, daemon=True)
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError("Mock DMT server failed to start.")
+            threading.Event().wait(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=5) # type: ignore
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="mock_dmt_api.py",
+        description="Stand-in Intel® DMT REST API.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--port", type=int, default=8181, help="Port to listen on.")
+    parser.add_argument("--devices", type=int, default=3, help="Number of fake devices.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean latency added to every request, in seconds.")
+    parser.add_argument("--latency-distribution", default="constant", choices=Latency.distributions, help="Distribution of the request latency.")
+    parser.add_argument("--latency-spread", type=float, default=0.5, help="Spread of the uniform and lognormal latency distributions.")
+    parser.add_argument("--action-latency", type=float, default=None, help="Mean latency of power actions, in seconds. Same as --latency if not set.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of per-device requests failing with HTTP 500.")
+    parser.add_argument("--action-failure-rate", type=float, default=0.0, help="Fraction of power actions failed by the device.")
+    parser.add_argument("--boot-delay", type=float, default=0.0, help="Mean time from power on until the device reports on, in seconds.")
+    parser.add_argument("--shutdown-delay", type=float, default=0.0, help="Mean time from power off until the device reports off, in seconds.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the random latencies, errors and delays.")
+    return parser.parse_args(argv)
+
+
+def make_state(args) -> MockDMTState:
+    """Mock DMT state configured from the command line."""
+    latency = Latency(args.latency, args.latency_distribution, args.latency_spread)
+    return MockDMTState(
+        device_count=args.devices,
+        latency=latency,
+        boot_delay=Latency(args.boot_delay, args.latency_distribution, args.latency_spread),
+        shutdown_delay=Latency(args.shutdown_delay, args.latency_distribution, args.latency_spread),
+        endpoint_latency={"power_action": Latency(args.action_latency, args.latency_distribution, args.latency_spread)} if args.action_latency is not None else None,
+        error_rate=args.error_rate,
+        action_failure_rate=args.action_failure_rate,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    try:
+        uvicorn.run(create_app(make_state(args)), host="localhost", port=args.port)
+
+    except KeyboardInterrupt:
+        print("Server has been shut down.")
@@ -0,0 +1,62 @@
+import os
+import sys
+import json
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+import backtest # noqa: E402
+from queue_management_utils import calculate_devices # noqa: E402
+
+configs = [
+    {"arrival_rate": 1.5, "service_rate": 0.5, "min_devices": 1, "buffer": 0.2, "target_wait": 120},
+    {"arrival_rate": 3.0, "service_rate": 0.7, "min_devices": 2, "buffer": 0.5, "target_wait": 45},
+    {"arrival_rate": 0.5, "service_rate": 1.0, "min_devices": 1, "buffer": 0.0, "target_wait": 300},
+]
+
+
+def replay(queue_length, strategy, config, max_devices):
+    """Replay the trace through the scalar policy, one decision per sample."""
+    active = min(config["min_devices"], max_devices)
+    result = []
+    for q in queue_length:
+        active = calculate_devices(strategy, config["arrival_rate"], config["service_rate"], int(q), active, max_devices, config["min_devices"], config["buffer"], config["target_wait"])
+        result.append(active)
+    return result
+
+
+@pytest.mark.parametrize("strategy", ["energy_save", "min_wait", "erlang_c"])
+def test_simulate_matches_scalar_policy(strategy):
+    rng = np.random.default_rng(1)
+    queue_length = np.clip(np.cumsum(rng.integers(-2, 3, 3000)), 0, None) % 50
+    active = backtest.simulate(queue_length, strategy, configs, max_devices=8, block_size=64)
+    for i, config in enumerate(configs):
+        assert active[i].tolist() == replay(queue_length, strategy, config, max_devices=8)
+
+
+def test_sweep_reports_device_hours_and_transitions():
+    queue_length = [0, 0, 20, 20, 20, 0, 0]
+    result = backtest.backtest(queue_length, "energy_save", configs[0], max_devices=4, interval=3600)
+    assert result["ticks"] == 7
+    assert result["duration"] == 7 * 3600
+    # 1 -> 2 -> 3 -> 4 -> 3 -> 2, one device hour per active device per sample
+    assert result["device_hours"] == 1 + 1 + 2 + 3 + 4 + 3 + 2
+    assert (result["power_on"], result["power_off"], result["transitions"]) == (3, 2, 5)
+
+    results = backtest.sweep(queue_length, "energy_save", [configs[0], dict(configs[0], min_devices=3)], max_devices=4)
+    assert [r["config"]["min_devices"] for r in results] == [1, 3]
+    assert results[1]["device_hours"] > results[0]["device_hours"]
+
+
+def test_load_trace(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    path.write_text("\n".join(json.dumps({"queue_count": q, "timestamp": 1755590400.0 + i}) for i, q in enumerate([3, 4, 5])))
+    queue_length, timestamps = backtest.load_trace(str(path))
+    assert queue_length.tolist() == [3, 4, 5]
+    assert timestamps.tolist() == [1755590400.0, 1755590401.0, 1755590402.0] # type: ignore
+
+    path = tmp_path / "trace.csv"
+    path.write_text("queue_length\n3\n4\n")
+    queue_length, timestamps = backtest.load_trace(str(path))
+    assert queue_length.tolist() == [3, 4]
+    assert timestamps is None
@@ -0,0 +1,82 @@
+import os
+import sys
+import asyncio
+import importlib.util
+import pytest
+
+from tests.mock_dmt_api import MockDMTServer
+
+# the device MCP server is a script named server.py, load it under a distinct module name
+server_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "device_mgmt_toolkit", "server.py")
+# appended, not inserted, so "server" still resolves to the queue management server in other tests
+sys.path.append(os.path.dirname(server_path))
+spec = importlib.util.spec_from_file_location("device_mgmt_server", server_path)
+device_server = importlib.util.module_from_spec(spec) # type: ignore
+spec.loader.exec_module(device_server) # type: ignore
+
+
+@pytest.fixture
+def dmt_server(monkeypatch):
+    with MockDMTServer(device_count=4) as server:
+        monkeypatch.setattr(device_server, "DMT_API_BASE", server.api_base)
+        yield server
+
+
+def run(coro):
+    async def wrapper():
+        try:
+            await device_server.authorize()
+            await device_server.get_all_device()
+            return await coro()
+        finally:
+            await device_server.close_client()
+    return asyncio.run(wrapper())
+
+
+def test_get_devices_serves_cache_and_refreshes_stale_entries(dmt_server):
+    guid = "00000000-0000-0000-0000-000000000001"
+
+    async def scenario():
+        dmt_server.state.devices[guid]["powerstate"] = 8 # powered off outside of the agent
+        requests = dmt_server.state.requests
+        cached = await device_server.get_devices(["Device 01"])
+        assert dmt_server.state.requests == requests
+        assert cached["Device 01"]["pwr_status"] == "on"
+
+        fresh = await device_server.get_devices(["Device 01"], max_age=0)
+        # only the requested device is looked up again
+        assert dmt_server.state.requests == requests + 2
+        assert fresh["Device 01"]["pwr_status"] == "off"
+
+        await device_server.get_devices(max_age=60)
+        assert dmt_server.state.requests == requests + 2
+
+    run(scenario)
+
+
+def test_refresh_devices_only_refreshes_expired_fields(dmt_server, monkeypatch):
+    monkeypatch.setattr(device_server, "DMT_pwr_status_ttl", 0)
+
+    async def scenario():
+        dmt_server.state.devices["00000000-0000-0000-0000-000000000002"]["powerstate"] = 2
+        requests = dmt_server.state.requests
+        refreshed = await device_server.refresh_devices()
+        return refreshed, dmt_server.state.requests - requests
+
+    refreshed, requests = run(scenario)
+
+    # power state of all 4 devices expired, IP addresses are still fresh
+    assert refreshed == 4
+    assert requests == 4
+    assert device_server.all_device["Device 02"]["pwr_status"] == "on"
+
+
+def test_refresh_keeps_last_known_value_on_failure(dmt_server, monkeypatch):
+    monkeypatch.setattr(device_server, "DMT_pwr_status_ttl", 0)
+
+    async def scenario():
+        dmt_server.state.error_guids.add("00000000-0000-0000-0000-000000000003")
+        return await device_server.refresh_devices(["Device 03"])
+
+    assert run(scenario) == 0
+    assert device_server.all_device["Device 03"]["pwr_status"] == "on"
@@ -0,0 +1,231 @@
+import os
+import sys
+import time
+import asyncio
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+import dmt_utils # noqa: E402
+from tests.mock_dmt_api import MockDMTServer # noqa: E402
+
+
+@pytest.fixture
+def dmt_server(monkeypatch):
+    with MockDMTServer(device_count=5) as server:
+        monkeypatch.setattr(dmt_utils, "DMT_API_BASE", server.api_base)
+        yield server
+
+
+def test_dmt_calls_reuse_pooled_connections(dmt_server):
+    async def run():
+        try:
+            await dmt_utils.authorize()
+            devices = await dmt_utils.discover_device()
+            connections = len(dmt_server.state.connections)
+            states = [await dmt_utils.get_power_state(d["guid"]) for d in devices.values()] # type: ignore
+            return devices, connections, states
+        finally:
+            await dmt_utils.close_client()
+
+    devices, connections, states = asyncio.run(run())
+
+    assert dmt_utils.token in dmt_server.state.tokens
+    assert len(devices) == 5
+    assert states == ["on", "off", "on", "off", "on"]
+    # 1 authorize + 1 device list + 2 lookups per device + 5 power state
+    assert dmt_server.state.requests == 17
+    # discovery opens at most one connection per concurrent lookup, later calls reuse them
+    assert connections <= 10
+    assert len(dmt_server.state.connections) == connections
+
+
+def test_dmt_client_recreated_for_new_event_loop(dmt_server):
+    async def get_client():
+        return await dmt_utils.get_client()
+
+    first = asyncio.run(get_client())
+    second = asyncio.run(get_client())
+    assert first is not second
+
+    async def same_loop():
+        try:
+            return await dmt_utils.get_client() is await dmt_utils.get_client()
+        finally:
+            await dmt_utils.close_client()
+
+    assert asyncio.run(same_loop())
+
+
+def test_discovery_is_concurrent_and_partial(monkeypatch):
+    with MockDMTServer(device_count=40, latency=0.05) as server:
+        monkeypatch.setattr(dmt_utils, "DMT_API_BASE", server.api_base)
+        failed_guid = next(iter(server.state.devices))
+        server.state.error_guids.add(failed_guid)
+
+        async def run():
+            try:
+                await dmt_utils.authorize()
+                start = time.perf_counter()
+                await dmt_utils.get_all_device()
+                return time.perf_counter() - start
+            finally:
+                await dmt_utils.close_client()
+
+        elapsed = asyncio.run(run())
+
+    devices = dmt_utils.all_device
+    assert len(devices) == 40
+    # 80 lookups of 50 ms each would take 4 s one after another
+    assert elapsed < 1.0
+    assert dmt_utils.discovery_time == pytest.approx(elapsed, abs=0.05)
+    assert devices["Device 01"]["pwr_status"].startswith("Unable to get power state of device.") # type: ignore
+    assert devices["Device 01"]["ip_addr"].startswith("Unable to get IP address of device.") # type: ignore
+    assert devices["Device 02"]["pwr_status"] == "off" # type: ignore
+    assert devices["Device 03"]["ip_addr"] == "10.0.0.3" # type: ignore
+
+
+def test_batch_power_action_runs_concurrently(monkeypatch):
+    with MockDMTServer(device_count=10, latency=0.1) as server:
+        monkeypatch.setattr(dmt_utils, "DMT_API_BASE", server.api_base)
+        monkeypatch.setattr(dmt_utils, "DMT_power_concurrency", 5)
+        server.state.error_guids.add(next(iter(server.state.devices)))
+
+        async def run():
+            try:
+                await dmt_utils.authorize()
+                await dmt_utils.get_all_device()
+                start = time.perf_counter()
+                results = await dmt_utils.power_on_devices(["Device 01", "Device 02", "Device 04", "Device 06", "Device 08", "Device 99"])
+                return results, time.perf_counter() - start
+            finally:
+                await dmt_utils.close_client()
+
+        results, elapsed = asyncio.run(run())
+
+    by_device = {result["dev_id"]: result for result in results}
+    assert len(results) == 6
+    # 6 actions of 100 ms each, 5 at a time
+    assert elapsed < 0.5
+    assert by_device["Device 99"] == {"guid": "", "dev_id": "Device 99", "success": False, "message": "Device not found."}
+    assert by_device["Device 01"]["success"] is False
+    assert by_device["Device 01"]["message"].startswith("Unable to power on the device. Exception:")
+    for dev_id in ["Device 02", "Device 04", "Device 06", "Device 08"]:
+        assert by_device[dev_id]["success"] is True
+        # powering on until confirmed by a later power state poll
+        assert dmt_utils.all_device[dev_id]["pwr_status"] == "powering_on" # type: ignore
+
+
+def test_batch_power_action_per_device_deadline(monkeypatch):
+    with MockDMTServer(device_count=3, latency=0.3) as server:
+        monkeypatch.setattr(dmt_utils, "DMT_API_BASE", server.api_base)
+
+        async def run():
+            try:
+                await dmt_utils.authorize()
+                await dmt_utils.get_all_device()
+                monkeypatch.setattr(dmt_utils, "DMT_power_timeout", 0.05)
+                return [result async for result in dmt_utils.batch_power_action(["Device 01", "Device 02"], dmt_utils.POWER_OFF)]
+            finally:
+                await dmt_utils.close_client()
+
+        results = asyncio.run(run())
+
+    assert [result["success"] for result in results] == [False, False]
+    assert all("Timed out after 0.05 seconds." in result["message"] for result in results)
+
+
+def test_token_expiry_is_decoded_and_refreshed_ahead(dmt_server):
+    async def run():
+        try:
+            await dmt_utils.authorize()
+            first_token, first_expiry = dmt_utils.token, dmt_utils.token_expiry
+            # token about to expire, all concurrent requests share one proactive refresh
+            dmt_utils.token_expiry = time.time() + dmt_utils.DMT_token_refresh_margin / 2
+            states = await asyncio.gather(*[dmt_utils.get_power_state("00000000-0000-0000-0000-000000000001") for _ in range(10)])
+            return first_token, first_expiry, states
+        finally:
+            await dmt_utils.close_client()
+
+    first_token, first_expiry, states = asyncio.run(run())
+
+    assert first_expiry == pytest.approx(time.time() + 3600, abs=60)
+    assert states == ["on"] * 10
+    assert dmt_server.state.authorize_requests == 2
+    assert dmt_utils.token != first_token
+
+
+def test_rejected_token_triggers_single_reauthorization(dmt_server):
+    async def run():
+        try:
+            await dmt_utils.authorize()
+            await dmt_utils.get_all_device()
+            dmt_server.state.revoke_tokens()
+            results = await dmt_utils.power_off_devices(["Device 01", "Device 03", "Device 05"])
+            states = await asyncio.gather(*[dmt_utils.get_power_state(d["guid"]) for d in dmt_utils.all_device.values()]) # type: ignore
+            return results, states
+        finally:
+            await dmt_utils.close_client()
+
+    results, states = asyncio.run(run())
+
+    assert all(result["success"] for result in results)
+    assert states == ["off"] * 5
+    assert dmt_server.state.authorize_requests == 2
+
+
+def test_power_transition_confirmed_and_timed(monkeypatch):
+    with MockDMTServer(device_count=3, boot_delay=0.3, shutdown_delay=0.1) as server:
+        monkeypatch.setattr(dmt_utils, "DMT_API_BASE", server.api_base)
+        monkeypatch.setattr(dmt_utils, "DMT_confirm_interval", 0.05)
+        monkeypatch.setattr(dmt_utils, "boot_latency", dmt_utils.LatencyHistogram())
+        monkeypatch.setattr(dmt_utils, "shutdown_latency", dmt_utils.LatencyHistogram())
+        monkeypatch.setattr(dmt_utils, "device_boot_latency", {})
+
+        async def run():
+            try:
+                await dmt_utils.authorize()
+                await dmt_utils.get_all_device()
+                result = await dmt_utils.power_action("Device 02", dmt_utils.POWER_ON)
+                assert result["success"] is True
+                assert dmt_utils.all_device["Device 02"]["pwr_status"] == "powering_on" # type: ignore
+                # a device already powering on is not powered on again
+                again = await dmt_utils.power_action("Device 02", dmt_utils.POWER_ON)
+                assert again["success"] is False and again["message"] == "Device is already powering on."
+                await dmt_utils.power_action("Device 01", dmt_utils.POWER_OFF)
+                await asyncio.sleep(0.15)
+                assert dmt_utils.all_device["Device 01"]["pwr_status"] == "off" # type: ignore
+                assert dmt_utils.all_device["Device 02"]["pwr_status"] == "powering_on" # type: ignore
+                await asyncio.sleep(0.35)
+                assert dmt_utils.all_device["Device 02"]["pwr_status"] == "on" # type: ignore
+                assert not dmt_utils.power_transitions
+            finally:
+                await dmt_utils.close_client()
+
+        asyncio.run(run())
+
+    assert dmt_utils.boot_latency.count == 1
+    assert 0.3 <= dmt_utils.boot_latency.max < 0.5
+    assert dmt_utils.device_boot_latency["Device 02"].count == 1
+    assert dmt_utils.shutdown_latency.count == 1
+    # not enough boot times measured yet
+    assert dmt_utils.measured_boot_time() is None
+
+
+def test_power_transition_not_confirmed(monkeypatch):
+    with MockDMTServer(device_count=2, boot_delay=10) as server:
+        monkeypatch.setattr(dmt_utils, "DMT_API_BASE", server.api_base)
+        monkeypatch.setattr(dmt_utils, "DMT_confirm_interval", 0.05)
+        monkeypatch.setattr(dmt_utils, "DMT_confirm_timeout", 0.2)
+
+        async def run():
+            try:
+                await dmt_utils.authorize()
+                await dmt_utils.get_all_device()
+                await dmt_utils.power_action("Device 02", dmt_utils.POWER_ON)
+                await asyncio.sleep(0.4)
+                return dmt_utils.all_device["Device 02"]["pwr_status"] # type: ignore
+            finally:
+                await dmt_utils.close_client()
+
+        # still reported off by the device after the confirmation deadline
+        assert asyncio.run(run()) == "off"
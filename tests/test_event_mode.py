@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import time
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+import dmt_utils # noqa: E402
+import queue_management_utils # noqa: E402
+from queue_management_utils import wait_next_tick # noqa: E402
+from queue_engine import QueueManagementEngine # noqa: E402
+from tick_trace import TickTracer # noqa: E402
+from tests.mock_dmt_api import MockDMTServer # noqa: E402
+from tests.test_queue_engine import MemoryTailer, reset_dmt # noqa: E402
+from tests.test_queue_length import Message # noqa: E402
+
+
+def test_burst_is_debounced(monkeypatch):
+    monkeypatch.setattr(queue_management_utils, "kafka_debounce", 0.2)
+    monkeypatch.setattr(queue_management_utils, "kafka_heartbeat", 5)
+
+    async def run():
+        queue_update = asyncio.Event()
+
+        async def burst():
+            for _ in range(5):
+                queue_update.set()
+                await asyncio.sleep(0.02)
+
+        started = time.monotonic()
+        task = asyncio.create_task(burst())
+        await wait_next_tick("event", queue_update, device_changed=False)
+        elapsed = time.monotonic() - started
+        await task
+        # one decision after the burst settled, the messages of the burst do not trigger another one
+        assert 0.2 <= elapsed < 1
+        assert not queue_update.is_set()
+
+    asyncio.run(run())
+
+
+def test_heartbeat_without_messages(monkeypatch):
+    monkeypatch.setattr(queue_management_utils, "kafka_debounce", 0)
+    monkeypatch.setattr(queue_management_utils, "kafka_heartbeat", 0.1)
+
+    async def run():
+        started = time.monotonic()
+        await wait_next_tick("event", asyncio.Event(), device_changed=False)
+        return time.monotonic() - started
+
+    assert 0.1 <= asyncio.run(run()) < 1
+
+
+def test_device_change_and_policy_update_skip_the_wait(monkeypatch):
+    monkeypatch.setattr(queue_management_utils, "kafka_debounce", 0)
+    monkeypatch.setattr(queue_management_utils, "kafka_heartbeat", 5)
+
+    async def run():
+        started = time.monotonic()
+        await wait_next_tick("event", asyncio.Event(), device_changed=True)
+        assert time.monotonic() - started < 0.5
+
+        policy_update = asyncio.Event()
+        asyncio.get_running_loop().call_later(0.05, policy_update.set)
+        started = time.monotonic()
+        await wait_next_tick("event", asyncio.Event(), device_changed=False, policy_update=policy_update)
+        assert time.monotonic() - started < 0.5
+
+    asyncio.run(run())
+
+
+class TickExporter:
+    """Collect the attributes of every tick span."""
+    def __init__(self):
+        self.ticks = []
+
+    def export(self, spans):
+        self.ticks.append(spans[-1]["attributes"])
+
+
+def test_unchanged_inputs_are_skipped(monkeypatch):
+    monkeypatch.setattr(queue_management_utils, "kafka_debounce", 0.01)
+    monkeypatch.setattr(queue_management_utils, "kafka_heartbeat", 5)
+    tailer = MemoryTailer()
+    exporter = TickExporter()
+    engine = QueueManagementEngine(tailer, tracer=TickTracer(exporters=[exporter]))
+    config = json.dumps(queue_management_utils.queue_policy)
+
+    async def run():
+        # 3 people keeps the 2 active devices of energy_save
+        tailer.update(Message(3, timestamp=time.time()))
+        engine.start("energy_save", config)
+        await asyncio.sleep(0.3)
+        decided = len(exporter.ticks)
+        for _ in range(4):
+            tailer.update(Message(3, timestamp=time.time()))
+            await asyncio.sleep(0.1)
+        assert engine.is_running()
+        engine.stop()
+        await asyncio.sleep(0)
+        await dmt_utils.close_client()
+        return decided
+
+    with MockDMTServer(device_count=4) as server:
+        reset_dmt(server.api_base)
+        decided = asyncio.run(run())
+    # every new message is a tick, but the decision is skipped as neither queue length nor device state changed
+    assert [tick.get("skipped", False) for tick in exporter.ticks[decided:]] == [True] * 4
@@ -0,0 +1,49 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+from flap_guard import FlapGuard # noqa: E402
+from queue_management_utils import calculate_devices, apply_hysteresis # noqa: E402
+
+
+def test_dwell_time_holds_opposite_action():
+    guard = FlapGuard(min_on_time=60, min_off_time=30, max_actions_per_minute=0)
+    guard.record("dev1", True, now=0)
+    guard.record("dev2", False, now=0)
+    # dev1 just powered on: not powered off before 60 seconds, powering on again is not held back
+    assert guard.select(["dev1", "dev3"], False, 2, now=10) == ["dev3"]
+    assert guard.dwell_remaining("dev1", True, now=10) == 0
+    assert guard.dwell_remaining("dev1", False, now=10) == 50
+    assert guard.select(["dev1"], False, 1, now=60) == ["dev1"]
+    # dev2 just powered off: not powered on before 30 seconds
+    assert guard.select(["dev2"], True, 1, now=29) == []
+    assert guard.select(["dev2"], True, 1, now=30) == ["dev2"]
+    assert guard.suppressed == {"dwell": 2, "rate_limit": 0, "hysteresis": 0}
+
+
+def test_action_rate_limit():
+    guard = FlapGuard(min_on_time=0, min_off_time=0, max_actions_per_minute=3)
+    devices = [f"dev{i}" for i in range(5)]
+    selected = guard.select(devices, True, 5, now=0)
+    assert selected == devices[:3]
+    for dev_id in selected:
+        guard.record(dev_id, True, now=0)
+    assert guard.budget(now=59) == 0
+    assert guard.select(devices[3:], True, 2, now=59) == []
+    # actions older than a minute no longer count
+    assert guard.select(devices[3:], True, 2, now=60) == devices[3:]
+    assert guard.suppressed["rate_limit"] == 4
+
+
+def test_hysteresis_band():
+    # energy_save powers on one more device once the queue length is above offered load + buffer (3 + 1), and off below 3 - 1
+    args = dict(arrival_rate=1.5, service_rate=0.5, current_active=2, max_devices=5, min_devices=1, buffer=0.2, target_wait=None)
+    assert calculate_devices("energy_save", queue_length=5, **args) == 3
+    # with a band of 2, the queue length must be above the threshold by more than one person
+    assert apply_hysteresis(2, 3, "energy_save", queue_length=5, **args) == 2
+    assert apply_hysteresis(2, 3, "energy_save", queue_length=6, **args) == 3
+    assert apply_hysteresis(0, 3, "energy_save", queue_length=5, **args) == 3
+    # same below the power off threshold
+    assert calculate_devices("energy_save", queue_length=1, **args) == 1
+    assert apply_hysteresis(2, 1, "energy_save", queue_length=1, **args) == 2
+    assert apply_hysteresis(2, 1, "energy_save", queue_length=0, **args) == 1
@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+from forecast import QueueForecaster # noqa: E402
+from queue_length import KafkaQueueLengthTailer # noqa: E402
+from queue_management_utils import calculate_devices # noqa: E402
+from tests.test_queue_length import Message # noqa: E402
+
+start = 1755590400.0
+
+
+def test_forecast_follows_trend():
+    forecaster = QueueForecaster(level_halflife=10, trend_halflife=30)
+    assert forecaster.forecast(60) is None
+    # queue grows by 1 every 10 seconds
+    for i in range(600):
+        forecaster.update(i / 10, start + i)
+    assert forecaster.forecast(0) == pytest.approx(59.9, abs=1)
+    assert forecaster.forecast(120) == pytest.approx(59.9 + 12, abs=1)
+
+    # stable queue
+    for i in range(600, 1800):
+        forecaster.update(60, start + i)
+    assert forecaster.forecast(120) == pytest.approx(60, abs=0.5)
+
+
+def test_forecast_learns_season():
+    day = 86400
+    forecaster = QueueForecaster(level_halflife=4 * 3600, trend_halflife=12 * 3600, season=day, season_bins=24, season_halflife=1)
+    # 30 queuing at lunch hour, 0 otherwise, one message per minute for a week
+    for i in range(0, 7 * day, 60):
+        hour = (i // 3600) % 24
+        forecaster.update(30 if hour == 12 else 0, start + i)
+    # at 11:30, an hour ahead is lunch hour
+    now = start + 7 * day + 11.5 * 3600
+    forecaster.update(0, now)
+    assert forecaster.forecast(3600) > 20 # type: ignore
+    assert forecaster.forecast(0) < 5 # type: ignore
+
+
+def test_predictive_powers_on_ahead_of_surge():
+    args = (1.5, 0.5, 2, 4, 10, 1, 0.2, 120)
+    reactive = calculate_devices("erlang_c", *args)
+    predictive = calculate_devices("predictive", *args, forecast_queue_length=20)
+    assert predictive > reactive
+    # without forecast, same as erlang_c
+    assert calculate_devices("predictive", *args) == reactive
+
+
+def test_tailer_calls_listener_with_combined_queue_length():
+    tailer = KafkaQueueLengthTailer(app=None) # type: ignore
+    received = []
+    listener = lambda queue_length, timestamp: received.append(queue_length)
+    tailer.add_listener(listener)
+    tailer.update(Message(3, partition=0, timestamp=time.time()))
+    tailer.update(Message(4, partition=1, timestamp=time.time()))
+    tailer.remove_listener(listener)
+    tailer.update(Message(5, partition=1, timestamp=time.time()))
+    assert received == [3, 7]
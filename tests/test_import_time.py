@@ -0,0 +1,35 @@
+import os
+import sys
+import subprocess
+
+queue_flow_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt")
+
+# Cold start budget of the queue management worker, the cumulative import time of queue_management_utils in milliseconds.
+# About 250 ms without the MCP server module, over 1300 ms when it pulled in FastMCP and quixstreams.
+worker_import_budget = float(os.getenv("worker_import_budget", 600))
+# Packages the worker must not import on start
+worker_forbidden_imports = ["server", "mcp", "quixstreams", "confluent_kafka"]
+
+
+def import_times(module: str) -> dict:
+    """Cumulative import time of every module imported by a fresh interpreter importing `module`, in microseconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=queue_flow_dir, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_worker_cold_start_budget():
+    # best of 3 cold starts, to leave out the noise of a busy machine
+    runs = [import_times("queue_management_utils") for _ in range(3)]
+    imported = {name.split(".")[0] for name in runs[0]}
+    assert not imported & set(worker_forbidden_imports), f"queue_management_utils imports {sorted(imported & set(worker_forbidden_imports))} on start"
+    cold_start = min(times["queue_management_utils"] for times in runs) / 1000
+    assert cold_start < worker_import_budget, f"Worker cold start takes {cold_start:.0f} ms, budget {worker_import_budget:.0f} ms"
@@ -0,0 +1,21 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+from latency_histogram import LatencyHistogram # noqa: E402
+
+
+def test_histogram_quantiles():
+    histogram = LatencyHistogram(buckets=[10, 20, 30, 60])
+    assert histogram.quantile(0.5) is None
+    for value in [12, 14, 16, 18, 25, 28, 40, 50, 55, 70]:
+        histogram.observe(value)
+    summary = histogram.summary()
+    assert summary["count"] == 10
+    assert summary["mean"] == pytest.approx(32.8)
+    # half of the latencies are within the 10 - 20 and 20 - 30 buckets
+    assert 20 <= summary["p50"] <= 30 # type: ignore
+    assert 30 < summary["p90"] <= 70 # type: ignore
+    assert histogram.quantile(1) == 70
+
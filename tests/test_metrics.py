@@ -0,0 +1,135 @@
+import os
+import sys
+import asyncio
+import threading
+import pytest
+from mcp.server.fastmcp import FastMCP
+from starlette.testclient import TestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+import dmt_utils # noqa: E402
+from queueflow_device_manager.metrics import Registry, Counter, Gauge, Histogram, instrument_mcp, family_names, write_metrics, read_metrics # noqa: E402
+from latency_histogram import LatencyHistogram # noqa: E402
+from tests.mock_dmt_api import MockDMTServer # noqa: E402
+
+
+def test_render_text_format(tmp_path):
+    registry = Registry()
+    actions = Counter("qflow_power_actions_total", "Power actions.", ["action", "outcome"], registry)
+    actions.inc(action="on", outcome="success")
+    actions.inc(2, action="off", outcome="failure")
+    lag = Gauge("kafka_consumer_lag_messages", "Lag.", ["partition"], registry)
+    lag.set(3, partition='people-count:0 "a"')
+    boot = LatencyHistogram(buckets=[10, 60])
+    for latency in (5, 20, 90):
+        boot.observe(latency)
+    Histogram("dmt_power_transition_seconds", "Transition.", ["action"], registry, collect=lambda: {("on",): boot})
+    tick = Histogram("qflow_tick_duration_seconds", "Tick.", registry=registry, buckets=[0.1, 1])
+    with tick.time():
+        pass
+
+    text = registry.render()
+    assert 'qflow_power_actions_total{action="off",outcome="failure"} 2' in text
+    assert 'qflow_power_actions_total{action="on",outcome="success"} 1' in text
+    assert 'kafka_consumer_lag_messages{partition="people-count:0 \\"a\\""} 3' in text
+    # cumulative buckets of a latency histogram kept by the process
+    assert 'dmt_power_transition_seconds_bucket{action="on",le="10"} 1' in text
+    assert 'dmt_power_transition_seconds_bucket{action="on",le="60"} 2' in text
+    assert 'dmt_power_transition_seconds_bucket{action="on",le="+Inf"} 3' in text
+    assert 'dmt_power_transition_seconds_sum{action="on"} 115' in text
+    assert 'qflow_tick_duration_seconds_bucket{le="0.1"} 1' in text
+    with pytest.raises(ValueError):
+        actions.inc(action="on")
+
+    # metrics written by another process replace the families of the same name
+    path = os.path.join(tmp_path, "qflow_metrics.prom")
+    write_metrics(path, registry)
+    assert family_names(read_metrics(path)) == {"qflow_power_actions_total", "kafka_consumer_lag_messages", "dmt_power_transition_seconds", "qflow_tick_duration_seconds"}
+    assert registry.render(skip=family_names(read_metrics(path))) == ""
+    assert read_metrics(os.path.join(tmp_path, "missing.prom")) == ""
+
+
+def test_dmt_request_metrics(monkeypatch):
+    registry = Registry()
+    monkeypatch.setattr(dmt_utils, "dmt_request_duration", Histogram("dmt_request_duration_seconds", "DMT.", ["method", "endpoint"], registry))
+    monkeypatch.setattr(dmt_utils, "dmt_request_errors", Counter("dmt_request_errors_total", "DMT.", ["method", "endpoint", "reason"], registry))
+    with MockDMTServer(device_count=2) as server:
+        monkeypatch.setattr(dmt_utils, "DMT_API_BASE", server.api_base)
+
+        async def run():
+            try:
+                await dmt_utils.authorize()
+                devices = await dmt_utils.discover_device()
+                await dmt_utils.get_power_state("00000000-0000-0000-0000-000000000000")
+                return devices
+            finally:
+                await dmt_utils.close_client()
+
+        asyncio.run(run())
+
+    durations = dmt_utils.dmt_request_duration.values
+    # one label per endpoint, whatever the device
+    assert durations[("POST", "/authorize")].count == 1
+    assert durations[("GET", "/devices")].count == 1
+    assert durations[("GET", "/amt/networkSettings/{guid}")].count == 2
+    assert durations[("GET", "/amt/power/state/{guid}")].count == 3
+    assert dmt_utils.dmt_request_errors.values == {("GET", "/amt/power/state/{guid}", "404"): 1}
+
+
+def test_instrument_mcp_tool_calls():
+    registry = Registry()
+    mcp = FastMCP("Test")
+
+    @mcp.tool()
+    def get_queue_length() -> str:
+        return "3"
+
+    @mcp.tool()
+    def start_queue_management() -> str:
+        raise RuntimeError("Kafka down")
+
+    instrument_mcp(mcp, registry, extra=lambda: "# HELP qflow_skipped_decisions_total Skipped.\n# TYPE qflow_skipped_decisions_total counter\nqflow_skipped_decisions_total 7\n")
+
+    async def run():
+        await mcp.call_tool("get_queue_length", {})
+        with pytest.raises(Exception):
+            await mcp.call_tool("start_queue_management", {})
+
+    asyncio.run(run())
+    response = TestClient(mcp.streamable_http_app()).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'mcp_tool_duration_seconds_count{tool="get_queue_length"} 1' in response.text
+    assert 'mcp_tool_errors_total{tool="start_queue_management"} 1' in response.text
+    assert "qflow_skipped_decisions_total 7" in response.text
+
+
+def test_values_updated_while_rendered():
+    registry = Registry()
+    messages = Counter("kafka_messages_total", "Messages.", ["partition"], registry)
+    age = Histogram("kafka_message_age_seconds", "Age.", registry=registry, buckets=[0.1 * i for i in range(1, 50)])
+
+    def consume():
+        # the Kafka consumer thread updates the metrics while the server renders them
+        for i in range(50000):
+            messages.inc(partition=i % 500)
+            age.observe(i % 60 / 10)
+
+    thread = threading.Thread(target=consume)
+    thread.start()
+    while thread.is_alive():
+        lines = dict(line.rsplit(" ", 1) for line in registry.render().splitlines() if line.startswith("kafka_message_age_seconds_"))
+        # buckets, sum and count of a histogram always come from the same observations
+        if lines:
+            assert lines['kafka_message_age_seconds_bucket{le="+Inf"}'] == lines["kafka_message_age_seconds_count"]
+    thread.join()
+    assert 'kafka_messages_total{partition="0"} 100' in registry.render()
+
+
+def test_instrument_mcp_without_tool_manager():
+    registry = Registry()
+    mcp = FastMCP("Test")
+    mcp._tool_manager = None # type: ignore
+    # a FastMCP release without the private tool manager still serves /metrics
+    instrument_mcp(mcp, registry)
+    assert TestClient(mcp.streamable_http_app()).get("/metrics").status_code == 200
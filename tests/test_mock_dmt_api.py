@@ -0,0 +1,57 @@
+import os
+import sys
+import random
+import asyncio
+import statistics
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+import dmt_utils # noqa: E402
+from tests.mock_dmt_api import MockDMTServer, Latency # noqa: E402
+from tests import bench_dmt_fleet # noqa: E402
+
+
+def test_latency_distributions():
+    rng = random.Random(1)
+    assert Latency(0.01).sample(rng) == 0.01
+    assert Latency(0).sample(rng) == 0
+    for distribution in ["uniform", "exponential", "lognormal"]:
+        samples = [Latency(0.01, distribution, spread=0.8).sample(rng) for _ in range(20000)]
+        # every distribution keeps the configured mean
+        assert statistics.mean(samples) == pytest.approx(0.01, rel=0.05)
+    lognormal = sorted(Latency(0.01, "lognormal", spread=0.8).sample(rng) for _ in range(20000))
+    assert lognormal[int(0.99 * len(lognormal))] > 3 * lognormal[len(lognormal) // 2]
+    with pytest.raises(ValueError):
+        Latency(0.01, "pareto")
+
+
+def test_error_rates_reach_the_client(monkeypatch):
+    with MockDMTServer(device_count=20, error_rate=0.3, action_failure_rate=1.0, seed=3) as server:
+        monkeypatch.setattr(dmt_utils, "DMT_API_BASE", server.api_base)
+
+        async def run():
+            try:
+                await dmt_utils.authorize()
+                await dmt_utils.get_all_device()
+                server.state.error_rate = 0
+                off = [dev_id for dev_id, device in dmt_utils.all_device.items() if device["pwr_status"] == "off"] # type: ignore
+                return [result async for result in dmt_utils.batch_power_action(off, dmt_utils.POWER_ON)]
+            finally:
+                await dmt_utils.close_client()
+
+        results = asyncio.run(run())
+    failed = [device for device in dmt_utils.all_device.values() if device["pwr_status"].startswith("Unable") or device["ip_addr"].startswith("Unable")] # type: ignore
+    assert server.state.errors > 0 and len(failed) > 0
+    # every power action is accepted by DMT but failed by the device
+    assert results and all(result["message"] == "Power on failed." for result in results)
+    assert server.state.action_failures == len(results)
+
+
+def test_fleet_benchmark():
+    result = bench_dmt_fleet.run_size(dmt_utils, 10, latency=Latency(0.001, "lognormal"), seed=1)
+    assert result["devices"] == 10
+    # 1 device list + 2 lookups per device
+    assert result["discovery_requests"] == 21
+    assert result["actions"] == 5 and result["failed_actions"] == 0
+    assert result["discovery_latency"][0] <= result["discovery_latency"][2]
+    assert "discovery" in bench_dmt_fleet.report(result)
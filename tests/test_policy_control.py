@@ -0,0 +1,61 @@
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+from policy_control import PolicyControl # noqa: E402
+
+config = {
+    "energy_save": {"arrival_rate": 1.5, "service_rate": 0.5, "min_devices": 1, "buffer": 0.2, "target_wait": None},
+    "min_wait": {"arrival_rate": 1.5, "service_rate": 0.5, "min_devices": 1, "buffer": 0.2, "target_wait": 120},
+}
+
+
+def test_publish_is_versioned_and_copied():
+    control = PolicyControl("energy_save", config)
+    policies = {policy: dict(value) for policy, value in config.items()}
+    version = control.publish("min_wait", policies)
+    policies["min_wait"]["target_wait"] = 60
+    update = control.read()
+    assert version == 1
+    assert update["strategy"] == "min_wait"
+    # later changes to the published dict do not leak into the running loop
+    assert update["config"]["min_wait"]["target_wait"] == 120
+
+
+def test_file_channel_between_server_and_subprocess(tmp_path):
+    path = str(tmp_path / "qflow_control.json")
+    server = PolicyControl("energy_save", config, path=path)
+    server.publish("energy_save", config)
+    loop_control = PolicyControl("energy_save", config, path=path)
+    assert loop_control.read()["version"] == 1
+
+    version = server.publish("min_wait", config)
+    update = loop_control.read()
+    assert (update["version"], update["strategy"]) == (version, "min_wait")
+    loop_control.applied(update["version"], tick=7)
+    assert asyncio.run(server.wait_applied(version, timeout=1)) == 7
+
+    # a restarted server continues the version, so the old acknowledgement does not match a new update
+    restarted = PolicyControl("energy_save", config, path=path)
+    assert restarted.publish("energy_save", config) == version + 1
+    assert asyncio.run(restarted.wait_applied(version + 1, timeout=0.1)) is None
+
+
+def test_watcher_notifies_every_subscriber(tmp_path):
+    path = str(tmp_path / "qflow_control.json")
+    server = PolicyControl("energy_save", config, path=path)
+    loop_control = PolicyControl("energy_save", config, path=path, watch_interval=0.02)
+
+    async def run():
+        first, second, third = loop_control.subscribe(), loop_control.subscribe(), loop_control.subscribe()
+        # one subscriber leaving keeps the watcher for the others
+        loop_control.unsubscribe(first)
+        server.publish("min_wait", config)
+        await asyncio.wait_for(asyncio.gather(second.wait(), third.wait()), timeout=1)
+        assert not first.is_set()
+        loop_control.unsubscribe(second)
+        loop_control.unsubscribe(third)
+        assert loop_control.watcher is None
+
+    asyncio.run(run())
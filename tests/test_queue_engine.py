@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import time
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+import dmt_utils # noqa: E402
+from queue_engine import QueueManagementEngine # noqa: E402
+from queue_length import KafkaQueueLengthTailer # noqa: E402
+from policy_control import PolicyControl # noqa: E402
+from flap_guard import FlapGuard # noqa: E402
+from tick_history import TickHistory # noqa: E402
+from tick_trace import TickTracer # noqa: E402
+import queue_management_utils # noqa: E402
+from tests.mock_dmt_api import MockDMTServer # noqa: E402
+from tests.test_queue_length import Message # noqa: E402
+
+
+class MemoryTailer(KafkaQueueLengthTailer):
+    """Tailer fed by the test instead of Kafka."""
+    def __init__(self):
+        super().__init__(app=None) # type: ignore
+
+    def start(self):
+        pass
+
+
+def reset_dmt(api_base):
+    dmt_utils.DMT_API_BASE = api_base
+    dmt_utils.token = None
+    dmt_utils.token_expiry = 0
+    dmt_utils.token_refresh = None
+    dmt_utils.dmt_client = None
+    dmt_utils.dmt_client_loop = None
+    dmt_utils.DMT_confirm_interval = 0.05
+    queue_management_utils.flap_guard = FlapGuard()
+    if hasattr(dmt_utils, "all_device"):
+        del dmt_utils.all_device
+
+
+def test_engine_start_stop_status(tmp_path):
+    tailer = MemoryTailer()
+    history_path = os.path.join(tmp_path, "history.bin")
+    tracer = TickTracer(exporters=[])
+    engine = QueueManagementEngine(tailer, history_path=history_path, tracer=tracer)
+    config = json.dumps(queue_management_utils.queue_policy)
+
+    async def run():
+        tailer.update(Message(40, timestamp=time.time()))
+        engine.start("energy_save", config)
+        assert engine.status()[0]
+        await asyncio.sleep(0.5)
+        is_running, message = engine.status()
+        assert is_running and "energy_save" in message
+        # the loop reacts to the queue length and powers on devices
+        assert sum(device["pwr_status"] == "on" for device in dmt_utils.all_device.values()) == 3 # type: ignore
+        engine.stop()
+        await asyncio.sleep(0)
+        assert engine.status() == (False, "The process not running.")
+        await dmt_utils.close_client()
+
+    with MockDMTServer(device_count=4) as server:
+        reset_dmt(server.api_base)
+        asyncio.run(run())
+    # every decision tick is written to the tick history
+    with TickHistory(history_path, readonly=True) as history:
+        buckets = history.query(time.time() - 60, time.time(), resolution=60)["buckets"]
+    assert buckets[0]["queue_length_max"] == 40
+    assert buckets[0]["powered_on"] == 1
+    assert buckets[0]["policy"] == "energy_save"
+    # every stage of the decision tick is timed
+    timings = tracer.read()
+    assert set(timings["stages"]) == {"tick", "queue_length", "devices", "policy", "power_action"}
+    assert timings["stages"]["power_action"]["count"] >= 1
+    assert timings["stages"]["tick"]["count"] == timings["ticks"]
+
+
+def test_engine_records_error():
+    tailer = MemoryTailer()
+    tailer.error = "Kafka consumer error: broker down"
+    engine = QueueManagementEngine(tailer)
+    config = json.dumps(queue_management_utils.queue_policy)
+
+    async def run():
+        engine.start("energy_save", config)
+        while engine.is_running():
+            await asyncio.sleep(0.05)
+        await dmt_utils.close_client()
+
+    with MockDMTServer(device_count=2) as server:
+        reset_dmt(server.api_base)
+        asyncio.run(run())
+    is_running, message = engine.status()
+    assert not is_running
+    assert "broker down" in message
+
+
+def test_engine_applies_policy_update_without_restart():
+    tailer = MemoryTailer()
+    control = PolicyControl("energy_save", queue_management_utils.queue_policy)
+    engine = QueueManagementEngine(tailer, control)
+    config = json.dumps(queue_management_utils.queue_policy)
+
+    async def run():
+        tailer.update(Message(1, timestamp=time.time()))
+        engine.start("energy_save", config)
+        await asyncio.sleep(0.3)
+        task = engine.task
+        policies = json.loads(config)
+        policies["energy_save"]["min_devices"] = 4
+        version = control.publish("energy_save", policies)
+        # the update is applied on the next tick, without waiting for a new queue length
+        tick = await control.wait_applied(version, timeout=2)
+        assert tick == 2
+        await asyncio.sleep(0.3)
+        assert engine.task is task and engine.is_running()
+        assert all(device["pwr_status"] == "on" for device in dmt_utils.all_device.values()) # type: ignore
+        engine.stop()
+        await dmt_utils.close_client()
+
+    with MockDMTServer(device_count=4) as server:
+        reset_dmt(server.api_base)
+        asyncio.run(run())
+
+
+def test_engine_holds_power_off_within_min_on_time():
+    tailer = MemoryTailer()
+    engine = QueueManagementEngine(tailer)
+    policies = json.loads(json.dumps(queue_management_utils.queue_policy))
+    policies["energy_save"]["min_devices"] = 0
+    config = json.dumps(policies)
+
+    async def run():
+        tailer.update(Message(40, timestamp=time.time()))
+        engine.start("energy_save", config)
+        await asyncio.sleep(0.5)
+        powered_on = set(queue_management_utils.flap_guard.changed_at)
+        assert len(powered_on) == 1
+        # the queue empties right away, devices already on are powered off but the device just powered on stays on for min_on_time
+        for _ in range(5):
+            tailer.update(Message(0, timestamp=time.time()))
+            await asyncio.sleep(0.3)
+        assert engine.is_running()
+        assert {dev_id for dev_id, device in dmt_utils.all_device.items() if device["pwr_status"] == "on"} == powered_on # type: ignore
+        assert queue_management_utils.flap_guard.suppressed["dwell"] > 0
+        engine.stop()
+        await dmt_utils.close_client()
+
+    with MockDMTServer(device_count=4) as server:
+        reset_dmt(server.api_base)
+        asyncio.run(run())
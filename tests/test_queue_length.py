@@ -0,0 +1,140 @@
+import os
+import sys
+import json
+import time
+import pytest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+from queue_length import KafkaQueueLengthTailer # noqa: E402
+
+
+class Message:
+    """Minimal people-count Kafka message."""
+    def __init__(self, queue_count: int, topic: str = "people-count", partition: int = 0, key=None, timestamp: float | None = None, value: bytes | None = None, offset: int = 0):
+        self._value = value if value is not None else json.dumps({"queue_count": queue_count}).encode("utf-8")
+        self._offset = offset
+        self._topic = topic
+        self._partition = partition
+        self._key = key
+        self._timestamp = timestamp
+
+    def value(self):
+        return self._value
+
+    def key(self):
+        return self._key
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def timestamp(self):
+        # (TIMESTAMP_CREATE_TIME, milliseconds) or (TIMESTAMP_NOT_AVAILABLE, 0)
+        return (1, int(self._timestamp * 1000)) if self._timestamp else (0, 0)
+
+    def error(self):
+        return None
+
+
+def test_read_before_first_message():
+    tailer = KafkaQueueLengthTailer(None) # type: ignore
+    result = tailer.read()
+    assert result["success"] is False
+    assert result["message"] == "No latest queue length."
+
+
+@pytest.mark.parametrize("aggregator, expected", [("sum", "12"), ("max", "7"), ("latest", "5")])
+def test_lanes_are_aggregated(aggregator, expected):
+    now = time.time()
+    tailer = KafkaQueueLengthTailer(None, topics=["people-count", "lane-b"], aggregator=aggregator, max_age=30) # type: ignore
+    tailer.update(Message(3, partition=0, timestamp=now - 60))
+    tailer.update(Message(7, partition=1, timestamp=now - 2))
+    tailer.update(Message(5, topic="lane-b", key=b"camera-2", timestamp=now - 1))
+    # a newer message of the same lane replaces its queue length
+    tailer.update(Message(0, partition=0, timestamp=now - 10))
+
+    result = tailer.read()
+    assert result["success"] is True
+    assert result["message"] == expected
+    assert tailer.received.is_set()
+
+    lanes = tailer.read_lanes()
+    assert list(lanes) == ["camera-2", "people-count:0", "people-count:1"]
+    assert lanes["people-count:0"]["queue_length"] == 0
+    assert lanes["camera-2"]["age"] == pytest.approx(1, abs=0.5)
+    assert all(lane["is_fresh"] for lane in lanes.values())
+
+
+def test_aggregate_is_as_fresh_as_oldest_lane():
+    now = time.time()
+    tailer = KafkaQueueLengthTailer(None, max_age=30) # type: ignore
+    tailer.update(Message(3, partition=0, timestamp=now - 60))
+    tailer.update(Message(4, partition=1, timestamp=now - 1))
+
+    result = tailer.read()
+    assert result["age"] == pytest.approx(60, abs=0.5)
+    assert result["is_fresh"] is False
+
+
+def test_unknown_aggregator():
+    with pytest.raises(ValueError):
+        KafkaQueueLengthTailer(None, aggregator="median") # type: ignore
+
+
+class Consumer:
+    """Consumer of one partition returning the given messages, then stopping the tailer."""
+    def __init__(self, tailer, messages):
+        self.tailer = tailer
+        self.messages = list(messages)
+        self.stored = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def list_topics(self, topic, timeout=None):
+        return SimpleNamespace(topics={topic: SimpleNamespace(partitions={0: None})})
+
+    def get_watermark_offsets(self, partition, timeout=None, cached=False):
+        return 0, len(self.stored) + len(self.messages)
+
+    def assign(self, assignment):
+        self.assignment = assignment
+
+    def poll(self, timeout):
+        if not self.messages:
+            self.tailer.stopped.set()
+            return None
+        return self.messages.pop(0)
+
+    def store_offsets(self, message):
+        self.stored.append(message.offset())
+
+
+def test_malformed_message_is_skipped():
+    tailer = KafkaQueueLengthTailer(None) # type: ignore
+    consumer = Consumer(tailer, [
+        Message(3, offset=0, timestamp=time.time()),
+        Message(0, offset=1, value=b"not json"),
+        Message(0, offset=2, value=json.dumps({"count": 4}).encode("utf-8")),
+    ])
+    tailer.app = SimpleNamespace(get_consumer=lambda: consumer)
+    # the consumer keeps running and stores the offsets of malformed messages, so they are not read again on reconnect
+    tailer.consume()
+    # every partition starts from its last message
+    assert [(tp.topic, tp.partition, tp.offset) for tp in consumer.assignment] == [("people-count", 0, 2)]
+    assert consumer.stored == [0, 1, 2]
+    assert "Malformed people-count message" in tailer.error # type: ignore
+    assert tailer.read()["message"] == "3"
+
+    assert tailer.update(Message(5, timestamp=time.time()))
+    assert tailer.error is None
+    assert tailer.read()["message"] == "5"
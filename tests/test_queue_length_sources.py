@@ -0,0 +1,193 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+import dmt_utils # noqa: E402
+from queue_engine import QueueManagementEngine # noqa: E402
+from queue_length import QueueLengthSource, LaneQueueLengthSource, MemoryQueueLengthSource, ReplayQueueLengthSource # noqa: E402
+from rate_estimator import RateEstimator # noqa: E402
+from tick_trace import TickTracer # noqa: E402
+from tick_history import TickHistory # noqa: E402
+import queue_management_utils # noqa: E402
+from tests.mock_dmt_api import MockDMTServer # noqa: E402
+from tests.test_queue_engine import reset_dmt # noqa: E402
+
+
+def write_jsonl(path, samples):
+    with open(path, "w") as f:
+        for queue_count, timestamp in samples:
+            f.write(json.dumps({"queue_count": queue_count, "timestamp": timestamp}) + "\n")
+    return path
+
+
+def test_memory_source_push():
+    source = MemoryQueueLengthSource(aggregator="sum", max_age=30)
+    received = []
+    source.add_listener(lambda value, timestamp: received.append(value))
+    view = source.view(["lane-b"])
+
+    assert not asyncio.run(source.read_latest(timeout=0.1))["success"]
+    source.push(3, lane="lane-a")
+    source.push(4, timestamp=time.time() - 60, lane="lane-b")
+    result = asyncio.run(source.read_latest(timeout=1))
+    assert result["success"] and result["message"] == "7"
+    # the sum is only as fresh as its oldest lane
+    assert not result["is_fresh"]
+    assert received == [3, 7]
+    assert view.read()["message"] == "4"
+
+
+def test_estimator_keeps_updating_with_a_silent_lane():
+    source = MemoryQueueLengthSource(aggregator="sum", max_age=30)
+    estimator = RateEstimator(halflife=900)
+    start = 1755590400.0
+    # lane-b sends once and goes silent, the total only moves with lane-a
+    source.push(5, timestamp=start, lane="lane-b")
+    for i in range(5):
+        source.push(10 + i, timestamp=start + i, lane="lane-a")
+        result = source.read()
+        assert result["timestamp"] == start
+        assert result["updated_at"] == start + i
+        estimator.update(float(result["message"]), result["updated_at"], 2) # type: ignore
+    assert estimator.samples == 4
+
+
+def test_replay_jsonl_accelerated(tmp_path):
+    # 20 samples one second apart, replayed at 100x in about 0.2 seconds
+    samples = [(i, 1755590400.0 + i) for i in range(20)]
+    source = ReplayQueueLengthSource(write_jsonl(os.path.join(tmp_path, "trace.jsonl"), samples), speed=100, max_age=5)
+    received = []
+    source.add_listener(lambda value, timestamp: received.append((value, timestamp)))
+
+    started = time.monotonic()
+    source.start()
+    assert source.finished.wait(5)
+    elapsed = time.monotonic() - started
+    assert 0.15 <= elapsed < 2
+    # recorded timestamps are kept, and the age is measured on the accelerated clock
+    assert received == samples
+    result = source.read()
+    assert result["message"] == "19" and result["timestamp"] == samples[-1][1]
+    assert source.now() >= samples[-1][1]
+    time.sleep(0.1)
+    assert result["age"] < source.read()["age"] # type: ignore
+    assert not source.read()["is_fresh"]
+
+    with pytest.raises(ValueError):
+        ReplayQueueLengthSource(os.path.join(tmp_path, "trace.jsonl"), speed=0)
+
+
+def test_replay_csv_repeat(tmp_path):
+    path = os.path.join(tmp_path, "trace.csv")
+    with open(path, "w") as f:
+        f.write("queue_length\n2\n5\n")
+    # no timestamps, samples are `interval` seconds apart from the start of the replay
+    source = ReplayQueueLengthSource(path, speed=100, interval=1.0, repeat=True)
+    received = []
+    source.add_listener(lambda value, timestamp: received.append((value, timestamp)))
+    source.start()
+    deadline = time.monotonic() + 5
+    while (len(received) < 6) and (time.monotonic() < deadline):
+        time.sleep(0.01)
+    source.stop()
+    assert [value for value, _ in received[:6]] == [2, 5, 2, 5, 2, 5]
+    gaps = [b[1] - a[1] for a, b in zip(received, received[1:6])]
+    assert gaps == pytest.approx([1.0] * 5)
+    assert not source.finished.is_set()
+
+
+def test_engine_runs_on_replay(tmp_path):
+    # the queue builds up over a minute of recorded time, replayed in under a second
+    start = time.time()
+    samples = [(min(40, i), start + i) for i in range(0, 61, 3)]
+    source = ReplayQueueLengthSource(write_jsonl(os.path.join(tmp_path, "trace.jsonl"), samples), speed=100, max_age=30)
+    tracer = TickTracer(exporters=[])
+    engine = QueueManagementEngine(source, tracer=tracer)
+    config = json.dumps(queue_management_utils.queue_policy)
+
+    async def run():
+        shared_guard = dict(queue_management_utils.flap_guard.changed_at)
+        engine.start("energy_save", config)
+        await asyncio.to_thread(source.finished.wait, 5)
+        await asyncio.sleep(0.5)
+        # power actions on the replay clock are kept out of the guard shared with live runs
+        assert queue_management_utils.flap_guard.changed_at == shared_guard
+        assert engine.is_running()
+        # dwell times pass on the replay clock, so the device powered off on the first tick is powered on again as the queue builds up
+        assert sum(device["pwr_status"] == "on" for device in dmt_utils.all_device.values()) == 4 # type: ignore
+        # while the DMT API is polled on wall time, transitions confirmed in 0.1 seconds are not recorded as 10 seconds of trace time
+        assert dmt_utils.boot_latency.max < 1
+        engine.stop()
+        await asyncio.sleep(0)
+        await dmt_utils.close_client()
+
+    with MockDMTServer(device_count=4) as server:
+        reset_dmt(server.api_base)
+        asyncio.run(run())
+    source.stop()
+    assert tracer.read()["ticks"] > 1
+
+
+def test_replay_history_is_on_wall_time(tmp_path):
+    # a trace recorded a day ago, replayed into a history file that already holds ticks of a live run
+    history_path = os.path.join(tmp_path, "qflow_history.bin")
+    with TickHistory(history_path, capacity=1000) as history:
+        history.append(time.time() - 1, 2, 1, 0, 1, 0, 0, "energy_save")
+    recorded = time.time() - 86400
+    samples = [(min(40, i), recorded + i) for i in range(0, 61, 3)]
+    source = ReplayQueueLengthSource(write_jsonl(os.path.join(tmp_path, "trace.jsonl"), samples), speed=100, max_age=30)
+    engine = QueueManagementEngine(source, tracer=TickTracer(exporters=[]), history_path=history_path)
+    config = json.dumps(queue_management_utils.queue_policy)
+
+    async def run():
+        engine.start("energy_save", config)
+        await asyncio.to_thread(source.finished.wait, 5)
+        await asyncio.sleep(0.3)
+        engine.stop()
+        await asyncio.sleep(0)
+        await dmt_utils.close_client()
+
+    started = time.time()
+    with MockDMTServer(device_count=4) as server:
+        reset_dmt(server.api_base)
+        asyncio.run(run())
+    source.stop()
+    with TickHistory(history_path, readonly=True) as history:
+        times = [time for segment in history.segments() for time in segment["time"]]
+        # ticks are appended in time order, as the binary search of query expects
+        assert times == sorted(times) and len(times) > 2
+        replayed = history.query(started, time.time() + 1, resolution=60)
+    assert sum(bucket["ticks"] for bucket in replayed["buckets"]) == len(times) - 1
+    assert max(bucket["queue_length_max"] for bucket in replayed["buckets"]) > 2
+
+
+def test_loop_waits_on_the_replay_clock(tmp_path, monkeypatch):
+    # a 10 seconds heartbeat and 2 seconds debounce of recorded time pass in 0.12 seconds at 100x
+    monkeypatch.setattr(queue_management_utils, "kafka_heartbeat", 10)
+    monkeypatch.setattr(queue_management_utils, "kafka_debounce", 2)
+    source = ReplayQueueLengthSource(write_jsonl(os.path.join(tmp_path, "trace.jsonl"), [(1, 1755590400.0)]), speed=100)
+
+    async def run():
+        started = time.monotonic()
+        await queue_management_utils.wait_next_tick("event", asyncio.Event(), device_changed=False, sleep=source.view().sleep)
+        return time.monotonic() - started
+
+    assert 0.1 <= asyncio.run(run()) < 1
+
+
+def test_sources_must_implement_reading():
+    class NoLanes(QueueLengthSource):
+        async def read_latest(self, timeout):
+            return self.read()
+
+    class NoThread(LaneQueueLengthSource):
+        pass
+
+    with pytest.raises(TypeError):
+        NoLanes()
+    with pytest.raises(TypeError):
+        NoThread()
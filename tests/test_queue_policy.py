@@ -0,0 +1,101 @@
+import os
+import sys
+import time
+import itertools
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+import queue_management_utils # noqa: E402
+from queue_management_utils import min_wait, erlang_c, erlang_c_wait, erlang_c_policy, calculate_devices # noqa: E402
+from queue_core import queue_policy, policy_config_error # noqa: E402
+
+
+def min_wait_linear(queue_length, arrival_rate, service_rate, current_active, max_devices, min_devices=1, buffer=0.2, target_wait=120):
+    """min_wait with the original linear scan of device count."""
+    target_min = target_wait / 60
+    capacity = current_active * service_rate
+    utilization = arrival_rate / capacity if capacity > 0 else float('inf')
+    net_capacity = capacity - arrival_rate
+    current_wait = float('inf') if net_capacity <= 0 else queue_length / net_capacity
+    if current_active > min_devices:
+        if utilization < 0.7 and current_wait < target_min * (1 - buffer):
+            test_capacity = (current_active - 1) * service_rate - arrival_rate
+            if test_capacity > 0 and queue_length / test_capacity <= target_min:
+                return current_active - 1
+    if current_wait > target_min or utilization >= 1:
+        for devices in range(current_active + 1, max_devices + 1):
+            test_capacity = devices * service_rate - arrival_rate
+            if test_capacity > 0 and queue_length / test_capacity <= target_min:
+                return devices
+        return max_devices
+    return current_active
+
+
+def test_min_wait_binary_search_matches_linear_scan():
+    for queue_length, arrival_rate, current_active, target_wait in itertools.product(range(0, 60, 7), [0.5, 1.5, 4.0], range(0, 13), [30, 120]):
+        args = (queue_length, arrival_rate, 0.5, current_active, 12, 1, 0.2, target_wait)
+        assert min_wait(*args) == min_wait_linear(*args)
+
+
+def test_erlang_c_probability():
+    # offered load 2 with 3 servers: C(3, 2) = 4/9
+    assert erlang_c(3, arrival_rate=1.0, service_rate=0.5) == pytest.approx(4 / 9)
+    assert erlang_c(1, arrival_rate=0.5, service_rate=1.0) == pytest.approx(0.5)
+    # not enough devices to keep up
+    assert erlang_c(2, arrival_rate=1.0, service_rate=0.5) == 1.0
+    assert erlang_c_wait(2, arrival_rate=1.0, service_rate=0.5) == float('inf')
+
+
+def test_erlang_c_policy_sizes_to_target_with_hysteresis():
+    # offered load 3, wait of 4 devices: C(4, 3) / (4 * 0.5 - 1.5) = 0.509 / 0.5 = 1.02 minutes
+    assert calculate_devices("erlang_c", 1.5, 0.5, 0, 1, 10, 1, 0.2, 120) == 4
+    # more devices for a shorter target or a longer queue
+    assert calculate_devices("erlang_c", 1.5, 0.5, 0, 1, 10, 1, 0.2, 30) > 4
+    assert calculate_devices("erlang_c", 1.5, 0.5, 20, 1, 10, 1, 0.2, 120) > 4
+    # 5 devices meet the target, but are kept as 4 devices do not meet the target tightened by buffer
+    assert erlang_c_policy(0, 1.5, 0.5, 5, 10, 1, 0.2, 62) == 5
+    assert erlang_c_policy(0, 1.5, 0.5, 8, 10, 1, 0.2, 120) == 4
+    # capped at max devices
+    assert erlang_c_policy(100, 1.5, 0.5, 1, 6, 1, 0.2, 10) == 6
+
+
+def test_erlang_c_policy_large_fleet_is_cheap():
+    start = time.perf_counter()
+    for queue_length in range(1000):
+        erlang_c_policy(queue_length, 150.0, 0.5, 300, 800, 1, 0.2, 60)
+    assert time.perf_counter() - start < 1
+
+
+def test_devices_powering_on_count_towards_required():
+    # queue above offered load: energy_save adds one device, unless one is already powering on
+    assert calculate_devices("energy_save", 1.5, 0.5, 10, 2, 5, 1, 0.2, None) == 3
+    assert calculate_devices("energy_save", 1.5, 0.5, 10, 2, 5, 1, 0.2, None, in_flight=1) == 3
+    assert calculate_devices("energy_save", 1.5, 0.5, 10, 2, 5, 1, 0.2, None, in_flight=2) == 4
+    # min_wait: the wait is too long with the 4 serving devices, 7 devices meet the target
+    assert calculate_devices("min_wait", 1.5, 0.5, 4, 4, 10, 1, 0.2, 120) == 7
+    # the 3 devices powering on will meet the target, so no more devices are required
+    assert calculate_devices("min_wait", 1.5, 0.5, 4, 4, 10, 1, 0.2, 120, in_flight=3) == 7
+    assert calculate_devices("min_wait", 1.5, 0.5, 4, 4, 10, 1, 0.2, 120, in_flight=5) == 9
+    assert calculate_devices("erlang_c", 1.5, 0.5, 0, 2, 10, 1, 0.2, 120, in_flight=2) == 4
+
+
+def test_target_wait_required():
+    # energy_save has no target wait, the Erlang-C policies cannot decide without one
+    assert policy_config_error("energy_save", queue_policy["energy_save"]) is None
+    for policy in ["min_wait", "erlang_c", "predictive"]:
+        assert policy_config_error(policy, queue_policy[policy]) is None
+        assert "target_wait" in policy_config_error(policy, {**queue_policy[policy], "target_wait": None}) # type: ignore
+        assert policy_config_error(policy, {**queue_policy[policy], "target_wait": 0}) is not None
+
+
+def test_erlang_b_tables_are_bounded(monkeypatch):
+    monkeypatch.setattr(queue_management_utils, "erlang_b_tables", {})
+    monkeypatch.setattr(queue_management_utils, "erlang_b_max_tables", 8)
+    # live estimates give a slightly different arrival rate on every tick
+    for i in range(100):
+        assert erlang_c(30, arrival_rate=10 + i * 1e-7, service_rate=0.5) == pytest.approx(erlang_c(30, 10, 0.5), rel=1e-4)
+    # rates rounding to the same offered load share one table, the number of tables is bounded
+    assert list(queue_management_utils.erlang_b_tables) == [20.0]
+    for i in range(20):
+        erlang_c(100, arrival_rate=10 + i, service_rate=0.5)
+    assert len(queue_management_utils.erlang_b_tables) == 8
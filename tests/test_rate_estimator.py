@@ -0,0 +1,61 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+from rate_estimator import RateEstimator # noqa: E402
+
+
+def feed(estimator, arrival_rate, service_rate, active, seconds=3, start=1755590400.0, seed=0):
+    """Feed a queue that grows by Poisson arrivals and shrinks by Poisson departures of the active devices."""
+    rng = np.random.default_rng(seed)
+    queue_length = 200
+    for i, devices in enumerate(active):
+        estimator.update(queue_length, start + i * seconds, devices)
+        minutes = seconds / 60
+        queue_length = max(1, queue_length + rng.poisson(arrival_rate * minutes) - rng.poisson(service_rate * devices * minutes))
+
+
+def test_estimates_arrival_and_service_rate():
+    estimator = RateEstimator(halflife=7 * 86400)
+    active = np.repeat(np.tile([2, 3, 4, 5, 4, 3], 100), 10)
+    feed(estimator, arrival_rate=2.0, service_rate=0.5, active=active, seconds=30)
+    estimate = estimator.estimate()
+    assert estimate["samples"] == len(active) - 1
+    assert estimate["arrival_rate_low"] <= 2.0 <= estimate["arrival_rate_high"] # type: ignore
+    assert estimate["service_rate_low"] <= 0.5 <= estimate["service_rate_high"] # type: ignore
+    assert abs(estimate["service_rate"] - 0.5) < 0.1 # type: ignore
+
+
+def test_service_rate_unknown_while_active_devices_never_change():
+    estimator = RateEstimator(halflife=3600)
+    feed(estimator, arrival_rate=2.0, service_rate=0.5, active=[3] * 2000)
+    estimate = estimator.estimate()
+    assert estimate["service_rate"] is None and estimate["arrival_rate"] is None
+    # with the configured service rate, the arrival rate is still estimated
+    estimate = estimator.estimate(service_rate=0.5)
+    assert estimate["arrival_rate_low"] <= 2.0 <= estimate["arrival_rate_high"] # type: ignore
+
+
+def test_policy_opts_in_to_estimates():
+    estimator = RateEstimator(min_samples=10)
+    policy = {"arrival_rate": 1.5, "service_rate": 0.5, "min_devices": 1, "buffer": 0.2, "target_wait": 120, "use_estimates": True}
+    # not enough samples yet, and empty queue samples are not used
+    for i in range(20):
+        estimator.update(0, 1755590400.0 + i, 2)
+    assert estimator.apply(policy) == (1.5, 0.5)
+
+    feed(estimator, arrival_rate=4.0, service_rate=1.0, active=np.repeat([2, 3, 4, 5], 250), start=1755590500.0)
+    arrival_rate, service_rate = estimator.apply(policy)
+    assert arrival_rate != 1.5 and service_rate != 0.5
+    assert estimator.apply(dict(policy, use_estimates=False)) == (1.5, 0.5)
+
+
+def test_estimates_file_write_is_throttled(tmp_path):
+    path = os.path.join(tmp_path, "estimates.json")
+    estimator = RateEstimator(path=path, write_interval=60)
+    feed(estimator, arrival_rate=2.0, service_rate=0.5, active=[2] * 20)
+    # written on the first sample only, the next write is due in 60 seconds
+    assert RateEstimator(path=path).read()["samples"] == 1
+    estimator.write()
+    assert RateEstimator(path=path).read()["samples"] == 19
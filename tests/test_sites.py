@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+import dmt_utils # noqa: E402
+import queue_management_utils # noqa: E402
+from sites import load_sites, claimed_devices # noqa: E402
+from tests.mock_dmt_api import MockDMTServer # noqa: E402
+from tests.test_queue_length import Message # noqa: E402
+from tests.test_queue_engine import MemoryTailer, reset_dmt # noqa: E402
+
+
+def write_sites(tmp_path, sites) -> str:
+    path = os.path.join(tmp_path, "sites.json")
+    with open(path, "w") as f:
+        json.dump(sites, f)
+    return path
+
+
+def test_view_reads_and_notifies_own_lanes():
+    tailer = MemoryTailer()
+    view_a = tailer.view(["cam-a1", "cam-a2"])
+    view_b = tailer.view(["cam-b"])
+    received = []
+    view_a.add_listener(lambda value, timestamp: received.append(value))
+
+    async def run():
+        event_a, event_b = view_a.subscribe(), view_b.subscribe()
+        now = time.time()
+        tailer.update(Message(3, key=b"cam-a1", timestamp=now))
+        tailer.update(Message(4, key=b"cam-a2", timestamp=now))
+        await asyncio.sleep(0)
+        assert event_a.is_set() and not event_b.is_set()
+        tailer.update(Message(5, key=b"cam-b", timestamp=now))
+        await asyncio.sleep(0)
+        assert event_b.is_set()
+
+    asyncio.run(run())
+    assert received == [3, 7]
+    assert view_a.read()["message"] == "7"
+    assert view_b.read()["message"] == "5"
+    assert [*view_a.read_lanes()] == ["cam-a1", "cam-a2"]
+    # the tailer still combines all lanes
+    assert tailer.read()["message"] == "12"
+
+
+def test_load_sites(tmp_path):
+    path = write_sites(tmp_path, {
+        "store-1": {"lanes": ["cam-1"], "devices": ["Device 01"], "policy": "erlang_c", "config": {"erlang_c": {"target_wait": 60}}},
+        "store-2": {"lanes": ["cam-2"], "devices": ["Device 02"]},
+    })
+    sites = load_sites(path, MemoryTailer(), queue_management_utils.queue_policy)
+    assert [*sites] == ["store-1", "store-2"]
+    assert sites["store-1"].selected_policy == "erlang_c"
+    assert sites["store-1"].queue_policy["erlang_c"]["target_wait"] == 60
+    assert sites["store-2"].queue_policy["erlang_c"]["target_wait"] == queue_management_utils.queue_policy["erlang_c"]["target_wait"]
+    assert sites["store-2"].selected_policy == [*queue_management_utils.queue_policy][0]
+    assert load_sites(os.path.join(tmp_path, "missing.json"), MemoryTailer(), queue_management_utils.queue_policy) == {}
+
+    with pytest.raises(ValueError):
+        load_sites(write_sites(tmp_path, {"default": {}}), MemoryTailer(), queue_management_utils.queue_policy)
+    with pytest.raises(ValueError):
+        load_sites(write_sites(tmp_path, {"store-1": {"devices": ["Device 01"], "policy": "fastest"}}), MemoryTailer(), queue_management_utils.queue_policy)
+    # a device is managed by one site only
+    with pytest.raises(ValueError, match="Device 02"):
+        load_sites(write_sites(tmp_path, {"store-1": {"devices": ["Device 01", "Device 02"]}, "store-2": {"devices": ["Device 02"]}}), MemoryTailer(), queue_management_utils.queue_policy)
+    with pytest.raises(ValueError):
+        load_sites(write_sites(tmp_path, {"store-1": {"lanes": ["cam-1"]}}), MemoryTailer(), queue_management_utils.queue_policy)
+    with pytest.raises(ValueError, match="target_wait"):
+        load_sites(write_sites(tmp_path, {"store-1": {"devices": ["Device 01"], "config": {"erlang_c": {"target_wait": None}}}}), MemoryTailer(), queue_management_utils.queue_policy)
+    # site names are part of the history file name
+    for name in ["../store-1", "store 1", ".hidden", ""]:
+        with pytest.raises(ValueError, match="Invalid site name"):
+            load_sites(write_sites(tmp_path, {name: {"devices": ["Device 01"]}}), MemoryTailer(), queue_management_utils.queue_policy)
+    assert claimed_devices(sites) == ["Device 01", "Device 02"]
+
+
+def test_site_devices(monkeypatch):
+    monkeypatch.setattr(dmt_utils, "all_device", {dev_id: {"pwr_status": "off"} for dev_id in ["Device 01", "Device 02", "Device 03"]}, raising=False)
+    # the default site manages the devices no other site claims
+    assert [*queue_management_utils.get_site_devices(None, exclude_devices=["Device 02"])] == ["Device 01", "Device 03"] # type: ignore
+    assert [*queue_management_utils.get_site_devices(["Device 03"])] == ["Device 03"] # type: ignore
+    # a device of the pool missing from the inventory is an error, not silently left out
+    assert queue_management_utils.get_site_devices(["Device 03", "Device 09"]) == "Devices not found in the inventory: Device 09"
+
+
+def test_sites_run_concurrently_on_own_devices(tmp_path, monkeypatch):
+    tailer = MemoryTailer()
+    path = write_sites(tmp_path, {
+        "store-a": {"lanes": ["cam-a"], "devices": ["Device 01", "Device 02"], "policy": "energy_save"},
+        "store-b": {"lanes": ["cam-b"], "devices": ["Device 03", "Device 04"], "policy": "energy_save"},
+    })
+    sites = load_sites(path, tailer, queue_management_utils.queue_policy)
+    discoveries = []
+    get_all_device = dmt_utils.get_all_device
+
+    async def count_discovery():
+        discoveries.append(1)
+        await get_all_device()
+    monkeypatch.setattr(dmt_utils, "get_all_device", count_discovery)
+
+    async def run():
+        tailer.update(Message(40, key=b"cam-a", timestamp=time.time()))
+        tailer.update(Message(0, key=b"cam-b", timestamp=time.time()))
+        for site in sites.values():
+            site.engine.start(site.selected_policy, json.dumps(site.queue_policy))
+        await asyncio.sleep(0.5)
+        assert all(site.engine.is_running() for site in sites.values())
+        states = {dev_id: device["pwr_status"] for dev_id, device in dmt_utils.all_device.items()} # type: ignore
+        for site in sites.values():
+            site.engine.stop()
+        await dmt_utils.close_client()
+        return states
+
+    with MockDMTServer(device_count=4) as server:
+        reset_dmt(server.api_base)
+        states = asyncio.run(run())
+    # the long queue of store-a powers on a device of store-a only
+    assert states["Device 01"] == "on" and states["Device 02"] == "on"
+    assert states["Device 04"] == "off"
+    # the DMT inventory is discovered once for all sites
+    assert len(discoveries) == 1
@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+from tick_history import TickHistory, HEADER_SIZE # noqa: E402
+
+
+def test_append_and_query(tmp_path):
+    path = os.path.join(tmp_path, "history.bin")
+    with TickHistory(path, capacity=100) as history:
+        start = history.epoch + 10
+        for i in range(6):
+            # 3 ticks in each minute, powering on a device on the first tick of the second minute
+            history.append(start + i * 20, queue_length=i, active=2, in_flight=0, device_required=2 + i // 3,
+                           powered_on=1 if i == 3 else 0, powered_off=0, policy="energy_save" if i < 5 else "min_wait")
+        result = history.query(start, start + 180, resolution=60)
+
+    assert os.path.getsize(path) == HEADER_SIZE + 100 * 16
+    assert [bucket["ticks"] for bucket in result["buckets"]] == [3, 3]
+    first, second = result["buckets"]
+    assert first["timestamp"] == start and second["timestamp"] == start + 60
+    assert first["queue_length_mean"] == 1 and second["queue_length_max"] == 5
+    assert (first["device_required_max"], second["device_required_max"]) == (2, 3)
+    assert (first["powered_on"], second["powered_on"]) == (0, 1)
+    assert (first["policy"], second["policy"]) == ("energy_save", "min_wait")
+
+    # readers open the file read-only while the loop keeps writing
+    with TickHistory(path, readonly=True) as reader:
+        assert reader.written == 6
+        assert reader.query(start + 60, start + 120, resolution=60)["buckets"][0]["ticks"] == 3
+    with pytest.raises(FileNotFoundError):
+        TickHistory(os.path.join(tmp_path, "missing.bin"), readonly=True)
+
+
+def test_ring_overwrites_oldest(tmp_path):
+    with TickHistory(os.path.join(tmp_path, "history.bin"), capacity=10) as history:
+        start = history.epoch
+        for i in range(25):
+            history.append(start + i, queue_length=i, active=1, in_flight=0, device_required=1, powered_on=0, powered_off=0, policy="erlang_c")
+        result = history.query(start, start + 25, resolution=1)
+        assert history.written == 25
+    # only the last 10 ticks are kept, in time order across the wrap
+    assert [bucket["queue_length_max"] for bucket in result["buckets"]] == list(range(15, 25))
+
+
+def test_query_month_of_ticks(tmp_path):
+    capacity = 30 * 86400
+    with TickHistory(os.path.join(tmp_path, "history.bin"), capacity=capacity) as history:
+        # fill the file directly, a month of 1 Hz ticks
+        history.policy_index("min_wait")
+        history.records["time"] = np.arange(capacity) * 10
+        history.records["queue_length"] = np.arange(capacity) % 20
+        history.records["active"] = 3
+        history.mm[16:24] = capacity.to_bytes(8, "little")
+
+        started = time.perf_counter()
+        result = history.query(history.epoch, history.epoch + capacity, resolution=86400)
+        elapsed = time.perf_counter() - started
+    assert len(result["buckets"]) == 30
+    assert all(bucket["ticks"] == 86400 and bucket["queue_length_mean"] == 9.5 for bucket in result["buckets"])
+    assert elapsed < 5
+    # a month of ticks in megabytes
+    assert HEADER_SIZE + capacity * 16 < 50 * 1024 * 1024
@@ -0,0 +1,84 @@
+import os
+import sys
+import json
+import time
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+from tick_trace import TickTracer, FileSpanExporter, OpenTelemetrySpanExporter # noqa: E402
+
+
+def test_stage_timings_and_file_export(tmp_path):
+    spans_path = os.path.join(tmp_path, "qflow_trace.jsonl")
+    timings_path = os.path.join(tmp_path, "qflow_timings.json")
+    exporter = FileSpanExporter(spans_path)
+    tracer = TickTracer(exporters=[exporter], path=timings_path)
+    for tick in range(20):
+        trace = tracer.start(tick=tick)
+        with trace.span("queue_length") as attributes:
+            attributes["queue_length"] = 4
+        with trace.span("policy"):
+            # every tenth tick is slow
+            time.sleep(0.02 if tick % 10 == 9 else 0.001)
+        tracer.end(trace, strategy="energy_save")
+        tracer.end(trace)
+    exporter.close()
+
+    timings = tracer.timings()
+    assert timings["ticks"] == 20
+    assert list(timings["stages"]) == ["tick", "queue_length", "policy"]
+    policy = timings["stages"]["policy"]
+    assert policy["count"] == 20
+    assert policy["p50"] < 0.01 <= policy["p95"] <= policy["p99"] <= policy["max"] # type: ignore
+    # the loop in a subprocess writes the timings periodically for the server to read
+    assert not os.path.exists(timings_path)
+    tracer.write()
+    assert TickTracer(exporters=[], path=timings_path).read() == json.loads(json.dumps(timings))
+
+    with open(spans_path) as f:
+        spans = [json.loads(line) for line in f]
+    assert len(spans) == 60
+    queue_length, policy_span, tick = spans[:3]
+    assert tick["name"] == "tick" and tick["parent_span_id"] is None and tick["attributes"] == {"tick": 0, "strategy": "energy_save"}
+    assert queue_length["parent_span_id"] == tick["span_id"] and queue_length["trace_id"] == tick["trace_id"]
+    assert queue_length["attributes"] == {"queue_length": 4}
+    assert tick["start_time_unix_nano"] <= queue_length["start_time_unix_nano"] <= policy_span["end_time_unix_nano"] <= tick["end_time_unix_nano"]
+
+
+def test_failed_stage_marks_tick_as_error():
+    spans = []
+
+    class ListExporter:
+        def export(self, tick_spans):
+            spans.extend(tick_spans)
+
+    tracer = TickTracer(exporters=[ListExporter()])
+    trace = tracer.start(tick=1)
+    with pytest.raises(Exception):
+        with trace.span("queue_length"):
+            raise Exception("Failed to get queue length. Kafka consumer error: broker down")
+    tracer.end(trace)
+    assert [(span["name"], span["status"]) for span in spans] == [("queue_length", "error"), ("tick", "error")]
+    assert tracer.read()["last_tick"].keys() == {"queue_length", "tick"}
+
+
+def test_opentelemetry_export():
+    pytest.importorskip("opentelemetry.sdk")
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    memory = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(memory))
+    tracer = TickTracer(exporters=[OpenTelemetrySpanExporter(tracer_provider=provider)])
+    trace = tracer.start(tick=1)
+    with trace.span("power_action", action="on", devices=2):
+        pass
+    tracer.end(trace, strategy="min_wait")
+
+    exported = {span.name: span for span in memory.get_finished_spans()}
+    assert set(exported) == {"tick", "power_action"}
+    assert exported["power_action"].parent.span_id == exported["tick"].context.span_id # type: ignore
+    assert exported["power_action"].attributes["devices"] == 2 # type: ignore
+    assert exported["tick"].end_time - exported["tick"].start_time == trace.spans[-1]["end_time_unix_nano"] - trace.spans[-1]["start_time_unix_nano"] # type: ignore
@@ -0,0 +1,104 @@
+import time
+from types import SimpleNamespace
+from mcp.types import CallToolResult, TextContent
+from queueflow_device_manager.tool_cache import ToolResultCache
+from queueflow_device_manager.metrics import REGISTRY
+
+
+def call(cache, name, args, response, call_id="call-1"):
+    """Call a tool through the cache callbacks like the agent does. Return the result and whether the MCP server was called."""
+    tool, tool_context = SimpleNamespace(name=name), SimpleNamespace(function_call_id=call_id)
+    result = cache.before_tool_callback(tool=tool, args=args, tool_context=tool_context)
+    called = result is None
+    if called:
+        result = response
+    cache.after_tool_callback(tool=tool, args=args, tool_context=tool_context, tool_response=result)
+    return result, called
+
+def text(value):
+    return CallToolResult(content=[TextContent(type="text", text=value)])
+
+
+def test_read_only_tools_are_cached():
+    cache = ToolResultCache()
+    devices = text('{"dev-1": {"pwr_status": "off"}}')
+    assert call(cache, "get_devices", {}, devices) == (devices, True)
+    # served from the cache, whatever the server would return now
+    assert call(cache, "get_devices", {}, text("changed")) == (devices, False)
+    # other arguments are other entries
+    assert call(cache, "get_devices", {"dev_ids": ["dev-1"]}, devices)[1]
+    # tools not read-only are never cached
+    assert call(cache, "get_queue_length", {}, text("3"))[1]
+    assert call(cache, "get_queue_length", {}, text("3"))[1]
+    # errors are not cached
+    assert call(cache, "get_policy_config", {}, CallToolResult(content=[], isError=True))[1]
+    assert call(cache, "get_policy_config", {}, text("{}"))[1]
+    assert cache.stats() == {"hits": 1, "misses": 4, "hit_ratio": 0.2, "entries": 3}
+
+    # hit and miss counters are served at /metrics of the agent API
+    metrics = REGISTRY.render()
+    assert 'agent_tool_cache_requests_total{tool="get_devices",result="hit"}' in metrics
+    assert 'agent_tool_cache_requests_total{tool="get_policy_config",result="miss"}' in metrics
+    assert "# TYPE agent_tool_cache_entries gauge" in metrics
+
+
+def test_ttl_and_lru():
+    cache = ToolResultCache(ttls={"get_devices": 0.05, "get_queue_policy": 60}, max_size=2)
+    call(cache, "get_devices", {}, text("a"))
+    time.sleep(0.1)
+    assert call(cache, "get_devices", {}, text("b"))[1]
+
+    call(cache, "get_queue_policy", {}, text("policies"))
+    # get_devices is the least recently used, evicted by the third entry
+    call(cache, "get_queue_policy", {"x": 1}, text("other"))
+    assert len(cache.entries) == 2
+    assert not call(cache, "get_queue_policy", {}, text("policies"))[1]
+    assert call(cache, "get_devices", {}, text("b"))[1]
+
+
+def test_mutating_tools_invalidate():
+    cache = ToolResultCache()
+    call(cache, "get_current_queue_policy", {}, text("energy_save"))
+    call(cache, "get_current_queue_policy", {"site": "store-2"}, text("min_wait"))
+    call(cache, "get_devices", {}, text("devices"))
+
+    # only the current policy of the site selected is dropped
+    call(cache, "select_queue_policy", {"policy": "min_wait"}, text("ok"))
+    assert call(cache, "get_current_queue_policy", {"site": "default"}, text("min_wait"))[1]
+    assert not call(cache, "get_current_queue_policy", {"site": "store-2"}, text("min_wait"))[1]
+    assert not call(cache, "get_devices", {}, text("devices"))[1]
+
+    call(cache, "power_on_devices", {"dev_ids": ["dev-1"]}, text("ok"))
+    assert call(cache, "get_devices", {}, text("devices"))[1]
+
+    # a result read while a mutating call is in flight is not cached
+    tool, tool_context = SimpleNamespace(name="get_devices"), SimpleNamespace(function_call_id="read")
+    call(cache, "power_off_devices", {}, text("ok"))
+    assert cache.before_tool_callback(tool=tool, args={}, tool_context=tool_context) is None
+    cache.before_tool_callback(tool=SimpleNamespace(name="power_off_devices"), args={}, tool_context=SimpleNamespace(function_call_id="write"))
+    cache.after_tool_callback(tool=tool, args={}, tool_context=tool_context, tool_response=text("stale"))
+    assert call(cache, "get_devices", {}, text("fresh"))[1]
+
+
+def test_max_age_caps_the_ttl():
+    cache = ToolResultCache(ttls={"get_devices": 60})
+    # max_age of 0 always reads the devices
+    call(cache, "get_devices", {"max_age": 0}, text("a"))
+    assert call(cache, "get_devices", {"max_age": 0}, text("b"))[1]
+    # otherwise the result is reused no longer than max_age
+    call(cache, "get_devices", {"max_age": 0.05}, text("a"))
+    assert not call(cache, "get_devices", {"max_age": 0.05}, text("b"))[1]
+    time.sleep(0.1)
+    assert call(cache, "get_devices", {"max_age": 0.05}, text("b"))[1]
+    assert not cache.pending
+
+
+def test_pending_calls_are_bounded():
+    cache = ToolResultCache(max_size=2)
+    tool = SimpleNamespace(name="get_devices")
+    # calls that raised never reach after_tool_callback
+    for i in range(5):
+        cache.before_tool_callback(tool=tool, args={}, tool_context=SimpleNamespace(function_call_id=f"call-{i}"))
+    assert list(cache.pending) == ["call-3", "call-4"]
+    call(cache, "power_on_devices", {}, text("ok"))
+    assert not cache.pending
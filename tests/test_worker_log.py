@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "queue_flow_mgmt"))
+from worker_log import RotatingLog, tail_lines, write_status, read_status # noqa: E402
+
+
+def test_rotate_on_size(tmp_path):
+    path = os.path.join(tmp_path, "qflow.log")
+    log = RotatingLog(path, max_bytes=100, max_age=0, backups=2)
+    for i in range(30):
+        print(f"Queue Length: {i}", file=log, flush=True)
+    log.close()
+    # the current log and 2 backups, each at most 100 bytes and one line
+    assert sorted(os.listdir(tmp_path)) == ["qflow.log", "qflow.log.1", "qflow.log.2"]
+    assert all(os.path.getsize(os.path.join(tmp_path, name)) <= 100 + 17 for name in os.listdir(tmp_path))
+    assert tail_lines(path, 1) == ["Queue Length: 29"]
+    # no line is lost or split across files
+    with open(f"{path}.1") as backup, open(path) as current:
+        last, first = backup.read().splitlines()[-1], current.read().splitlines()[0]
+    assert int(last.split(": ")[1]) + 1 == int(first.split(": ")[1])
+
+
+def test_rotate_on_age(tmp_path):
+    path = os.path.join(tmp_path, "qflow.log")
+    log = RotatingLog(path, max_bytes=1024 * 1024, max_age=60, backups=1)
+    log.write("Start Queue management process\n")
+    log.opened_at = time.time() - 61
+    log.write("Queue Length: 3\n")
+    log.close()
+    assert tail_lines(path, 5) == ["Queue Length: 3"]
+    assert tail_lines(f"{path}.1", 5) == ["Start Queue management process"]
+
+
+def test_tail_lines(tmp_path):
+    path = os.path.join(tmp_path, "qflow.log")
+    with open(path, "w") as f:
+        for i in range(100000):
+            f.write(f"Queue Length: {i}\n")
+        f.write("Exception: Failed to get queue length. Kafka consumer error: broker down\n")
+    assert tail_lines(path, 1) == ["Exception: Failed to get queue length. Kafka consumer error: broker down"]
+    assert tail_lines(path, 3, block_size=16) == ["Queue Length: 99998", "Queue Length: 99999", "Exception: Failed to get queue length. Kafka consumer error: broker down"]
+    open(path, "w").close()
+    assert tail_lines(path, 1) == []
+
+
+def test_status_record(tmp_path):
+    path = os.path.join(tmp_path, "qflow_status.json")
+    assert read_status(path) is None
+    write_status(path, "running")
+    assert read_status(path)["state"] == "running" # type: ignore
+    write_status(path, "error", "Exception: Failed to get available device.")
+    status = read_status(path)
+    assert status["state"] == "error" and status["message"] == "Exception: Failed to get available device." # type: ignore
+    assert status["pid"] == os.getpid() # type: ignore